@@ -0,0 +1,206 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Iterator, NamedTuple
+
+import rule_syntax
+from data_parsing_script import SID_PATH, parse_sid, parse_sound_change
+from synthetic_sid import write_synthetic_sid
+
+BASELINE_PATH = './data/benchmark_baseline.json'
+
+# how much slower than the baseline a benchmark can get before it counts as a regression
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_SCALES = [1, 10, 100]
+# worst case sections (of rules full of optionals and brackets) to add to each synthetic SID, per copy of the real one
+WORST_CASES_PER_SCALE = 5
+
+SAMPLE_RULES = [
+    'dz ʃ tʃ → ʒ s<sub>1</sub> s<sub>2</sub>',
+    'dʒ → tʃ → ʃ / _#',
+    'a(ː) → e(ː) / _{ʕ,q}$',
+    'ew (→ øj) → yj',
+    '{e,i}w{e,i} → {e,i}',
+    'V[- high] → ∅ / #(C)(C)_(C)(C)#',
+]
+SAMPLE_SOUNDS = ['{e,i}w{e,i}', '{e,w{æ,i}}', '{a,o', 'oː,uː}', '#(C)_{i,j}', 'ts{a,{e,i}}{#,C}']
+SAMPLE_CHANGES = [('aː', 'o', '_{w,v}'), ('ə', 'a', 'kʼ_'), ('a', 'i', '#C_'), ('aː', 'oː', '#(C)(C)(C)_(C)(C)(C)')]
+
+class Benchmark(NamedTuple):
+    """Something to time. setup runs untimed before every repeat, and run is timed number times."""
+    name: str
+    run: Callable[[], Any]
+    number: int = 1
+    setup: Callable[[], Any] | None = None
+
+class Result(NamedTuple):
+    seconds: float | None # best time per run, None if it was skipped
+    note: str = ''
+
+def time_benchmark(benchmark: Benchmark, repeat: int) -> Result:
+    """The best time per run out of several repeats, which is the least affected by whatever else the machine is doing."""
+    best = float('inf')
+    for _ in range(repeat):
+        if benchmark.setup:
+            benchmark.setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for _ in range(benchmark.number):
+                benchmark.run()
+            elapsed = time.perf_counter() - start
+        best = min(best, elapsed / benchmark.number)
+    return Result(best)
+
+def clear_parse_caches() -> None:
+    for cached in (rule_syntax.handle_brackets, rule_syntax.parse_rule, rule_syntax.parse_steps, rule_syntax.parse_environment):
+        cached.cache_clear()
+
+@contextlib.contextmanager
+def scratch_directory() -> Iterator[str]:
+    """Run somewhere with its own data directory, so end-to-end benchmarks don't overwrite the real output."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.makedirs(os.path.join(scratch, 'data'))
+        os.chdir(scratch)
+        try:
+            yield scratch
+        finally:
+            os.chdir(cwd)
+
+def extraction_available() -> bool:
+    """Whether vowel changes can be extracted here, i.e. gruut and (my fork of) ipapy are installed and import."""
+    try:
+        import gruut_ipa.phonemes
+        import ipapy.ipastring
+        from vowel_changes import get_u_to_ipa_ext
+        get_u_to_ipa_ext()
+    except (ImportError, ValueError):
+        return False
+    return True
+
+def micro_benchmarks() -> list[Benchmark]:
+    benchmarks = [
+        Benchmark('parse_sound_change', lambda: [parse_sound_change(rule, 'rule', None, rule) for rule in SAMPLE_RULES], 20, clear_parse_caches),
+        Benchmark('parse_sound_change (cached)', lambda: [parse_sound_change(rule, 'rule', None, rule) for rule in SAMPLE_RULES], 200),
+        Benchmark('handle_brackets', lambda: [rule_syntax.handle_brackets.__wrapped__(sound) for sound in SAMPLE_SOUNDS], 2000),
+    ]
+    if not extraction_available():
+        return benchmarks
+    import vowel_changes
+
+    def setup_extract():
+        vowel_changes.clear_ipa_caches()
+        rule_syntax.parse_environment.cache_clear()
+
+    benchmarks.append(Benchmark('extract_vowel_changes', lambda: [vowel_changes.extract_vowel_changes(*change, '', '6.1') for change in SAMPLE_CHANGES], 20, setup_extract))
+    return benchmarks
+
+def run_benchmarks(scales: list[int], repeat: int = 5, sid_path: str = SID_PATH) -> dict[str, Result]:
+    """Run the micro-benchmarks, then parse (and extract from) SID-shaped documents at each scale."""
+    results = { benchmark.name: time_benchmark(benchmark, repeat) for benchmark in micro_benchmarks() }
+    sid_path = os.path.abspath(sid_path)
+
+    run_extraction = None
+    if extraction_available():
+        from vowel_changes import run_extraction
+    else:
+        print('Warning: vowel_changes could not be imported (are gruut and the ipapy fork installed?), skipping the extraction benchmarks', file=sys.stderr)
+        results['extract_vowel_changes'] = Result(None, 'vowel_changes could not be imported')
+
+    for scale in scales:
+        with scratch_directory() as scratch:
+            path = os.path.join(scratch, f'sid-{scale}x.html')
+            write_synthetic_sid(path, scale, WORST_CASES_PER_SCALE * scale, sid_path)
+            # the bigger documents take minutes, so only time them once
+            end_to_end_repeat = max(1, repeat // scale)
+
+            results[f'parse_sid {scale}x'] = time_benchmark(Benchmark('parse_sid', lambda: parse_sid(path), setup=clear_parse_caches), end_to_end_repeat)
+            if run_extraction:
+                results[f'run_extraction {scale}x'] = time_benchmark(Benchmark('run_extraction', run_extraction), end_to_end_repeat)
+            else:
+                results[f'run_extraction {scale}x'] = Result(None, 'vowel_changes could not be imported')
+
+    return results
+
+def results_to_json(results: dict[str, Result]) -> dict[str, Any]:
+    return {
+        'python': sys.version.split()[0],
+        'results': { name: result._asdict() for (name, result) in results.items() },
+    }
+
+def missing_results(results: dict[str, Any], baseline: dict[str, Any]) -> list[str]:
+    """Describe every benchmark the baseline has a time for that was skipped or not run this time."""
+    missing = []
+    for (name, baseline_result) in baseline['results'].items():
+        if baseline_result['seconds'] is None:
+            continue
+        result = results['results'].get(name)
+        if not result:
+            missing.append(f'{name}: in the baseline but not run')
+        elif result['seconds'] is None:
+            missing.append(f'{name}: in the baseline but skipped ({result["note"]})')
+    return missing
+
+def compare_results(results: dict[str, Any], baseline: dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    """Describe every benchmark more than tolerance slower than its baseline, or that the baseline has but this run doesn't."""
+    regressions = missing_results(results, baseline)
+    for (name, result) in results['results'].items():
+        baseline_result = baseline['results'].get(name)
+        if not baseline_result or baseline_result['seconds'] is None or result['seconds'] is None:
+            continue
+        ratio = result['seconds'] / baseline_result['seconds']
+        if ratio > 1 + tolerance:
+            regressions.append(f'{name}: {result["seconds"]:.6f}s vs {baseline_result["seconds"]:.6f}s baseline ({ratio:.2f}x)')
+    return regressions
+
+def print_results(results: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    for (name, result) in results['results'].items():
+        if result['seconds'] is None:
+            print(f'{name:36} skipped: {result["note"]}')
+            continue
+        line = f'{name:36} {result["seconds"]:12.6f}s'
+        baseline_result = baseline['results'].get(name) if baseline else None
+        if baseline_result and baseline_result['seconds']:
+            line += f'  ({result["seconds"] / baseline_result["seconds"]:.2f}x baseline)'
+        print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the parser and extractor, failing if anything got slower than the baseline.')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help='sizes of synthetic SID to parse, as multiples of the real one')
+    parser.add_argument('--repeat', type=int, default=5, help='how many times to repeat each benchmark (the best time counts)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='save these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='fraction slower than the baseline that counts as a regression')
+    parser.add_argument('--output', help='also write the results as JSON here')
+    args = parser.parse_args()
+
+    results = results_to_json(run_benchmarks(args.scales, args.repeat))
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w+') as output_file:
+            json.dump(results, output_file, indent=4)
+
+    if args.save_baseline:
+        for missing in missing_results(results, baseline) if baseline else []:
+            print(f'Warning: the new baseline drops {missing}', file=sys.stderr)
+        with open(args.baseline, 'w+') as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+        print(f'Saved baseline to {args.baseline}')
+    elif baseline:
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}, or were skipped:', file=sys.stderr)
+            for regression in regressions:
+                print(f'  {regression}', file=sys.stderr)
+            sys.exit(1)
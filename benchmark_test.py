@@ -0,0 +1,22 @@
+import benchmark
+
+def results(**seconds) -> dict:
+  return { 'results': { name: { 'seconds': value, 'note': '' } for (name, value) in seconds.items() } }
+
+def test_compare_results():
+  baseline = results(parse=1.0, brackets=0.001, extract=None)
+  assert benchmark.compare_results(results(parse=1.2, brackets=0.0005, extract=2.0), baseline) == []
+  regressions = benchmark.compare_results(results(parse=1.5, brackets=0.001, new=1.0), baseline)
+  assert len(regressions) == 1
+  assert regressions[0].startswith('parse: ')
+
+def test_compare_results_missing():
+  baseline = results(parse=1.0, extract=2.0, scale=3.0)
+  current = results(parse=1.0, extract=None)
+  assert benchmark.compare_results(current, baseline) == ['extract: in the baseline but skipped ()', 'scale: in the baseline but not run']
+
+def test_time_benchmark():
+  calls = []
+  result = benchmark.time_benchmark(benchmark.Benchmark('append', lambda: calls.append(1), number=3, setup=calls.clear), repeat=2)
+  assert result.seconds >= 0
+  assert len(calls) == 3
@@ -0,0 +1,225 @@
+import mmap
+import struct
+from typing import Iterator
+
+from data_parsing_script import Branch, Rule
+
+BINARY_STORE_PATH = './data/rules.bin'
+
+MAGIC = b'SIDRULES'
+VERSION = 1
+
+# tables, in the order they're written
+(STRING_OFFSETS, STRING_DATA, STEPS, RULES, BRANCHES, RULE_ORDER, RULE_INDEX, BRANCH_ORDER, BRANCH_INDEX) = range(9)
+TABLE_COUNT = 9
+
+# magic, version, then the length and offset of each table
+HEADER = struct.Struct(f'<8sI4x{2 * TABLE_COUNT}Q')
+# string ids of id, branch_id, branch_index, original_text, environment, from_sound, to_sound,
+# then where its intermediate steps start and how many there are
+RULE_RECORD = struct.Struct('<9I')
+# string ids of id, index, name, source, then where its rules start and how many there are
+BRANCH_RECORD = struct.Struct('<6I')
+# string id of an id, then where its records start in the id-sorted order and how many there are
+INDEX_ENTRY = struct.Struct('<3I')
+UINT_PAIR = struct.Struct('<2I')
+
+RULE_FIELDS = ('id', 'branch_id', 'branch_index', 'original_text', 'environment', 'from_sound', 'to_sound')
+BRANCH_FIELDS = ('id', 'index', 'name', 'source')
+
+# string ids standing for a field that's None, or that was never set
+NONE = 0xFFFFFFFF
+UNSET = 0xFFFFFFFE
+
+class StringTable:
+    """Gives each distinct string an id, in the order they're first added."""
+
+    def __init__(self) -> None:
+        self.ids: dict[str, int] = {}
+
+    def add(self, value: str | None) -> int:
+        if value is None:
+            return NONE
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.ids)
+        return string_id
+
+    def field(self, record: Rule | Branch, name: str) -> int:
+        return self.add(getattr(record, name)) if hasattr(record, name) else UNSET
+
+def build_index(ids: list[int], encoded: list[bytes]) -> tuple[list[int], list[tuple[int, int, int]]]:
+    """Sort records by id, as UTF-8 (which sorts the same as the strings do), for binary search.
+
+    Returns the record numbers in id order, and an (id, start, count) entry for each distinct id.
+    """
+    order = sorted(range(len(ids)), key=lambda record: encoded[ids[record]])
+    entries: list[tuple[int, int, int]] = []
+    for (position, record) in enumerate(order):
+        if entries and entries[-1][0] == ids[record]:
+            (string_id, start, count) = entries[-1]
+            entries[-1] = (string_id, start, count + 1)
+        else:
+            entries.append((ids[record], position, 1))
+    return (order, entries)
+
+def pack_uints(values: list[int]) -> bytes:
+    return struct.pack(f'<{len(values)}I', *values)
+
+def write_binary_store(branches: list[Branch], rules: list[Rule], path: str = BINARY_STORE_PATH) -> None:
+    """Write branches and rules as fixed-width records, with a string table and id indices, for BinaryStore to read."""
+    strings = StringTable()
+    steps: list[int] = []
+    rule_records = []
+    for rule in rules:
+        intermediate_steps = getattr(rule, 'intermediate_steps', ())
+        rule_records.append(RULE_RECORD.pack(*(strings.field(rule, name) for name in RULE_FIELDS), len(steps), len(intermediate_steps)))
+        steps += [strings.add(step) for step in intermediate_steps]
+
+    # rules are in document order, so each branch's rules are next to each other
+    branch_rules: dict[str | None, list[int]] = {}
+    for (position, rule) in enumerate(rules):
+        branch_rules.setdefault(getattr(rule, 'branch_id', None), []).append(position)
+    branch_records = []
+    for branch in branches:
+        positions = branch_rules.get(branch.id, [0])
+        branch_records.append(BRANCH_RECORD.pack(*(strings.field(branch, name) for name in BRANCH_FIELDS), positions[0], len(branch_rules.get(branch.id, []))))
+
+    encoded = [string.encode() for string in strings.ids]
+    string_offsets = [0]
+    for string in encoded:
+        string_offsets.append(string_offsets[-1] + len(string))
+    (rule_order, rule_index) = build_index([strings.ids[rule.id] for rule in rules], encoded)
+    (branch_order, branch_index) = build_index([strings.ids[branch.id] for branch in branches], encoded)
+
+    tables = [
+        pack_uints(string_offsets),
+        b''.join(encoded),
+        pack_uints(steps),
+        b''.join(rule_records),
+        b''.join(branch_records),
+        pack_uints(rule_order),
+        b''.join(INDEX_ENTRY.pack(*entry) for entry in rule_index),
+        pack_uints(branch_order),
+        b''.join(INDEX_ENTRY.pack(*entry) for entry in branch_index),
+    ]
+    locations = []
+    position = HEADER.size
+    for table in tables:
+        # keep every table 4 byte aligned
+        position += -position % 4
+        locations += [len(table), position]
+        position += len(table)
+
+    with open(path, 'wb+') as store_file:
+        store_file.write(HEADER.pack(MAGIC, VERSION, *locations))
+        for (table, offset) in zip(tables, locations[1::2]):
+            store_file.write(b'\0' * (offset - store_file.tell()))
+            store_file.write(table)
+
+class BinaryStore:
+    """Rules and branches read straight from a memory-mapped file written by write_binary_store.
+
+    Opening only reads the header, and each lookup decodes just the records it returns, so any number of
+    processes can share one copy of the file through the page cache.
+    """
+
+    def __init__(self, path: str = BINARY_STORE_PATH) -> None:
+        with open(path, 'rb') as store_file:
+            self.buffer = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, *locations) = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            self.buffer.close()
+            raise ValueError(f'{path} is not a version {VERSION} rule store')
+        self.lengths = locations[0::2]
+        self.offsets = locations[1::2]
+        # the same few thousand sounds and environments come up in most rules, so only decode each once
+        self.strings: dict[int, str | None] = { NONE: None }
+
+    def close(self) -> None:
+        self.buffer.close()
+
+    def __enter__(self) -> 'BinaryStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.lengths[RULES] // RULE_RECORD.size
+
+    def branch_count(self) -> int:
+        return self.lengths[BRANCHES] // BRANCH_RECORD.size
+
+    def string_bytes(self, string_id: int) -> bytes:
+        (start, end) = UINT_PAIR.unpack_from(self.buffer, self.offsets[STRING_OFFSETS] + 4 * string_id)
+        data = self.offsets[STRING_DATA]
+        return self.buffer[data + start:data + end]
+
+    def string(self, string_id: int) -> str | None:
+        string = self.strings.get(string_id)
+        if string is None and string_id != NONE:
+            string = self.strings[string_id] = self.string_bytes(string_id).decode()
+        return string
+
+    def rule_at(self, position: int) -> Rule:
+        """The rule at a position in document order."""
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        (*string_ids, steps_start, steps_count) = RULE_RECORD.unpack_from(self.buffer, self.offsets[RULES] + RULE_RECORD.size * position)
+        rule = Rule()
+        for (name, string_id) in zip(RULE_FIELDS, string_ids):
+            if string_id != UNSET:
+                setattr(rule, name, self.string(string_id))
+        steps = struct.unpack_from(f'<{steps_count}I', self.buffer, self.offsets[STEPS] + 4 * steps_start)
+        rule.intermediate_steps = tuple(self.string(step) for step in steps)
+        return rule
+
+    def branch_at(self, position: int) -> Branch:
+        """The branch at a position in document order."""
+        if not 0 <= position < self.branch_count():
+            raise IndexError(position)
+        branch = Branch()
+        (*string_ids, _, _) = BRANCH_RECORD.unpack_from(self.buffer, self.offsets[BRANCHES] + BRANCH_RECORD.size * position)
+        for (name, string_id) in zip(BRANCH_FIELDS, string_ids):
+            if string_id != UNSET:
+                setattr(branch, name, self.string(string_id))
+        return branch
+
+    def find(self, index: int, order: int, key: str) -> list[int]:
+        """Binary search an id index for the positions of the records with an id, in document order."""
+        target = key.encode()
+        (low, high) = (0, self.lengths[index] // INDEX_ENTRY.size)
+        while low < high:
+            middle = (low + high) // 2
+            (string_id, start, count) = INDEX_ENTRY.unpack_from(self.buffer, self.offsets[index] + INDEX_ENTRY.size * middle)
+            found = self.string_bytes(string_id)
+            if found == target:
+                return list(struct.unpack_from(f'<{count}I', self.buffer, self.offsets[order] + 4 * start))
+            if found < target:
+                low = middle + 1
+            else:
+                high = middle
+        return []
+
+    def rules(self, rule_id: str) -> list[Rule]:
+        """The rules with an id, one for each expansion of the sound change, e.g. 'Proto-Omotic-dʒ'."""
+        return [self.rule_at(position) for position in self.find(RULE_INDEX, RULE_ORDER, rule_id)]
+
+    def branch(self, branch_id: str) -> Branch | None:
+        positions = self.find(BRANCH_INDEX, BRANCH_ORDER, branch_id)
+        return self.branch_at(positions[0]) if positions else None
+
+    def branch_rules(self, branch_id: str) -> list[Rule]:
+        """A branch's rules, in document order."""
+        positions = self.find(BRANCH_INDEX, BRANCH_ORDER, branch_id)
+        if not positions:
+            return []
+        (*_, start, count) = BRANCH_RECORD.unpack_from(self.buffer, self.offsets[BRANCHES] + BRANCH_RECORD.size * positions[0])
+        return [self.rule_at(position) for position in range(start, start + count)]
+
+    def iter_rules(self) -> Iterator[Rule]:
+        return (self.rule_at(position) for position in range(len(self)))
+
+    def iter_branches(self) -> Iterator[Branch]:
+        return (self.branch_at(position) for position in range(self.branch_count()))
@@ -0,0 +1,50 @@
+import pytest
+import data_parsing_script as dps
+from binary_store import BinaryStore, write_binary_store
+
+def parsed_branches():
+  omotic = dps.Branch.from_dict({ 'id': 'Proto-Omotic', 'index': '6.1', 'name': 'Proto-Omotic to Proto-Afro-Asiatic', 'source': 'Ehret' })
+  unsourced = dps.Branch.from_dict({ 'id': 'Greenlandic', 'index': '15.2', 'name': 'Greenlandic' })
+  rules = dps.parse_sound_change('dʒ → tʃ → ʃ / _#', 'Proto-Omotic-dʒ', omotic, 'dʒ → tʃ → ʃ / _#')
+  rules += dps.parse_sound_change('{e,i} → a', 'Proto-Omotic-e', omotic, '{e,i} → a')
+  rules += dps.parse_sound_change('m n → p t / _#', 'Greenlandic-m-n', unsourced, 'm n → p t / _#')
+  return ([omotic, unsourced], rules)
+
+def test_round_trip(tmp_path):
+  (branches, rules) = parsed_branches()
+  path = str(tmp_path / 'rules.bin')
+  write_binary_store(branches, rules, path)
+  with BinaryStore(path) as store:
+    assert len(store) == len(rules)
+    assert [rule.to_dict() for rule in store.iter_rules()] == [rule.to_dict() for rule in rules]
+    assert [branch.to_dict() for branch in store.iter_branches()] == [branch.to_dict() for branch in branches]
+    assert store.rule_at(0).intermediate_steps == ('tʃ',)
+    assert not hasattr(store.branch_at(1), 'source')
+
+def test_lookups(tmp_path):
+  (branches, rules) = parsed_branches()
+  path = str(tmp_path / 'rules.bin')
+  write_binary_store(branches, rules, path)
+  with BinaryStore(path) as store:
+    assert sorted(rule.from_sound for rule in store.rules('Proto-Omotic-e')) == ['e', 'i']
+    assert [rule.to_sound for rule in store.rules('Greenlandic-m-n')] == ['p', 't']
+    assert store.rules('Proto-Omotic-x') == []
+    assert store.branch('Greenlandic').index == '15.2'
+    assert store.branch('Proto') is None
+    assert [rule.id for rule in store.branch_rules('Proto-Omotic')] == ['Proto-Omotic-dʒ', 'Proto-Omotic-e', 'Proto-Omotic-e']
+    with pytest.raises(IndexError):
+      store.rule_at(len(rules))
+
+def test_rules_without_branch(tmp_path):
+  rules = dps.parse_sound_change('a → b', 'rule', None, 'a → b')
+  path = str(tmp_path / 'rules.bin')
+  write_binary_store([], rules, path)
+  with BinaryStore(path) as store:
+    assert store.rules('rule')[0].branch_id is None
+    assert store.branch_count() == 0
+
+def test_rejects_other_files(tmp_path):
+  path = tmp_path / 'rules.bin'
+  path.write_bytes(b'not a rule store' * 10)
+  with pytest.raises(ValueError):
+    BinaryStore(str(path))
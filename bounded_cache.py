@@ -0,0 +1,58 @@
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+Key = TypeVar('Key', bound=Hashable)
+Value = TypeVar('Value')
+
+class BoundedCache(Generic[Key, Value]):
+    """A least-recently-used cache with a size limit, which counts its hits, misses and evictions."""
+    maxsize: int | None
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, maxsize: int | None = 4096) -> None:
+        self.maxsize = maxsize
+        self.entries: OrderedDict[Key, Value] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key: Key, compute: Callable[[], Value]) -> Value:
+        """Get the value for key, computing and storing it if it isn't cached."""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+        self.misses += 1
+        value = compute()
+        self.entries[key] = value
+        if self.maxsize is not None and len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def clear(self) -> None:
+        """Empty the cache and reset its counters."""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> dict[str, int | None]:
+        """Get the cache's counters, along with its current and maximum size."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,24 @@
+from bounded_cache import BoundedCache
+
+def test_lookup_counts():
+  cache: BoundedCache[str, int] = BoundedCache(2)
+  assert cache.lookup('a', lambda: 1) == 1
+  assert cache.lookup('a', lambda: 2) == 1
+  assert cache.stats() == { 'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1, 'maxsize': 2 }
+
+def test_evicts_least_recently_used():
+  cache: BoundedCache[str, int] = BoundedCache(2)
+  cache.lookup('a', lambda: 1)
+  cache.lookup('b', lambda: 2)
+  cache.lookup('a', lambda: 1)
+  cache.lookup('c', lambda: 3)
+  assert cache.evictions == 1
+  assert cache.lookup('a', lambda: 0) == 1
+  assert cache.lookup('b', lambda: 0) == 0
+
+def test_clear():
+  cache: BoundedCache[str, int] = BoundedCache()
+  cache.lookup('a', lambda: 1)
+  cache.clear()
+  assert len(cache) == 0
+  assert cache.stats()['misses'] == 0
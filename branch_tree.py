@@ -0,0 +1,145 @@
+import functools
+import numpy as np
+import pandas as pd
+from typing import Iterable
+
+from rule_store import BRANCHES_PARQUET_PATH, read_branches
+
+# how many distinct branch indices to remember the parents of
+PARENT_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=PARENT_CACHE_SIZE)
+def parent_index(branch_index: str) -> str:
+    """The index of a branch's parent, e.g. 6.5.4 -> 6.5. Top-level branches have the root, ''."""
+    return branch_index.rpartition('.')[0]
+
+def index_sort_key(branch_index: str) -> tuple:
+    """Sort branch indices numerically part by part, so 6.2 comes before 6.10."""
+    return tuple(int(part) if part.isdigit() else part for part in branch_index.split('.')) if branch_index else ()
+
+class BranchTree:
+    """The branch hierarchy implied by the dotted indices, numbered in preorder.
+
+    Every branch's subtree is the range of preorder positions [position, end), so ancestor checks are two comparisons,
+    and a table sorted by position has each subtree in one contiguous slice. Parents missing from the SID (e.g. '10'
+    when only '10.1' has rules) are added so the tree is connected, all under the root ''.
+    """
+    indices: list[str] # branch indices in preorder, starting with the root ''
+    positions: dict[str, int]
+    ends: np.ndarray # the (exclusive) end of each position's subtree
+    parents: np.ndarray # the position of each position's parent, -1 for the root
+    depths: np.ndarray
+    ids: dict[str, str] # branch index -> branch id, for branches that are in the SID
+
+    def __init__(self, branch_indices: Iterable[str], ids: dict[str, str] | None = None) -> None:
+        nodes = {''}
+        for branch_index in branch_indices:
+            while branch_index not in nodes:
+                nodes.add(branch_index)
+                branch_index = parent_index(branch_index)
+
+        # sorting by the parts of the index puts every branch straight after its parent and before its parent's later children
+        self.indices = sorted(nodes, key=index_sort_key)
+        self.positions = { branch_index: position for (position, branch_index) in enumerate(self.indices) }
+        self.ids = ids or {}
+
+        count = len(self.indices)
+        self.parents = np.full(count, -1, dtype=np.int64)
+        self.depths = np.zeros(count, dtype=np.int64)
+        for (position, branch_index) in enumerate(self.indices[1:], start=1):
+            parent = self.positions[parent_index(branch_index)]
+            self.parents[position] = parent
+            self.depths[position] = self.depths[parent] + 1
+
+        # a subtree ends where the next branch at the same depth or higher starts
+        self.ends = np.full(count, count, dtype=np.int64)
+        open_positions: list[int] = []
+        for position in range(count):
+            while open_positions and self.depths[open_positions[-1]] >= self.depths[position]:
+                self.ends[open_positions.pop()] = position
+            open_positions.append(position)
+
+    @classmethod
+    def from_branches(cls, branches_df: pd.DataFrame) -> 'BranchTree':
+        return cls(branches_df['index'], dict(zip(branches_df['index'], branches_df['id'])))
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __contains__(self, branch_index: str) -> bool:
+        return branch_index in self.positions
+
+    def parent(self, branch_index: str) -> str | None:
+        """The parent's index, None for the root."""
+        parent = self.parents[self.positions[branch_index]]
+        return self.indices[parent] if parent >= 0 else None
+
+    def depth(self, branch_index: str) -> int:
+        return int(self.depths[self.positions[branch_index]])
+
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        """Whether ancestor is descendant or above it."""
+        start = self.positions[ancestor]
+        return start <= self.positions[descendant] < self.ends[start]
+
+    def ancestors(self, branch_index: str) -> list[str]:
+        """The branch's ancestors, nearest first, not including itself or the root."""
+        ancestors = []
+        position = self.parents[self.positions[branch_index]]
+        while position > 0:
+            ancestors.append(self.indices[position])
+            position = self.parents[position]
+        return ancestors
+
+    def subtree_range(self, branch_index: str) -> tuple[int, int]:
+        """The preorder positions [start, end) of the branch and everything under it."""
+        start = self.positions[branch_index]
+        return (start, int(self.ends[start]))
+
+    def descendants(self, branch_index: str) -> list[str]:
+        """The branch and everything under it, in preorder."""
+        (start, end) = self.subtree_range(branch_index)
+        return self.indices[start:end]
+
+    def children(self, branch_index: str) -> list[str]:
+        (start, end) = self.subtree_range(branch_index)
+        return [self.indices[position] for position in range(start + 1, end) if self.parents[position] == start]
+
+    def positions_of(self, branch_indices: pd.Series) -> np.ndarray:
+        """The preorder position of each branch index in a column, looking each distinct index up once. -1 if it's missing."""
+        (codes, uniques) = pd.factorize(branch_indices)
+        lookup = np.array([self.positions.get(branch_index, -1) for branch_index in uniques] + [-1], dtype=np.int64)
+        return lookup[codes]
+
+    def parents_of(self, branch_indices: pd.Series) -> pd.Series:
+        """The parent index of each branch index in a column, e.g. to get a rule table's parent_index column."""
+        (codes, uniques) = pd.factorize(branch_indices)
+        lookup = np.array([parent_index(branch_index) for branch_index in uniques] + [None], dtype=object)
+        return pd.Series(lookup[codes], index=branch_indices.index)
+
+    def sort(self, df: pd.DataFrame, col: str = 'branch_index') -> pd.DataFrame:
+        """Sort a table into tree order on one of its branch index columns, keeping the order within each branch.
+
+        Adds a tree_position column, which subtree_slice binary searches.
+        """
+        positions = self.positions_of(df[col])
+        order = np.argsort(positions, kind='stable')
+        sorted_df = df.iloc[order].copy()
+        sorted_df['tree_position'] = positions[order]
+        return sorted_df
+
+    def subtree_slice(self, sorted_df: pd.DataFrame, branch_index: str) -> pd.DataFrame:
+        """The rows of a table sorted with sort() that are in a branch's subtree."""
+        (start, end) = self.subtree_range(branch_index)
+        positions = sorted_df['tree_position'].to_numpy()
+        return sorted_df.iloc[np.searchsorted(positions, start):np.searchsorted(positions, end)]
+
+    def subtree_counts(self, df: pd.DataFrame, col: str = 'branch_index') -> pd.Series:
+        """How many rows of a table are in each branch's subtree, for every branch at once."""
+        positions = self.positions_of(df[col])
+        own_counts = np.bincount(positions[positions >= 0], minlength=len(self))
+        cumulative = np.concatenate([[0], np.cumsum(own_counts)])
+        return pd.Series(cumulative[self.ends] - cumulative[:-1], index=self.indices)
+
+def load_branch_tree(path: str = BRANCHES_PARQUET_PATH) -> BranchTree:
+    return BranchTree.from_branches(read_branches(path, columns=['id', 'index']))
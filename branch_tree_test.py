@@ -0,0 +1,38 @@
+import pandas as pd
+from branch_tree import BranchTree, parent_index
+
+def sample_tree() -> BranchTree:
+  return BranchTree(['6.1', '6.1.1', '6.1.2', '6.1.10', '6.2', '10.1'])
+
+def test_parent_index():
+  assert parent_index('6.5.4.3.2') == '6.5.4.3'
+  assert parent_index('6') == ''
+
+def test_preorder():
+  tree = sample_tree()
+  assert tree.indices == ['', '6', '6.1', '6.1.1', '6.1.2', '6.1.10', '6.2', '10', '10.1']
+  assert tree.descendants('6.1') == ['6.1', '6.1.1', '6.1.2', '6.1.10']
+  assert tree.children('6') == ['6.1', '6.2']
+  assert tree.parent('10.1') == '10'
+  assert tree.parent('') == None
+  assert tree.ancestors('6.1.10') == ['6.1', '6']
+  assert tree.depth('6.1.2') == 3
+
+def test_is_ancestor():
+  tree = sample_tree()
+  assert tree.is_ancestor('6', '6.1.10')
+  assert tree.is_ancestor('6.1', '6.1')
+  assert not tree.is_ancestor('6.1.1', '6.1.10')
+  assert not tree.is_ancestor('6.2', '6.1')
+
+def test_subtree_slice():
+  tree = sample_tree()
+  df = pd.DataFrame({ 'branch_index': ['10.1', '6.1.10', '6.2', '6.1', '6.1.1', '6.1'], 'rule': range(6) })
+  sorted_df = tree.sort(df)
+  assert list(sorted_df['rule']) == [3, 5, 4, 1, 2, 0]
+  assert list(tree.subtree_slice(sorted_df, '6.1')['rule']) == [3, 5, 4, 1]
+  assert list(tree.subtree_slice(sorted_df, '6.1.2')['rule']) == []
+  counts = tree.subtree_counts(df)
+  assert counts['6'] == 5
+  assert counts['6.1'] == 4
+  assert counts[''] == 6
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import t as t_distribution
+from typing import NamedTuple
+
+class GroupMoments(NamedTuple):
+    """The sufficient statistics of some value columns, for each group and in total, ignoring NaNs."""
+    groups: pd.Index
+    counts: np.ndarray # (groups, columns)
+    sums: np.ndarray
+    sums_of_squares: np.ndarray
+    offsets: np.ndarray # (columns,) what the values were shifted by before summing
+    total_counts: np.ndarray # (columns,)
+    total_sums: np.ndarray
+    total_sums_of_squares: np.ndarray
+
+def group_moments(df: pd.DataFrame, group_col: str, value_cols: list[str]) -> GroupMoments:
+    """Count, sum and sum the squares of each value column per group, in one pass over the table.
+
+    Rows with no group still count towards the totals, so they're part of every group's complement.
+    """
+    (codes, groups) = pd.factorize(df[group_col])
+    grouped = codes >= 0
+    values = df[value_cols].to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+
+    # Shift by the column means so the sums of squares don't lose precision
+    values = np.where(valid, values, 0.0)
+    offsets = values.sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    values = np.where(valid, values - offsets, 0.0)
+
+    shape = (len(groups), len(value_cols))
+    counts = np.empty(shape)
+    sums = np.empty(shape)
+    sums_of_squares = np.empty(shape)
+    for col in range(len(value_cols)):
+        column = values[grouped, col]
+        counts[:, col] = np.bincount(codes[grouped], weights=valid[grouped, col], minlength=len(groups))
+        sums[:, col] = np.bincount(codes[grouped], weights=column, minlength=len(groups))
+        sums_of_squares[:, col] = np.bincount(codes[grouped], weights=column * column, minlength=len(groups))
+
+    return GroupMoments(
+        pd.Index(np.asarray(groups), name=group_col),
+        counts,
+        sums,
+        sums_of_squares,
+        offsets,
+        valid.sum(axis=0).astype(float),
+        values.sum(axis=0),
+        (values * values).sum(axis=0),
+    )
+
+def student_t(count_1: np.ndarray, sum_1: np.ndarray, sum_of_squares_1: np.ndarray, count_2: np.ndarray, sum_2: np.ndarray, sum_of_squares_2: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Two-sided, equal variance t-tests from sufficient statistics, the same as scipy.stats.ttest_ind.
+
+    NaN wherever there aren't enough values for a test.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_1 = sum_1 / count_1
+        mean_2 = sum_2 / count_2
+        squared_deviations = (sum_of_squares_1 - sum_1 * mean_1) + (sum_of_squares_2 - sum_2 * mean_2)
+        degrees_of_freedom = count_1 + count_2 - 2
+        pooled_variance = squared_deviations / degrees_of_freedom
+        t_statistics = (mean_1 - mean_2) / np.sqrt(pooled_variance * (1 / count_1 + 1 / count_2))
+
+    testable = (count_1 >= 1) & (count_2 >= 1) & (degrees_of_freedom >= 1)
+    t_statistics = np.where(testable, t_statistics, np.nan)
+    p_values = np.where(testable, 2 * t_distribution.sf(np.abs(t_statistics), np.where(testable, degrees_of_freedom, 1)), np.nan)
+    return (t_statistics, p_values)
+
+def t_tests_vs_complement(df: pd.DataFrame, group_col: str, value_cols: list[str]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """t-test every group against the rest of the table for each value column, all at once.
+
+    Returns the t statistics and p values, indexed by group with a column per value column.
+    """
+    return t_tests_from_moments(group_moments(df, group_col, value_cols), value_cols)
+
+def t_tests_from_moments(moments: GroupMoments, value_cols: list[str]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """t-test every group against its complement from already computed moments."""
+    (t_statistics, p_values) = student_t(
+        moments.counts,
+        moments.sums,
+        moments.sums_of_squares,
+        moments.total_counts - moments.counts,
+        moments.total_sums - moments.sums,
+        moments.total_sums_of_squares - moments.sums_of_squares,
+    )
+    return (
+        pd.DataFrame(t_statistics, index=moments.groups, columns=value_cols),
+        pd.DataFrame(p_values, index=moments.groups, columns=value_cols),
+    )
+
+def change_stats(df: pd.DataFrame, consonant_att: str, vowel_att: str, drop: tuple[str, ...] = ('', 'anyp')) -> pd.DataFrame:
+    """The mean, count, t statistic and p value of a vowel change for each value of a consonant feature, sorted by t statistic."""
+    moments = group_moments(df, consonant_att, [vowel_att])
+    (t_statistics, p_values) = t_tests_from_moments(moments, [vowel_att])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = moments.sums[:, 0] / moments.counts[:, 0] + moments.offsets[0]
+
+    stats_df = pd.DataFrame({
+        (vowel_att, 'mean'): means,
+        (vowel_att, 'count'): moments.counts[:, 0].astype(int),
+        (vowel_att, 't_statistic'): t_statistics[vowel_att].to_numpy(),
+        (vowel_att, 'p_value'): p_values[vowel_att].to_numpy(),
+    }, index=moments.groups)
+
+    return stats_df\
+        .drop(list(drop), errors='ignore')\
+        .reset_index()\
+        .sort_values((vowel_att, 't_statistic'), ascending=False)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import ttest_ind
+import complement_stats as cs
+
+def sample_df() -> pd.DataFrame:
+  rng = np.random.default_rng(0)
+  df = pd.DataFrame({
+    'place': rng.choice(['velar', 'dental', 'uvular', 'anyp', None], 500),
+    'height_change': rng.integers(-3, 4, 500).astype(float),
+    'backness_change': rng.integers(-2, 3, 500).astype(float),
+  })
+  df.loc[rng.random(500) < 0.3, 'height_change'] = np.nan
+  df.loc[df.index[:3], 'place'] = 'rare'
+  return df
+
+def test_t_tests_match_scipy():
+  df = sample_df()
+  (t_stats, p_vals) = cs.t_tests_vs_complement(df, 'place', ['height_change', 'backness_change'])
+  assert set(t_stats.index) == {'velar', 'dental', 'uvular', 'anyp', 'rare'}
+  for place in t_stats.index:
+    for col in t_stats.columns:
+      group = df[col][df['place'] == place]
+      (t_stat, p_val) = ttest_ind(group, df[col].drop(group.index), nan_policy='omit')
+      assert np.isclose(t_stats.loc[place, col], t_stat)
+      assert np.isclose(p_vals.loc[place, col], p_val)
+
+def test_t_tests_too_few_values():
+  df = pd.DataFrame({ 'place': ['velar', 'dental'], 'height_change': [1.0, np.nan] })
+  (t_stats, p_vals) = cs.t_tests_vs_complement(df, 'place', ['height_change'])
+  assert t_stats['height_change'].isna().all()
+  assert p_vals['height_change'].isna().all()
+
+def test_change_stats():
+  df = sample_df()
+  stats_df = cs.change_stats(df, 'place', 'height_change')
+  assert list(stats_df[('place', '')]) == list(stats_df.sort_values(('height_change', 't_statistic'), ascending=False)[('place', '')])
+  assert 'anyp' not in list(stats_df[('place', '')])
+  expected = df.groupby('place')['height_change'].agg(['mean', 'count'])
+  for (_, row) in stats_df.iterrows():
+    place = row[('place', '')]
+    assert np.isclose(row[('height_change', 'mean')], expected.loc[place, 'mean'])
+    assert row[('height_change', 'count')] == expected.loc[place, 'count']
@@ -0,0 +1,41 @@
+import collections
+import collections.abc
+import json
+import os
+
+# vowel_changes relies on a fork of ipapy that runs on current Pythons and adds descriptors for the SID's abbreviations
+# (anyv, anyp, liquid, ...). When only the released ipapy is installed, make it do the same, so the extraction tests
+# still run. This does nothing with the fork installed.
+if not hasattr(collections, 'MutableSequence'):
+    collections.MutableSequence = collections.abc.MutableSequence  # type: ignore[attr-defined]
+
+try:
+    from ipapy import ipachar
+    from ipapy.ipadescriptor import IPADescriptor
+except ImportError:
+    ipachar = None
+
+ABBREVIATION_GROUPS = ['voicing', 'place', 'manner', 'height', 'backness', 'roundness']
+
+def add_abbreviation_descriptors() -> None:
+    groups = {
+        'voicing': [ipachar.DG_C_VOICING, ipachar.DG_CONSONANTS],
+        'place': [ipachar.DG_C_PLACE, ipachar.DG_CONSONANTS],
+        'manner': [ipachar.DG_C_MANNER, ipachar.DG_CONSONANTS],
+        'height': [ipachar.DG_V_HEIGHT, ipachar.DG_VOWELS],
+        'backness': [ipachar.DG_V_BACKNESS, ipachar.DG_VOWELS],
+        'roundness': [ipachar.DG_V_ROUNDNESS, ipachar.DG_VOWELS],
+    }
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'abbreviations.json'), encoding='utf-8') as abbreviations_file:
+        abbreviations = json.load(abbreviations_file)
+    for abbreviation in abbreviations.values():
+        for group in ABBREVIATION_GROUPS:
+            value = abbreviation.get(group)
+            if value is None or value in groups[group][0]:
+                continue
+            descriptor = IPADescriptor([value])
+            for descriptor_group in groups[group] + [ipachar.DG_ALL_DESCRIPTORS]:
+                descriptor_group.descriptors.append(descriptor)
+
+if ipachar is not None:
+    add_abbreviation_descriptors()
@@ -1,25 +1,88 @@
-from bs4 import BeautifulSoup
-from bs4.element import ResultSet, Tag
-from typing import Tuple
+from typing import TYPE_CHECKING, Any, Iterator, TextIO, Tuple
 import pickle
 import re
-import jsons
+import hashlib
 import itertools
-
-class Rule:
+import argparse
+import sys
+import diagnostics
+import rule_syntax
+# the text-level parsing lives in rule_syntax, but the notebooks and tests use it from here
+from rule_syntax import MAX_OPTIONAL_EXPANSIONS, RuleSteps, balance_brackets, expand_optionals, handle_brackets, parse_rule, parse_steps, remove_combos, split_sounds
+
+# bs4 and rule_store (pandas/pyarrow) are only imported when a document is parsed or written,
+# so importing this module for the rule syntax is quick
+if TYPE_CHECKING:
+    from bs4.element import Tag
+
+class Record:
+    """Base for parsed records. They're slotted, since there are tens of thousands of them."""
+    __slots__ = ()
+    # fields interned when parsed, which are interned again when a record is unpickled (e.g. from a worker process)
+    # or rebuilt from the section cache, so it shares them just like a freshly parsed one does
+    interned_fields: tuple[str, ...] = ()
+
+    def to_dict(self) -> dict:
+        """Get the record's fields as a dict, leaving out unset ones."""
+        return { name: getattr(self, name) for name in self.__slots__ if hasattr(self, name) }
+
+    @classmethod
+    def from_dict(cls, fields: dict):
+        """Make a record from a dict of fields."""
+        record = cls()
+        record.__setstate__(fields)
+        return record
+
+    def __getstate__(self) -> dict:
+        return self.to_dict()
+
+    def __setstate__(self, state: dict | Tuple[dict | None, dict]) -> None:
+        # Older pickles were of the plain (__dict__) classes
+        if isinstance(state, tuple):
+            state = state[1]
+        for (name, value) in state.items():
+            if name in self.interned_fields:
+                value = intern_field(value)
+            setattr(self, name, value)
+
+def intern_field(value: Any) -> Any:
+    """Intern a string, or each string in a tuple or list of them."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, (tuple, list)):
+        return type(value)(intern_field(item) for item in value)
+    return value
+
+class Rule(Record):
+    __slots__ = ('id', 'branch_id', 'branch_index', 'original_text', 'environment', 'from_sound', 'intermediate_steps', 'to_sound')
     id: str # Proto-Omotic-dʒ
     branch_id: str # Proto-Omotic
     branch_index: str # 6.1
     from_sound: str # 'dʒ'
-    intermediate_steps: list[str] # ['tʃ']
+    intermediate_steps: tuple[str, ...] # ('tʃ',)
     to_sound: str # 'ʃ'
     original_text: str # dʒ → tʃ → ʃ
+    environment: str # _s#
+    interned_fields = ('id', 'branch_id', 'branch_index', 'environment', 'from_sound', 'intermediate_steps', 'to_sound')
 
-class Branch:
+class Branch(Record):
+    __slots__ = ('id', 'index', 'name', 'source')
     id: str # section's ID field (Proto-Omotic)
     index: str # 6.1
     name: str # Proto-Omotic to Proto-Afro-Asiatic
     source: str # <i>Mecislau</i>, from Ehret, Christopher (1995)[...]
+    interned_fields = ('id', 'index')
+
+SID_PATH = './data/sid-tidy-with-edits.html'
+SECTION_CACHE_PATH = './data/section_cache.pkl'
+
+SECTION_OPEN = '<section'
+SECTION_CLOSE = '</section>'
+COMMENT_OPEN = '<!--'
+COMMENT_CLOSE = '-->'
+
+# how many sections each worker parses at a time in parallel mode
+PARALLEL_CHUNK_SIZE = 16
 
 subs = {
     '0': '₀',
@@ -47,140 +110,70 @@ sups = {
     's': 'ˢ'
 }
 
-def remove_combos(string: str, combos: tuple[tuple[int, int, str], ...]) -> str:
-    """Removes combos of optionals from a string."""
-    removed = string
-    for (start, end, optional) in combos:
-        removed = removed[:start] + ('�' * (end - start)) + removed[end:]
-    
-    return removed.replace('�', '')
+def expand_rule_steps(rule_steps: RuleSteps) -> list[Tuple[str, tuple[str, ...], str]]:
+    """Expand parsed rule steps into (from sound, intermediate steps, to sound) tuples"""
+    rules: list[Tuple[str, tuple[str, ...], str]] = []
 
-def split_sounds(sounds: str) -> list[str]:
-    """Split the sounds in a rule.
-
-    Requires more than just .split(' ') because of cases like `[+ voice]`.
-    """
-    return re.findall(r'(?:\[.*?\]|\S)+', sounds)
-
-def handle_brackets(sound: str) -> set[str]:
-    """Handles bracketed sounds"""
-    sounds: set[str] = set()
-
-    # find innermost bracket and recurse
-    bracket_start: int = 0
-    bracket_end: int = 0
-
-    # Gotta do bracket matching. Ugh
-    for (index, character) in enumerate(sound):
-        if character == '{':
-            bracket_start = index
-        elif character == '}':
-            bracket_end = index
-            break
-    
-    if (bracket_start == 0 and bracket_end == 0):
-        return set([sound])
-    
-    if (bracket_end == 0):
-        bracket_end = len(sound)
-    
-    # print(sound[bracket_start : bracket_end+1])
-    
-    inner_sounds = sound[bracket_start + 1 : bracket_end].split(',')
-
-    for inner_sound in inner_sounds:
-        repl_sound = sound[:bracket_start] + inner_sound + sound[bracket_end + 1:]
-        sounds |= handle_brackets(repl_sound)
-    
-    return sounds
-
-def parse_rule_steps(steps: str) -> list[Tuple[str, list[str], str]]:
-    """Parse out the steps of a rule"""
-    rules: list[Tuple[str, list[str], str]] = []
+    steps = rule_steps.text
 
-    steps = re.sub(r'^— ', '', steps)
+    if len(rule_steps.steps) < 2:
+        diagnostics.warn('too_few_steps', f'Too few steps in rule: {steps} - skipping')
+        return []
 
-    # split by the rule step separator
-    rule_split = [s.strip() for s in steps.split("→")]
+    from_step = rule_steps.steps[0]
+    to_step = rule_steps.steps[-1]
 
-    if len(rule_split) < 2:
-        print(f'Too few steps in rule: {steps} - skipping')
-        return []
-    
-    if len(rule_split) > 2:
-        from_sounds = split_sounds(rule_split[0])
-        intermediates = [split_sounds(substr) for substr in rule_split[1:-1]]
-        to_sounds = split_sounds(rule_split[-1])
+    if len(rule_steps.steps) > 2:
+        from_sounds = [sound.text for sound in from_step]
+        intermediates = [[sound.text for sound in step] for step in rule_steps.steps[1:-1]]
+        to_sounds = [sound.text for sound in to_step]
         if (not (
                 (len(from_sounds) == len(intermediates[0]) == len(to_sounds))
                 and all(len(i) == len(intermediates[0]) for i in intermediates)
             )):
-            print(f'Warning: mismatched lengths for rule: {steps} ({from_sounds}, {intermediates}, {to_sounds}) ({len(from_sounds)}, {[len(im) for im in intermediates],}, {len(to_sounds)})')
-        
-        for index, from_sound in enumerate(from_sounds):
-            unbracketed_froms = handle_brackets(from_sound)
-            unbracketed_tos = handle_brackets(to_sounds[index])
-            for unb_from in unbracketed_froms:
-                for unb_to in unbracketed_tos:
-                    rules.append((unb_from, [im[index] for im in intermediates], unb_to))
+            diagnostics.warn('mismatched_lengths', f'Warning: mismatched lengths for rule: {steps} ({from_sounds}, {intermediates}, {to_sounds}) ({len(from_sounds)}, {[len(im) for im in intermediates],}, {len(to_sounds)})')
+
+        for index, from_sound in enumerate(from_step):
+            for unb_from in from_sound.alternatives:
+                for unb_to in to_step[index].alternatives:
+                    rules.append((unb_from, tuple(im[index] for im in intermediates), unb_to))
     else:
-        from_sounds = split_sounds(rule_split[0])
-        to_sounds = split_sounds(rule_split[1])
-        if (len(from_sounds) != len(to_sounds)):
-            print(f'Warning: mismatched lengths for rule: {steps} ({from_sounds}, {to_sounds}) ({len(from_sounds)}, {len(to_sounds)})')
-        
-        for index, from_sound in enumerate(from_sounds):
-            unbracketed_froms = handle_brackets(from_sound)
-            unbracketed_tos = handle_brackets(to_sounds[index])
-            for unb_from in unbracketed_froms:
-                for unb_to in unbracketed_tos:
-                    rules.append((unb_from, [], unb_to))
-    
+        if (len(from_step) != len(to_step)):
+            from_sounds = [sound.text for sound in from_step]
+            to_sounds = [sound.text for sound in to_step]
+            diagnostics.warn('mismatched_lengths', f'Warning: mismatched lengths for rule: {steps} ({from_sounds}, {to_sounds}) ({len(from_sounds)}, {len(to_sounds)})')
+
+        for index, from_sound in enumerate(from_step):
+            for unb_from in from_sound.alternatives:
+                for unb_to in to_step[index].alternatives:
+                    rules.append((unb_from, (), unb_to))
+
     return rules
 
-def parse_sound_change(rule_string: str, rule_id: str = '', branch: Branch = None, decoded: str = '') -> list[Rule]:
+def parse_rule_steps(steps: str) -> list[Tuple[str, tuple[str, ...], str]]:
+    """Parse out the steps of a rule"""
+    return expand_rule_steps(parse_steps(steps))
+
+def parse_sound_change(rule_string: str, rule_id: str = '', branch: Branch = None, decoded: str = '', max_expansions: int | None = MAX_OPTIONAL_EXPANSIONS) -> list[Rule]:
     """Parse the rules for a sound change."""
     rules: list[Rule] = []
 
-    # Ignore anything in backticks
-    rule_string = re.sub(r'`.*?`', '', rule_string)
+    with diagnostics.stage('rule_parse'):
+        sound_change = parse_rule(rule_string)
 
-    # Ignore "(?)"
-    rule_string = rule_string.replace('(?)', '')
+        # only uniques, in the order they're first found (dicts keep insertion order)
+        split_rules: dict[Tuple[str, tuple[str, ...], str], None] = {}
 
-    # Split the rule up. This will inevitably include stuff I don't want but we can work out how to remove that stuff later
-    # First split by the environment separator
-    env_split = rule_string.split(" / ", 1)
+        # if there are any optional bits, run the split with all possible combinations of with and without them
+        for rule_steps in sound_change.variants(max_expansions):
+            split_rules.update(dict.fromkeys(expand_rule_steps(rule_steps)))
+    diagnostics.observe('expansions_per_rule', len(split_rules))
 
-    environment = ''
+    # Sounds and environments repeat a lot across rules, so intern them to share one copy of each
+    rule_id = sys.intern(rule_id)
+    environment = sys.intern(sound_change.environment)
 
-    if len(env_split) > 1:
-        environment = env_split[1]
-    else:
-        # If no environment, but rule ends with some text in parentheses or quotes, consider that the environment
-        parens_match = re.search(r'(.+[^→]) (\(.+\)|“.+”)$', rule_string)
-        if parens_match:
-            env_split[0] = parens_match.group(1)
-            environment = parens_match.group(2)
-    
-    split_rules: list[Tuple[str,list[str],str]] = []
-
-    # if there are any optional bits, run the split with all possible combinations of with and without them
-    optionals = [(match.start(), match.end(), match.group(0)) for match in re.finditer(r'(\(.*?\))', env_split[0])]
-    if (optionals):
-        combinations = list(itertools.chain.from_iterable(itertools.combinations(optionals, l) for l in range(len(optionals) + 1)))
-        for combo in combinations:
-            combo_string = env_split[0]
-            # print(combo)
-            combo_string = remove_combos(combo_string, combo)
-            combo_string = combo_string.replace('(','').replace(')','')
-            # print(combo_string)
-            split_rules += parse_rule_steps(combo_string)
-    else:
-        split_rules += parse_rule_steps(env_split[0])
-
-    # only uniques
-    for split_rule in [sr for i, sr in enumerate(split_rules) if sr not in split_rules[:i]]:
+    for split_rule in split_rules:
         rule = Rule()
 
         rule.id = rule_id
@@ -188,88 +181,319 @@ def parse_sound_change(rule_string: str, rule_id: str = '', branch: Branch = Non
         rule.branch_index = branch.index if branch else None
         rule.original_text = decoded
         rule.environment = environment
-        rule.from_sound, rule.intermediate_steps, rule.to_sound = split_rule
+        (from_sound, intermediate_steps, to_sound) = split_rule
+        rule.from_sound = sys.intern(from_sound)
+        rule.intermediate_steps = tuple(sys.intern(step) for step in intermediate_steps)
+        rule.to_sound = sys.intern(to_sound)
 
         rules.append(rule)
 
     return rules
 
-def parse_sid() -> None:
-    """Parse the Searchable Index Diachronica and write the output."""
-    with open('./data/sid-tidy-with-edits.html') as fp:
+def get_rule_string(sound_change: 'Tag') -> str:
+    """Get the text of a sound change, with any <sub> or <sup> tags replaced with Unicode equivalents."""
+    rule_parts: list[str] = []
+    for rule_part in sound_change.contents:
+        if not rule_part.name:
+            rule_parts.append(rule_part)
+        else:
+            if rule_part.name == 'sub':
+                rule_parts.append(subs[rule_part.string])
+            elif rule_part.name == 'sup':
+                rule_parts.append(sups[rule_part.string])
+            elif rule_part.name == 'b': # sometimes stuff is bolded that should be included
+                rule_parts.append(rule_part.string)
+            # leave out anything else weird, for now
+
+    return ''.join(rule_parts)
+
+def parse_section(section: 'Tag') -> Tuple[Branch, list[Rule]] | None:
+    """Parse one section of the SID into its branch and rules.
+
+    Returns None for sections without sound changes or with a malformed header.
+    """
+    # Only include sections that have sound changes
+    sound_changes = section.select('.schg')
+
+    if not sound_changes:
+        return None
+
+    branch = Branch()
+
+    branch.id = sys.intern(section['id'])
+
+    # Get header info
+    header: Tag = section.h2
+
+    header_match = re.match(r'(\d+(?:\.\d+)*) (.+)', header.decode_contents())
+    if not header_match:
+        diagnostics.warn('bad_header', f'Section header "{header.decode_contents()}" doesn\'t match format, skipping')
+        return None
+
+    branch.index = sys.intern(header_match[1])
+    branch.name = header_match[2]
+
+    # Get source
+    source: Tag = section.select_one('p:not(.schg)')
+    if source:
+        branch.source = source.decode_contents()
+
+    # Parse rules!
+    # This is the hard part.
+    rules: list[Rule] = []
+    sound_change: Tag
+    for sound_change in sound_changes:
+        rule_string = get_rule_string(sound_change)
+        rules += parse_sound_change(rule_string, sound_change['id'], branch, sound_change.decode_contents())
+
+    return (branch, rules)
+
+def find_outside_comments(buffer: str, target: str, start: int = 0) -> Tuple[int, int]:
+    """Find the first occurrence of target in buffer that isn't inside an HTML comment.
+
+    Returns (index of target or -1, index scanning can safely resume from).
+    """
+    position = start
+    while True:
+        target_index = buffer.find(target, position)
+        comment_index = buffer.find(COMMENT_OPEN, position)
+
+        if comment_index == -1 or (target_index != -1 and target_index < comment_index):
+            if target_index == -1:
+                # keep just enough of the tail to catch a tag split across chunks
+                return (-1, max(position, len(buffer) - max(len(target), len(COMMENT_OPEN)) + 1))
+            return (target_index, target_index)
+
+        comment_end = buffer.find(COMMENT_CLOSE, comment_index + len(COMMENT_OPEN))
+        if comment_end == -1:
+            return (-1, comment_index)
+        position = comment_end + len(COMMENT_CLOSE)
+
+def iter_section_markup(fp: TextIO, chunk_size: int = 1 << 16) -> Iterator[str]:
+    """Yield the raw markup of each <section> in a document, reading it a chunk at a time.
+
+    Sections in the SID are never nested, so each one ends at the first closing tag after it starts.
+    Commented-out sections are skipped, like an HTML parser would.
+    """
+    buffer = ''
+    at_eof = False
+    while True:
+        (start, resume) = find_outside_comments(buffer, SECTION_OPEN)
+        if start != -1:
+            (end, _) = find_outside_comments(buffer, SECTION_CLOSE, start)
+            if end != -1:
+                end += len(SECTION_CLOSE)
+                yield buffer[start:end]
+                buffer = buffer[end:]
+                continue
+            buffer = buffer[start:]
+        else:
+            buffer = buffer[resume:]
+
+        if at_eof:
+            return
+
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            at_eof = True
+        buffer += chunk
+
+def load_sections(path: str) -> Iterator['Tag']:
+    """Yield every <section> of the SID from a single parse of the whole document."""
+    from bs4 import BeautifulSoup
+    with open(path) as fp, diagnostics.stage('html_load'):
         soup = BeautifulSoup(fp, 'html.parser')
 
     # Each branch has a section
-    sections: ResultSet = soup.find_all('section')
+    sections = soup.find_all('section')
+    yield from sections
 
-    branches: list[Branch] = []
-    rules: list[Rule] = []
+def stream_sections(path: str) -> Iterator['Tag']:
+    """Yield every <section> of the SID, parsing them one at a time.
+
+    Only one section's tree is alive at a time, so memory use doesn't grow with the document.
+    """
+    from bs4 import BeautifulSoup
+    with open(path) as fp:
+        for markup in iter_section_markup(fp):
+            with diagnostics.stage('html_load'):
+                section: Tag = BeautifulSoup(markup, 'html.parser').section
+            yield section
+            section.decompose()
+
+def parse_section_markup(markups: list[str]) -> list[Tuple[Branch, list[Rule]] | None]:
+    """Parse a chunk of raw section markup. This is what each worker runs in parallel mode."""
+    from bs4 import BeautifulSoup
+    return [parse_section(BeautifulSoup(markup, 'html.parser').section) for markup in markups]
+
+def chunk_markup(markups: Iterator[str], chunk_size: int) -> Iterator[list[str]]:
+    """Group section markup into lists of chunk_size sections."""
+    while chunk := list(itertools.islice(markups, chunk_size)):
+        yield chunk
+
+def parse_sid_parallel(path: str, workers: int | None, chunk_size: int = PARALLEL_CHUNK_SIZE) -> Iterator[Tuple[Branch, list[Rule]]]:
+    """Parse the SID's sections across a process pool, yielding results in document order."""
+    from concurrent.futures import ProcessPoolExecutor
+    with open(path) as fp, ProcessPoolExecutor(max_workers=workers) as executor:
+        # map hands results back in submission order, so the output matches the serial path
+        for results in executor.map(parse_section_markup, chunk_markup(iter_section_markup(fp), chunk_size)):
+            for parsed in results:
+                if parsed:
+                    yield parsed
+
+def hash_markup(markup: str) -> str:
+    """Hash a section's raw markup, for the incremental section cache."""
+    return hashlib.sha256(markup.encode()).hexdigest()
+
+def get_parser_version() -> str:
+    """Hash the parser's source, so cached sections are thrown out whenever the parser changes."""
+    version = hashlib.sha256()
+    for source_path in (__file__, rule_syntax.__file__):
+        with open(source_path, 'rb') as source_file:
+            version.update(source_file.read())
+    return version.hexdigest()
+
+def section_to_record(parsed: Tuple[Branch, list[Rule]] | None) -> Tuple[dict, list[dict]] | None:
+    """Turn a parsed section into plain data for the section cache."""
+    if not parsed:
+        return None
+    (branch, rules) = parsed
+    return (branch.to_dict(), [rule.to_dict() for rule in rules])
+
+def section_from_record(record: Tuple[dict, list[dict]] | None) -> Tuple[Branch, list[Rule]] | None:
+    """Rebuild a parsed section from the section cache."""
+    if not record:
+        return None
+    (branch_dict, rule_dicts) = record
+
+    return (Branch.from_dict(branch_dict), [Rule.from_dict(rule_dict) for rule_dict in rule_dicts])
+
+def load_section_cache(cache_path: str) -> dict[str, Tuple[dict, list[dict]] | None]:
+    """Load the section hash -> parsed section manifest, if it was written by this version of the parser."""
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            cache = pickle.load(cache_file)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return {}
+
+    if cache.get('version') != get_parser_version():
+        return {}
+    return cache['sections']
+
+def save_section_cache(cache_path: str, sections: dict[str, Tuple[dict, list[dict]] | None]) -> None:
+    """Write the section hash -> parsed section manifest."""
+    with open(cache_path, 'wb+') as cache_file:
+        pickle.dump({ 'version': get_parser_version(), 'sections': sections }, cache_file)
+
+def parse_sid_incremental(path: str, cache_path: str, workers: int | None = 1) -> Iterator[Tuple[Branch, list[Rule]]]:
+    """Parse the SID, only re-parsing the sections whose markup changed since the last run."""
+    with open(path) as fp:
+        markups = list(iter_section_markup(fp))
+    hashes = [hash_markup(markup) for markup in markups]
+
+    cache = load_section_cache(cache_path)
+
+    # parse every changed section, once
+    changed = { section_hash: markup for (section_hash, markup) in zip(hashes, markups) if section_hash not in cache }
+    if changed:
+        if workers != 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunks = chunk_markup(iter(changed.values()), PARALLEL_CHUNK_SIZE)
+                parsed = itertools.chain.from_iterable(executor.map(parse_section_markup, chunks))
+                records = [section_to_record(section) for section in parsed]
+        else:
+            records = [section_to_record(section) for section in parse_section_markup(list(changed.values()))]
+        cache.update(zip(changed.keys(), records))
+
+    # only keep sections that are still in the document
+    sections = { section_hash: cache[section_hash] for section_hash in hashes }
+    if changed or len(sections) != len(cache):
+        save_section_cache(cache_path, sections)
+
+    print(f'Re-parsed {len(changed)} of {len(markups)} sections.')
+
+    for section_hash in hashes:
+        parsed = section_from_record(sections[section_hash])
+        if parsed:
+            yield parsed
+
+def iter_sid(path: str = SID_PATH, streaming: bool = False, workers: int | None = 1) -> Iterator[Tuple[Branch, list[Rule]]]:
+    """Yield each branch of the SID along with its rules, in document order.
+
+    With workers other than 1, sections are parsed in a process pool (None uses every core).
+    """
+    if workers != 1:
+        yield from parse_sid_parallel(path, workers)
+        return
+
+    sections = stream_sections(path) if streaming else load_sections(path)
 
     section: Tag
     for section in sections:
-        # Only include sections that have sound changes
-        sound_changes = section.select('.schg')
-
-        if not sound_changes:
-            continue
-
-        branch = Branch()
-
-        branch.id = section['id']
-
-        # Get header info
-        header: Tag = section.h2
-
-        header_match = re.match(r'(\d+(?:\.\d+)*) (.+)', header.decode_contents())
-        if not header_match:
-            print(f'Section header "{header.decode_contents()}" doesn\'t match format, skipping')
-            continue
-
-        branch.index = header_match[1]
-        branch.name = header_match[2]
-
-        # Get source
-        source: Tag = section.select_one('p:not(.schg)')
-        if source:
-            branch.source = source.decode_contents()
-        
-        branches.append(branch)
-
-        # Parse rules!
-        # This is the hard part.
-        sound_change: Tag
-        for sound_change in sound_changes:
-            # Replace any <sub> or <sup> tags with Unicode equivalents
-            rule_parts: list[str] = []
-            for rule_part in sound_change.contents:
-                if not rule_part.name:
-                    rule_parts.append(rule_part)
-                else:
-                    if rule_part.name == 'sub':
-                        rule_parts.append(subs[rule_part.string])
-                    elif rule_part.name == 'sup':
-                        rule_parts.append(sups[rule_part.string])
-                    elif rule_part.name == 'b': # sometimes stuff is bolded that should be included
-                        rule_parts.append(rule_part.string)
-                    # leave out anything else weird, for now
-            
-            rule_string = ''.join(rule_parts)
-            rules += parse_sound_change(rule_string, sound_change['id'], branch, sound_change.decode_contents())
-
-    print(f'Finished parsing {len(branches)} branches and {len(rules)} rules.')
+        with diagnostics.stage('section_parse'):
+            parsed = parse_section(section)
+        diagnostics.count('sections')
+        if parsed:
+            yield parsed
 
-    with open('./data/branches.json', 'w+') as branches_file:
-        branches_file.write(jsons.dumps(branches, { 'indent': 4, 'ensure_ascii': False }))
+def write_output(branches: list[Branch], rules: list[Rule], json_lines: bool = True) -> None:
+    """Write the parsed branches and rules to the data directory.
 
-    with open('./data/rules.json', 'w+') as rules_file:
-        rules_file.write(jsons.dumps(rules, { 'indent': 4, 'ensure_ascii': False }))
+    Pass json_lines=False if the JSON Lines were already written while parsing.
+    """
+    with diagnostics.stage('serialization'):
+        if json_lines:
+            from json_lines import write_json_lines
+            write_json_lines(branches, rules)
+        write_output_files(branches, rules)
 
+def write_output_files(branches: list[Branch], rules: list[Rule]) -> None:
     with open('./data/branches.pkl', 'wb+') as branches_file:
         pickle.dump(branches, branches_file)
 
     with open('./data/rules.pkl', 'wb+') as rules_file:
         pickle.dump(rules, rules_file)
 
+    import rule_store
+    rule_store.write_branches(branches)
+    rule_store.write_rules(rules)
+
+    from binary_store import write_binary_store
+    write_binary_store(branches, rules)
+
+def parse_sid(path: str = SID_PATH, streaming: bool = False, workers: int | None = 1, incremental: bool = False, cache_path: str = SECTION_CACHE_PATH) -> None:
+    """Parse the Searchable Index Diachronica and write the output."""
+    branches: list[Branch] = []
+    rules: list[Rule] = []
+
+    from json_lines import JsonLinesWriter
+
+    parsed = parse_sid_incremental(path, cache_path, workers) if incremental else iter_sid(path, streaming, workers)
+    # the JSON Lines are written as each section comes in, so they can be read before parsing finishes
+    with JsonLinesWriter() as json_lines_writer:
+        for (branch, branch_rules) in parsed:
+            branches.append(branch)
+            rules += branch_rules
+            with diagnostics.stage('serialization'):
+                json_lines_writer.write_section(branch, branch_rules)
+
+    diagnostics.count('branches', len(branches))
+    diagnostics.count('rules', len(rules))
+    print(f'Finished parsing {len(branches)} branches and {len(rules)} rules.')
+
+    write_output(branches, rules, json_lines=False)
+
 # So I can both run this individually AND import functions into my notebook
 if __name__ == '__main__':
-    parse_sid()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Parse the Searchable Index Diachronica.')
+    parser.add_argument('--streaming', action='store_true', help='parse the document one section at a time')
+    parser.add_argument('--incremental', action='store_true', help='only re-parse sections that changed since the last run')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (0 for one per core)')
+    diagnostics.add_arguments(parser)
+    args = parser.parse_args()
+
+    diagnostics.enable_from_arguments(parser, args)
+    parse_sid(streaming=args.streaming, workers=args.workers or None, incremental=args.incremental)
+    if args.report:
+        diagnostics.write_report(args.report)
\ No newline at end of file
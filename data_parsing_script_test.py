@@ -1,3 +1,5 @@
+import io
+import pickle
 from pytest_unordered import unordered
 import data_parsing_script as dps
 
@@ -5,82 +7,206 @@ def test_remove_combos():
   assert dps.remove_combos('abcabcabc', ((0, 1, 'a'), (6, 7, 'a'), (4, 6, 'bc'), (1, 2, 'b'))) == 'cabc'
 
 def test_handle_brackets_multiple():
-  assert dps.handle_brackets('{e,i}w{e,i}') == set(['ewe', 'iwe', 'ewi', 'iwi'])
+  assert dps.handle_brackets('{e,i}w{e,i}') == ('ewe', 'ewi', 'iwe', 'iwi')
 
 def test_handle_brackets_nested():
-  assert dps.handle_brackets('{e,w{æ,i}}') == set(['e', 'wæ', 'wi'])
+  assert dps.handle_brackets('{e,w{æ,i}}') == ('e', 'wæ', 'wi')
 
 def test_parse_basic_match():
-  assert dps.parse_rule_steps('z zː → j dʒː') == unordered([('z', [], 'j'), ('zː', [], 'dʒː')])
+  assert dps.parse_rule_steps('z zː → j dʒː') == unordered([('z', (), 'j'), ('zː', (), 'dʒː')])
 
 def test_parse_square_bracketed():
-  assert dps.parse_rule_steps('S → [+ voice]') == unordered([('S', [], '[+ voice]')])
+  assert dps.parse_rule_steps('S → [+ voice]') == unordered([('S', (), '[+ voice]')])
 
 def test_parse_stray_leading_dash():
-  assert dps.parse_rule_steps('— j w → i u') == unordered([('j', [], 'i'), ('w', [], 'u')])
+  assert dps.parse_rule_steps('— j w → i u') == unordered([('j', (), 'i'), ('w', (), 'u')])
 
 def test_parse_square_bracketed_modifier():
-  assert dps.parse_rule_steps('V[- high - long] → ∅') == unordered([('V[- high - long]', [], '∅')])
+  assert dps.parse_rule_steps('V[- high - long] → ∅') == unordered([('V[- high - long]', (), '∅')])
 
 def test_parse_curly_brackets():
-  assert dps.parse_rule_steps('{s3,ʒ} → ʃ') == unordered([('s3', [], 'ʃ'), ('ʒ', [], 'ʃ')])
+  assert dps.parse_rule_steps('{s3,ʒ} → ʃ') == unordered([('s3', (), 'ʃ'), ('ʒ', (), 'ʃ')])
 
 def test_parse_optional_step():
   parsed_change = dps.parse_sound_change('ew (→ øj) → yj', '', '')
   assert len(parsed_change) == 2
   assert parsed_change[0].from_sound == 'ew'
-  assert parsed_change[0].intermediate_steps == unordered(['øj'])
+  assert parsed_change[0].intermediate_steps == ('øj',)
   assert parsed_change[0].to_sound == 'yj'
   assert parsed_change[1].from_sound == 'ew'
-  assert parsed_change[1].intermediate_steps == unordered([])
+  assert parsed_change[1].intermediate_steps == ()
   assert parsed_change[1].to_sound == 'yj'
 
 def test_parse_optional_sounds():
   parsed_change = dps.parse_sound_change('(C)x(C) → (C)a(C)', '', '')
   change_tuples = [(rule.from_sound, rule.intermediate_steps, rule.to_sound) for rule in parsed_change]
-  assert change_tuples.count(('CxC', [], 'CaC'))
-  assert change_tuples.count(('CxC', [], 'Ca'))
-  assert change_tuples.count(('CxC', [], 'aC'))
-  assert change_tuples.count(('CxC', [], 'a'))
-  assert change_tuples.count(('Cx', [], 'CaC'))
-  assert change_tuples.count(('Cx', [], 'Ca'))
-  assert change_tuples.count(('Cx', [], 'aC'))
-  assert change_tuples.count(('Cx', [], 'a'))
-  assert change_tuples.count(('xC', [], 'CaC'))
-  assert change_tuples.count(('xC', [], 'Ca'))
-  assert change_tuples.count(('xC', [], 'aC'))
-  assert change_tuples.count(('xC', [], 'a'))
-  assert change_tuples.count(('x', [], 'CaC'))
-  assert change_tuples.count(('x', [], 'Ca'))
-  assert change_tuples.count(('x', [], 'aC'))
-  assert change_tuples.count(('x', [], 'a'))
+  assert change_tuples.count(('CxC', (), 'CaC'))
+  assert change_tuples.count(('CxC', (), 'Ca'))
+  assert change_tuples.count(('CxC', (), 'aC'))
+  assert change_tuples.count(('CxC', (), 'a'))
+  assert change_tuples.count(('Cx', (), 'CaC'))
+  assert change_tuples.count(('Cx', (), 'Ca'))
+  assert change_tuples.count(('Cx', (), 'aC'))
+  assert change_tuples.count(('Cx', (), 'a'))
+  assert change_tuples.count(('xC', (), 'CaC'))
+  assert change_tuples.count(('xC', (), 'Ca'))
+  assert change_tuples.count(('xC', (), 'aC'))
+  assert change_tuples.count(('xC', (), 'a'))
+  assert change_tuples.count(('x', (), 'CaC'))
+  assert change_tuples.count(('x', (), 'Ca'))
+  assert change_tuples.count(('x', (), 'aC'))
+  assert change_tuples.count(('x', (), 'a'))
 
 def test_parse_curly_bracket_to():
   parsed_change = dps.parse_sound_change('rdʒ → {rdʒ,rdz}', '', '')
   change_tuples = [(rule.from_sound, rule.intermediate_steps, rule.to_sound) for rule in parsed_change]
-  assert change_tuples.count(('rdʒ', [], 'rdʒ'))
-  assert change_tuples.count(('rdʒ', [], 'rdz'))
+  assert change_tuples.count(('rdʒ', (), 'rdʒ'))
+  assert change_tuples.count(('rdʒ', (), 'rdz'))
 
 def test_parse_extra_text():
   parsed_change = dps.parse_sound_change('d ɡ → t k (may have been part of a more sweeping merger; Firespeaker calls it “lenis-fortis”)', '', '')
   change_tuples = [(rule.from_sound, rule.intermediate_steps, rule.to_sound) for rule in parsed_change]
-  assert change_tuples.count(('d', [], 't'))
-  assert change_tuples.count(('ɡ', [], 'k'))
+  assert change_tuples.count(('d', (), 't'))
+  assert change_tuples.count(('ɡ', (), 'k'))
 
 def test_parse_ignore_backticked():
   parsed_change = dps.parse_sound_change('r → *L `(some sort of lateral?)` / occasionally', '', '')
   change_tuples = [(rule.from_sound, rule.intermediate_steps, rule.to_sound) for rule in parsed_change]
-  assert change_tuples.count(('r', [], '*L'))
+  assert change_tuples.count(('r', (), '*L'))
 
 def test_parse_partial_curly_bracket():
   parsed_change = dps.parse_sound_change('{æ,e}i → eː', '', '')
   change_tuples = [(rule.from_sound, rule.intermediate_steps, rule.to_sound) for rule in parsed_change]
-  assert change_tuples.count(('æi', [], 'eː'))
-  assert change_tuples.count(('ei', [], 'eː'))
+  assert change_tuples.count(('æi', (), 'eː'))
+  assert change_tuples.count(('ei', (), 'eː'))
 
 def test_parse_nested_curly_brackets():
   parsed_change = dps.parse_sound_change('{e,w{æ,i}} → ø', '', '')
   change_tuples = [(rule.from_sound, rule.intermediate_steps, rule.to_sound) for rule in parsed_change]
-  assert change_tuples.count(('e', [], 'ø'))
-  assert change_tuples.count(('wæ', [], 'ø'))
-  assert change_tuples.count(('wi', [], 'ø'))
\ No newline at end of file
+  assert change_tuples.count(('e', (), 'ø'))
+  assert change_tuples.count(('wæ', (), 'ø'))
+  assert change_tuples.count(('wi', (), 'ø'))
+
+def test_iter_section_markup():
+  html = '<body><section id="a"><p>x</p></section>\n<section id="b"></section></body>'
+  assert list(dps.iter_section_markup(io.StringIO(html), 4)) == ['<section id="a"><p>x</p></section>', '<section id="b"></section>']
+
+def test_iter_section_markup_commented():
+  html = '<!--<section id="a"></section>--><section id="b"><!-- </section> --></section>'
+  assert list(dps.iter_section_markup(io.StringIO(html), 3)) == ['<section id="b"><!-- </section> --></section>']
+
+SAMPLE_SID = '''<body>
+  <section class="showtarget" id="Proto-Omotic">
+    <h2>6.1 Proto-Afro-Asiatic to Proto-Omotic</h2>
+    <p><i>Mecislau</i>, from Ehret, Christopher (1995)</p>
+    <p class="schg" id="Proto-Omotic-dz-ʃ-tʃ">dz ʃ tʃ → ʒ s<sub>1</sub> s<sub>2</sub></p>
+    <p class="schg" id="Proto-Omotic-dʒ">dʒ → tʃ → ʃ</p>
+  </section>
+  <!--<section class="showtarget" id="rGyalrongic">
+    <h2>36.3.2 rGyalrongic</h2>
+  </section>-->
+  <section class="showtarget" id="North-Omotic">
+    <h2>6.1.1 Proto-Omotic to North Omotic</h2>
+    <p class="schg" id="North-Omotic-a">a(ː) → e(ː) / _{ʕ,q}$</p>
+  </section>
+</body>'''
+
+def parsed_tuples(parsed) -> list:
+  return [(branch.to_dict(), [rule.to_dict() for rule in rules]) for (branch, rules) in parsed]
+
+def test_iter_sid_modes_match(tmp_path):
+  sid_path = tmp_path / 'sid.html'
+  sid_path.write_text(SAMPLE_SID)
+  serial = parsed_tuples(dps.iter_sid(str(sid_path)))
+  assert [branch['id'] for (branch, _) in serial] == ['Proto-Omotic', 'North-Omotic']
+  assert serial == parsed_tuples(dps.iter_sid(str(sid_path), streaming=True))
+  assert serial == parsed_tuples(dps.iter_sid(str(sid_path), workers=2))
+
+PARITY_SCRIPT = '''
+import multiprocessing, pickle, sys
+import data_parsing_script as dps
+if __name__ == '__main__':
+  multiprocessing.set_start_method('spawn')
+  parsed = list(dps.parse_sid_parallel(sys.argv[1], 2, chunk_size=1) if sys.argv[2] == 'parallel' else dps.iter_sid(sys.argv[1]))
+  sys.stdout.buffer.write(pickle.dumps(parsed))
+'''
+
+def parse_in_subprocess(sid_path: str, mode: str, hash_seed: str) -> bytes:
+  import os
+  import subprocess
+  import sys
+  env = dict(os.environ, PYTHONHASHSEED=hash_seed)
+  return subprocess.run([sys.executable, '-c', PARITY_SCRIPT, sid_path, mode], capture_output=True, check=True, env=env, cwd=os.path.dirname(os.path.abspath(dps.__file__))).stdout
+
+def test_parse_sid_parallel_spawn_parity(tmp_path):
+  # alternatives used to come out in hash order, so each worker could order a section's rules differently
+  sid_path = tmp_path / 'sid.html'
+  sid_path.write_text(SAMPLE_SID.replace('dʒ → tʃ → ʃ', '{p,t,k,s,x,q} {b,d,g} → {f,θ,x,h,χ,ħ} {v,ð,ɣ} / _{ʕ,q}$'))
+  serial_bytes = parse_in_subprocess(str(sid_path), 'serial', '1')
+  serial = pickle.loads(serial_bytes)
+  for hash_seed in ('2', '3'):
+    parallel_bytes = parse_in_subprocess(str(sid_path), 'parallel', hash_seed)
+    parallel = pickle.loads(parallel_bytes)
+    assert len(parallel) == len(serial)
+    for ((serial_branch, serial_rules), (parallel_branch, parallel_rules)) in zip(serial, parallel):
+      assert parallel_branch.to_dict() == serial_branch.to_dict()
+      assert [rule.to_dict() for rule in parallel_rules] == [rule.to_dict() for rule in serial_rules]
+    # strings from the workers are interned again, so even the pickles match
+    assert parallel_bytes == serial_bytes
+
+def test_parse_sid_incremental(tmp_path, capsys):
+  sid_path = tmp_path / 'sid.html'
+  cache_path = str(tmp_path / 'section_cache.pkl')
+  sid_path.write_text(SAMPLE_SID)
+  assert parsed_tuples(dps.parse_sid_incremental(str(sid_path), cache_path)) == parsed_tuples(dps.iter_sid(str(sid_path)))
+  assert 'Re-parsed 2 of 2 sections.' in capsys.readouterr().out
+
+  sid_path.write_text(SAMPLE_SID.replace('a(ː) → e(ː)', 'a → e'))
+  incremental = parsed_tuples(dps.parse_sid_incremental(str(sid_path), cache_path))
+  assert 'Re-parsed 1 of 2 sections.' in capsys.readouterr().out
+  assert incremental == parsed_tuples(dps.iter_sid(str(sid_path)))
+
+def test_rule_pickle_round_trip():
+  rule = dps.parse_sound_change('dʒ → tʃ → ʃ / _#', 'Proto-Omotic-dʒ', None, 'dʒ → tʃ → ʃ / _#')[0]
+  assert not hasattr(rule, '__dict__')
+  assert pickle.loads(pickle.dumps(rule)).to_dict() == rule.to_dict()
+
+def test_rule_from_dict_pickle():
+  # rules.pkl was written when Rule was a plain class with a __dict__
+  rule = dps.Rule.__new__(dps.Rule)
+  rule.__setstate__({ 'id': 'r', 'from_sound': 'a', 'intermediate_steps': [], 'to_sound': 'e' })
+  assert rule.to_dict() == { 'id': 'r', 'from_sound': 'a', 'intermediate_steps': [], 'to_sound': 'e' }
+
+def test_expand_optionals_dedupes():
+  assert list(dps.expand_optionals('(C)(C)a')) == ['CCa', 'Ca', 'a']
+
+def test_expand_optionals_capped(capsys):
+  assert list(dps.expand_optionals('(a)(b)(c)', 3)) == ['abc', 'bc', 'ac']
+  assert 'capped expansion of 3 optionals at 3' in capsys.readouterr().out
+
+def test_handle_brackets_unbalanced():
+  # split_sounds can cut a bracketed group in half
+  assert dps.handle_brackets('{a,o') == ('a', 'o')
+  assert dps.handle_brackets('ɢʲʷ,ʁʲʷ}') == ('ɢʲʷ', 'ʁʲʷ')
+  # but a whole group can have an empty alternative
+  assert dps.handle_brackets('{,a,i') == ('a', 'i')
+  assert dps.handle_brackets('{,a}') == ('', 'a')
+
+def test_handle_brackets_deduped_in_order():
+  assert dps.handle_brackets('{i,e,i}{,a}') == ('i', 'ia', 'e', 'ea')
+  assert dps.handle_brackets('ʃ') == ('ʃ',)
+
+def test_handle_brackets_cached():
+  dps.handle_brackets.cache_clear()
+  dps.handle_brackets('{C,#}')
+  dps.handle_brackets('{C,#}')
+  assert dps.handle_brackets.cache_info().hits == 1
+  assert dps.handle_brackets.cache_info().misses == 1
+
+def test_import_is_lazy():
+  import os
+  import subprocess
+  import sys
+  script = 'import sys, data_parsing_script; print(sorted(m for m in ("bs4", "pandas", "pyarrow") if m in sys.modules))'
+  output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(dps.__file__))).stdout
+  assert output.strip() == '[]'
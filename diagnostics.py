@@ -0,0 +1,168 @@
+import contextlib
+import io
+import json
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import TYPE_CHECKING, Any, ContextManager
+
+# the profiler's modules take a while to import, so they're only imported when profiling
+if TYPE_CHECKING:
+    import cProfile
+
+# how many example messages to keep for each category of warning
+MAX_EXAMPLES = 5
+# how many functions/allocation sites to include from the profiler and tracemalloc
+PROFILE_TOP = 30
+
+NO_OP = contextlib.nullcontext()
+
+class StageTimer:
+    """Adds the wall and CPU time of a block to a stage's totals."""
+    __slots__ = ('totals', 'wall_start', 'cpu_start')
+
+    def __init__(self, totals: list[float]) -> None:
+        self.totals = totals
+
+    def __enter__(self) -> None:
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.totals[0] += 1
+        self.totals[1] += time.perf_counter() - self.wall_start
+        self.totals[2] += time.process_time() - self.cpu_start
+
+class Diagnostics:
+    """Counters, warnings, histograms and stage timings for a run, reported as JSON.
+
+    Disabled by default, in which case warnings are printed like they always were and everything else returns straight away.
+    Only covers the process it's in, so worker processes' stages and warnings aren't included.
+    """
+    enabled: bool
+    verbose: bool # print warnings as well as counting them
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.verbose = False
+        self.profiler: 'cProfile.Profile | None' = None
+        self.tracing_memory = False
+        self.reset()
+
+    def reset(self) -> None:
+        self.counters: Counter[str] = Counter()
+        self.warnings: Counter[str] = Counter()
+        self.examples: dict[str, list[str]] = defaultdict(list)
+        self.histograms: dict[str, Counter[int]] = defaultdict(Counter)
+        self.stages: dict[str, list[float]] = defaultdict(lambda: [0, 0.0, 0.0]) # calls, wall seconds, CPU seconds
+
+    def enable(self, profile: bool = False, trace_memory: bool = False, verbose: bool = False) -> None:
+        """Start recording, optionally with cProfile and tracemalloc running too (both of which slow everything down)."""
+        self.enabled = True
+        self.verbose = verbose
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing_memory = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        if self.profiler:
+            self.profiler.disable()
+        if self.tracing_memory:
+            tracemalloc.stop()
+            self.tracing_memory = False
+
+    def warn(self, category: str, message: str) -> None:
+        """Record a warning, e.g. a rule that couldn't be parsed."""
+        if not self.enabled:
+            print(message)
+            return
+        self.warnings[category] += 1
+        if len(self.examples[category]) < MAX_EXAMPLES:
+            self.examples[category].append(message)
+        if self.verbose:
+            print(message)
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        if self.enabled:
+            self.counters[counter] += amount
+
+    def observe(self, histogram: str, value: int) -> None:
+        """Add a value to a histogram, e.g. how many rules a rule string expanded to."""
+        if self.enabled:
+            self.histograms[histogram][value] += 1
+
+    def stage(self, name: str) -> ContextManager:
+        """Time a block as part of a stage. Stages can nest, e.g. rule parsing inside section parsing."""
+        if not self.enabled:
+            return NO_OP
+        return StageTimer(self.stages[name])
+
+    def profile_report(self) -> list[dict[str, Any]]:
+        if not self.profiler:
+            return []
+        import pstats
+        self.profiler.disable()
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        rows = []
+        for ((filename, line, function), (_, calls, total_time, cumulative_time, _)) in stats.stats.items():
+            rows.append({ 'function': f'{filename}:{line}({function})', 'calls': calls, 'total_seconds': total_time, 'cumulative_seconds': cumulative_time })
+        if self.enabled:
+            self.profiler.enable()
+        return sorted(rows, key=lambda row: -row['cumulative_seconds'])[:PROFILE_TOP]
+
+    def memory_report(self) -> dict[str, Any] | None:
+        if not self.tracing_memory:
+            return None
+        (current, peak) = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics('lineno')[:PROFILE_TOP]
+        return {
+            'current_bytes': current,
+            'peak_bytes': peak,
+            'top': [{ 'location': str(stat.traceback), 'bytes': stat.size, 'count': stat.count } for stat in top],
+        }
+
+    def report(self) -> dict[str, Any]:
+        """Everything recorded so far."""
+        return {
+            'counters': dict(self.counters),
+            'warnings': { category: { 'count': count, 'examples': self.examples[category] } for (category, count) in self.warnings.items() },
+            'histograms': { name: { str(value): count for (value, count) in sorted(histogram.items()) } for (name, histogram) in self.histograms.items() },
+            'stages': { name: { 'calls': int(calls), 'wall_seconds': wall, 'cpu_seconds': cpu } for (name, (calls, wall, cpu)) in self.stages.items() },
+            'profile': self.profile_report(),
+            'memory': self.memory_report(),
+        }
+
+    def write_report(self, path: str) -> None:
+        with open(path, 'w+') as report_file:
+            report_file.write(json.dumps(self.report(), indent=4, ensure_ascii=False))
+
+# One per process, so anything can record to it without passing it around
+DIAGNOSTICS = Diagnostics()
+
+enable = DIAGNOSTICS.enable
+disable = DIAGNOSTICS.disable
+reset = DIAGNOSTICS.reset
+warn = DIAGNOSTICS.warn
+count = DIAGNOSTICS.count
+observe = DIAGNOSTICS.observe
+stage = DIAGNOSTICS.stage
+report = DIAGNOSTICS.report
+write_report = DIAGNOSTICS.write_report
+
+def add_arguments(parser) -> None:
+    """Add the --report, --profile and --trace-memory options to a script's argument parser."""
+    parser.add_argument('--report', help='write a JSON report of warnings, counters and stage timings here')
+    parser.add_argument('--profile', action='store_true', help='include cProfile results in the report')
+    parser.add_argument('--trace-memory', action='store_true', help='include tracemalloc results in the report')
+
+def enable_from_arguments(parser, args) -> None:
+    """Turn diagnostics on if --report was given. --profile and --trace-memory only go in the report, so they need it."""
+    if (args.profile or args.trace_memory) and not args.report:
+        parser.error('--profile and --trace-memory need --report')
+    if args.report:
+        enable(profile=args.profile, trace_memory=args.trace_memory)
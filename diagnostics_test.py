@@ -0,0 +1,81 @@
+import argparse
+import json
+
+import pytest
+
+import diagnostics
+from diagnostics import Diagnostics
+from data_parsing_script import parse_sound_change
+
+def test_disabled_prints_warnings(capsys):
+  recorder = Diagnostics()
+  recorder.warn('bad_header', 'Section header "x" doesn\'t match format, skipping')
+  recorder.count('rules')
+  with recorder.stage('section_parse'):
+    pass
+  assert 'doesn\'t match format' in capsys.readouterr().out
+  report = recorder.report()
+  assert report['warnings'] == {}
+  assert report['counters'] == {}
+  assert report['stages'] == {}
+
+def test_enabled_counts_warnings(capsys):
+  recorder = Diagnostics()
+  recorder.enable()
+  for index in range(diagnostics.MAX_EXAMPLES + 2):
+    recorder.warn('too_few_steps', f'Too few steps in rule: {index} - skipping')
+  assert capsys.readouterr().out == ''
+  warnings = recorder.report()['warnings']['too_few_steps']
+  assert warnings['count'] == diagnostics.MAX_EXAMPLES + 2
+  assert len(warnings['examples']) == diagnostics.MAX_EXAMPLES
+
+def test_stages_and_histograms():
+  recorder = Diagnostics()
+  recorder.enable()
+  for _ in range(3):
+    with recorder.stage('rule_parse'):
+      sum(range(1000))
+  recorder.observe('expansions_per_rule', 2)
+  recorder.observe('expansions_per_rule', 2)
+  recorder.observe('expansions_per_rule', 1)
+  report = recorder.report()
+  assert report['stages']['rule_parse']['calls'] == 3
+  assert report['stages']['rule_parse']['wall_seconds'] > 0
+  assert report['histograms'] == { 'expansions_per_rule': { '1': 1, '2': 2 } }
+  assert report['profile'] == []
+  assert report['memory'] is None
+
+def test_profile_and_memory():
+  recorder = Diagnostics()
+  recorder.enable(profile=True, trace_memory=True)
+  try:
+    [str(number) for number in range(1000)]
+    report = recorder.report()
+  finally:
+    recorder.disable()
+  assert report['profile']
+  assert report['memory']['peak_bytes'] > 0
+
+def test_profile_needs_report():
+  parser = argparse.ArgumentParser()
+  diagnostics.add_arguments(parser)
+  with pytest.raises(SystemExit):
+    diagnostics.enable_from_arguments(parser, parser.parse_args(['--profile']))
+  diagnostics.enable_from_arguments(parser, parser.parse_args([]))
+  assert not diagnostics.DIAGNOSTICS.enabled
+
+def test_parser_records_to_report(tmp_path):
+  diagnostics.reset()
+  diagnostics.enable()
+  try:
+    parse_sound_change('a(ː) → e(ː)', 'rule')
+    parse_sound_change('a', 'too-few')
+    report_path = tmp_path / 'report.json'
+    diagnostics.write_report(str(report_path))
+  finally:
+    diagnostics.disable()
+    diagnostics.reset()
+  report = json.loads(report_path.read_text())
+  assert report['stages']['rule_parse']['calls'] == 2
+  assert report['histograms']['expansions_per_rule'] == { '0': 1, '4': 1 }
+  assert report['warnings']['too_few_steps']['count'] == 1
@@ -0,0 +1,302 @@
+import functools
+import re
+import unicodedata as ud
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Iterable, NamedTuple, Union
+
+import rule_syntax
+from rule_store import RULES_PARQUET_PATH, read_rules
+
+VOWEL_CHANGES_PATH = './data/vowel_changes.pkl'
+
+# how many distinct query strings to remember the parses of
+QUERY_CACHE_SIZE = 1024
+
+QUERY_TOKEN = re.compile(r'\s*(?:(\()|(\))|(!=|<=|>=|=|<|>)|"([^"]*)"|([^\s()=!<>"]+))')
+
+class Comparison(NamedTuple):
+    """A single condition of a query, e.g. after_place=velar or height_change>0."""
+    field: str
+    op: str
+    value: str
+
+class And(NamedTuple):
+    parts: tuple['Query', ...]
+
+class Or(NamedTuple):
+    parts: tuple['Query', ...]
+
+class Not(NamedTuple):
+    part: 'Query'
+
+Query = Union[Comparison, And, Or, Not]
+
+def tokenize_query(text: str) -> list[tuple[str, str]]:
+    """Split a query into (kind, text) tokens, where kind is one of '(', ')', 'op', 'word' or 'quoted'."""
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = QUERY_TOKEN.match(text, position)
+        if not match:
+            raise ValueError(f'Unexpected character at {position} in query: {text}')
+        (open_paren, close_paren, op, quoted, word) = match.groups()
+        if open_paren:
+            tokens.append(('(', open_paren))
+        elif close_paren:
+            tokens.append((')', close_paren))
+        elif op:
+            tokens.append(('op', op))
+        elif quoted is not None:
+            tokens.append(('quoted', quoted))
+        else:
+            tokens.append(('word', word))
+        position = match.end()
+
+    return tokens
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def parse_query(text: str) -> Query:
+    """Parse a query like 'from_backness=front and backness_change>0 and (after_place=velar or after_place=uvular)'.
+
+    Conditions are field=value, field!=value or a numeric comparison (<, <=, >, >=), combined with and, or, not and
+    parentheses. Quote values with spaces or brackets in them, e.g. environment="_(C)#".
+    """
+    tokens = tokenize_query(text)
+    position = 0
+
+    def peek_keyword() -> str | None:
+        if position < len(tokens) and tokens[position][0] == 'word':
+            return tokens[position][1].lower()
+        return None
+
+    def expect(kind: str) -> str:
+        nonlocal position
+        if position >= len(tokens) or tokens[position][0] != kind:
+            found = tokens[position][1] if position < len(tokens) else 'the end'
+            raise ValueError(f'Expected {kind} but found {found} in query: {text}')
+        position += 1
+        return tokens[position - 1][1]
+
+    def parse_or() -> Query:
+        nonlocal position
+        parts = [parse_and()]
+        while peek_keyword() == 'or':
+            position += 1
+            parts.append(parse_and())
+        return parts[0] if len(parts) == 1 else Or(tuple(parts))
+
+    def parse_and() -> Query:
+        nonlocal position
+        parts = [parse_not()]
+        while peek_keyword() == 'and':
+            position += 1
+            parts.append(parse_not())
+        return parts[0] if len(parts) == 1 else And(tuple(parts))
+
+    def parse_not() -> Query:
+        nonlocal position
+        if peek_keyword() == 'not':
+            position += 1
+            return Not(parse_not())
+        if position < len(tokens) and tokens[position][0] == '(':
+            position += 1
+            query = parse_or()
+            expect(')')
+            return query
+        field = expect('word')
+        op = expect('op')
+        if position < len(tokens) and tokens[position][0] == 'quoted':
+            value = expect('quoted')
+        else:
+            value = expect('word')
+        return Comparison(field, op, value)
+
+    query = parse_or()
+    if position != len(tokens):
+        raise ValueError(f'Unexpected {tokens[position][1]} in query: {text}')
+    return query
+
+def branch_ancestors(branch_index: str) -> tuple[str, ...]:
+    """A branch index and the indices of all the branches above it, e.g. 6.1.2 -> 6, 6.1, 6.1.2."""
+    if not branch_index:
+        return ()
+    parts = branch_index.split('.')
+    return tuple('.'.join(parts[:depth]) for depth in range(1, len(parts) + 1))
+
+def split_segments(text: str) -> list[str]:
+    """Split a string into segments, keeping combining diacritics and modifier letters with the character before them."""
+    segments: list[str] = []
+    for character in text:
+        if segments and (ud.combining(character) or ud.category(character) in ('Lm', 'Sk')):
+            segments[-1] += character
+        elif not character.isspace():
+            segments.append(character)
+    return segments
+
+@functools.lru_cache(maxsize=rule_syntax.RULE_CACHE_SIZE)
+def environment_tokens(environment: str) -> tuple[str, ...]:
+    """The distinct segments and symbols (like '#' and '_') in any expansion of an environment."""
+    tokens: dict[str, None] = {}
+    for expansion in rule_syntax.parse_environment(environment).expansions():
+        tokens.update(dict.fromkeys(split_segments(expansion)))
+    return tuple(tokens)
+
+def map_distinct(values: pd.Series, func: Callable[[Any], Any]) -> list:
+    """Apply func once to each distinct value of a column, giving None for missing values."""
+    (codes, uniques) = pd.factorize(values)
+    mapped = [func(value) for value in uniques] + [None]
+    return [mapped[code] for code in codes]
+
+class FeatureIndex:
+    """An inverted index from the values of some columns of a table to the (sorted) positions of the rows with them.
+
+    Exact fields have one value per row, multi-valued fields an iterable of them (e.g. every environment token), and
+    numeric fields are kept sorted for range queries.
+    """
+    df: pd.DataFrame
+    postings: dict[str, dict[Any, np.ndarray]]
+    numeric: dict[str, tuple[np.ndarray, np.ndarray]] # field -> (sorted values, their row positions)
+
+    def __init__(self, df: pd.DataFrame, exact_fields: Iterable[str] = (), multi_fields: dict[str, Iterable] = {}, numeric_fields: Iterable[str] = ()) -> None:
+        self.df = df
+        self.all_rows = np.arange(len(df))
+        self.postings = {}
+        for field in exact_fields:
+            self.postings[field] = build_postings(np.arange(len(df)), df[field])
+        for (field, values) in multi_fields.items():
+            exploded = pd.Series(list(values), dtype=object).explode().dropna()
+            exploded = exploded[~pd.DataFrame({ 'row': exploded.index, 'value': exploded.to_numpy() }).duplicated().to_numpy()]
+            self.postings[field] = build_postings(exploded.index.to_numpy(), exploded)
+
+        self.numeric = {}
+        for field in numeric_fields:
+            values = df[field].to_numpy(dtype=float)
+            rows = np.flatnonzero(~np.isnan(values))
+            order = np.argsort(values[rows], kind='stable')
+            self.numeric[field] = (values[rows][order], rows[order])
+
+    @classmethod
+    def from_rules(cls, rules_df: pd.DataFrame) -> 'FeatureIndex':
+        """Index rules by their sounds, environment and branch.
+
+        branch matches a branch and everything under it, env_token any segment in the environment and step any intermediate step.
+        """
+        return cls(
+            rules_df,
+            exact_fields=['id', 'branch_id', 'branch_index', 'from_sound', 'to_sound', 'environment'],
+            multi_fields={
+                'branch': map_distinct(rules_df['branch_index'], branch_ancestors),
+                'env_token': map_distinct(rules_df['environment'], environment_tokens),
+                'step': rules_df['intermediate_steps'],
+            },
+        )
+
+    @classmethod
+    def from_vowel_changes(cls, vowel_changes_df: pd.DataFrame) -> 'FeatureIndex':
+        """Index vowel changes by their segments, consonant and vowel features, change metrics and parent branch."""
+        from vowel_change_schema import MODIFIER_COLUMNS, add_change_metrics, to_categorical
+
+        if 'height_change' not in vowel_changes_df:
+            vowel_changes_df = add_change_metrics(to_categorical(vowel_changes_df))
+        modifier_columns = set(MODIFIER_COLUMNS + ['added_modifiers', 'removed_modifiers'])
+        numeric_fields = [col for col in vowel_changes_df if col.endswith('_change')]
+        exact_fields = [col for col in vowel_changes_df if col not in modifier_columns and col not in numeric_fields]
+        multi_fields = { col: vowel_changes_df[col] for col in vowel_changes_df if col in modifier_columns }
+        multi_fields['branch'] = map_distinct(vowel_changes_df['parent_index'], branch_ancestors)
+        return cls(vowel_changes_df, exact_fields, multi_fields, numeric_fields)
+
+    def fields(self) -> list[str]:
+        return list(self.postings) + list(self.numeric)
+
+    def lookup(self, field: str, value: Any) -> np.ndarray:
+        """The positions of the rows where field has value."""
+        if field in self.postings:
+            postings = self.postings[field]
+            if value in postings:
+                return postings[value]
+            if isinstance(value, str):
+                return postings.get(parse_literal(value), EMPTY)
+            return EMPTY
+        if field in self.numeric:
+            return self.range(field, float(value), float(value))
+        raise ValueError(f'Unknown field: {field}')
+
+    def range(self, field: str, low: float = -np.inf, high: float = np.inf, include_low: bool = True, include_high: bool = True) -> np.ndarray:
+        """The positions of the rows where a numeric field is between low and high."""
+        if field not in self.numeric:
+            raise ValueError(f'Not a numeric field: {field}')
+        (values, rows) = self.numeric[field]
+        start = np.searchsorted(values, low, side='left' if include_low else 'right')
+        end = np.searchsorted(values, high, side='right' if include_high else 'left')
+        return np.sort(rows[start:end])
+
+    def evaluate(self, query: Query) -> np.ndarray:
+        """The sorted positions of the rows matching a parsed query."""
+        if isinstance(query, And):
+            # intersect the smallest first, so the rest have less to get through
+            results = sorted((self.evaluate(part) for part in query.parts), key=len)
+            return functools.reduce(lambda rows, part: np.intersect1d(rows, part, assume_unique=True), results)
+        if isinstance(query, Or):
+            return functools.reduce(np.union1d, (self.evaluate(part) for part in query.parts))
+        if isinstance(query, Not):
+            return np.setdiff1d(self.all_rows, self.evaluate(query.part), assume_unique=True)
+
+        (field, op, value) = query
+        if op == '=':
+            return self.lookup(field, value)
+        if op == '!=':
+            return np.setdiff1d(self.all_rows, self.lookup(field, value), assume_unique=True)
+        number = float(value)
+        if op == '<':
+            return self.range(field, high=number, include_high=False)
+        if op == '<=':
+            return self.range(field, high=number)
+        if op == '>':
+            return self.range(field, low=number, include_low=False)
+        return self.range(field, low=number)
+
+    def query(self, text: str) -> np.ndarray:
+        """The sorted positions of the rows matching a query string (see parse_query)."""
+        return self.evaluate(parse_query(text))
+
+    def count(self, text: str) -> int:
+        return len(self.query(text))
+
+    def select(self, text: str) -> pd.DataFrame:
+        """The rows matching a query string."""
+        return self.df.iloc[self.query(text)]
+
+EMPTY = np.array([], dtype=np.int64)
+
+def parse_literal(value: str) -> Any:
+    """Turn the text of a query value into the bool or number it stands for, if it is one."""
+    lowered = value.lower()
+    if lowered in ('true', 'false'):
+        return lowered == 'true'
+    if lowered in ('none', 'null'):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def build_postings(rows: np.ndarray, values: pd.Series) -> dict[Any, np.ndarray]:
+    """Group row positions by value, keeping each group's positions sorted."""
+    (codes, uniques) = pd.factorize(values)
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    # missing values have the code -1, so they're sorted first
+    start = int((codes < 0).sum())
+    postings = {}
+    for (value, count) in zip(uniques, counts):
+        postings[value] = rows[order[start:start + count]].astype(np.int64)
+        start += count
+    return postings
+
+def load_rule_index(path: str = RULES_PARQUET_PATH) -> FeatureIndex:
+    return FeatureIndex.from_rules(read_rules(path))
+
+def load_vowel_change_index(path: str = VOWEL_CHANGES_PATH) -> FeatureIndex:
+    return FeatureIndex.from_vowel_changes(pd.read_pickle(path))
@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+import data_parsing_script as dps
+import feature_index as fi
+from rule_store import objects_to_table, RULE_SCHEMA
+
+def rule_index() -> fi.FeatureIndex:
+  branch_a = dps.Branch.from_dict({ 'id': 'A', 'index': '6.1', 'name': 'A', 'source': '' })
+  branch_b = dps.Branch.from_dict({ 'id': 'B', 'index': '6.2.1', 'name': 'B', 'source': '' })
+  rules = dps.parse_sound_change('a(ː) → e / _{k,q}#', 'A-a', branch_a, '')
+  rules += dps.parse_sound_change('e → i → ∅ / #C_', 'B-e', branch_b, '')
+  rules_df = objects_to_table(rules, RULE_SCHEMA).to_pandas()
+  return fi.FeatureIndex.from_rules(rules_df)
+
+def test_parse_query():
+  query = fi.parse_query('from_sound=a and not (env_token=k or environment="_(C)#")')
+  assert query == fi.And((
+    fi.Comparison('from_sound', '=', 'a'),
+    fi.Not(fi.Or((fi.Comparison('env_token', '=', 'k'), fi.Comparison('environment', '=', '_(C)#')))),
+  ))
+  with pytest.raises(ValueError):
+    fi.parse_query('from_sound=a and')
+
+def test_rule_queries():
+  index = rule_index()
+  assert list(index.select('from_sound=a')['from_sound']) == ['a']
+  assert index.count('env_token=q') == 2
+  assert index.count('branch=6') == 3
+  assert index.count('branch=6.2') == 1
+  assert list(index.query('env_token=# and not branch=6.1')) == [2]
+  assert index.count('step=i or to_sound=e') == 3
+  assert index.count('from_sound!=e') == 2
+
+def test_numeric_queries():
+  df = pd.DataFrame({ 'after_place': ['velar', 'velar', 'dental', None], 'backness_change': [1.0, -1.0, 2.0, None] })
+  index = fi.FeatureIndex(df, exact_fields=['after_place'], numeric_fields=['backness_change'])
+  assert list(index.query('backness_change>0')) == [0, 2]
+  assert list(index.query('backness_change>=-1 and after_place=velar')) == [0, 1]
+  assert list(index.query('backness_change=2')) == [2]
+  with pytest.raises(ValueError):
+    index.query('height_change>0')
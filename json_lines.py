@@ -0,0 +1,91 @@
+import json
+from json.encoder import encode_basestring
+from typing import Any, Callable, Iterable, Iterator, TextIO, TypeVar
+
+from data_parsing_script import Branch, Record, Rule
+
+BRANCHES_JSONL_PATH = './data/branches.jsonl'
+RULES_JSONL_PATH = './data/rules.jsonl'
+
+RecordType = TypeVar('RecordType', bound=Record)
+
+def encode_value(value: Any) -> str:
+    """Encode a field the same way json.dumps(..., ensure_ascii=False) would, for the types records hold."""
+    if isinstance(value, str):
+        return encode_basestring(value)
+    if value is None:
+        return 'null'
+    if isinstance(value, (tuple, list)):
+        return '[' + ', '.join(encode_value(item) for item in value) + ']'
+    return json.dumps(value, ensure_ascii=False)
+
+def record_encoder(record_class: type[Record]) -> Callable[[Record], str]:
+    """Make an encoder for one kind of record, which knows its fields up front rather than walking each object.
+
+    Its output is the same as json.dumps(record.to_dict(), sort_keys=True, ensure_ascii=False).
+    """
+    fields = [(name, f'{encode_basestring(name)}: ') for name in sorted(record_class.__slots__)]
+
+    def encode(record: Record) -> str:
+        parts = []
+        for (name, key) in fields:
+            value = getattr(record, name, encode)
+            # encode stands in for an unset field, which to_dict leaves out
+            if value is not encode:
+                parts.append(key + encode_value(value))
+        return '{' + ', '.join(parts) + '}'
+
+    return encode
+
+encode_rule = record_encoder(Rule)
+encode_branch = record_encoder(Branch)
+
+class JsonLinesWriter:
+    """Writes branches and rules as JSON Lines, one record per line, as each section is parsed."""
+
+    def __init__(self, branches_path: str = BRANCHES_JSONL_PATH, rules_path: str = RULES_JSONL_PATH) -> None:
+        self.branches_file: TextIO = open(branches_path, 'w+', encoding='utf-8')
+        self.rules_file: TextIO = open(rules_path, 'w+', encoding='utf-8')
+
+    def write_branch(self, branch: Branch) -> None:
+        self.branches_file.write(encode_branch(branch) + '\n')
+
+    def write_rules(self, rules: Iterable[Rule]) -> None:
+        self.rules_file.writelines(encode_rule(rule) + '\n' for rule in rules)
+
+    def write_section(self, branch: Branch, rules: Iterable[Rule]) -> None:
+        self.write_branch(branch)
+        self.write_rules(rules)
+
+    def close(self) -> None:
+        self.branches_file.close()
+        self.rules_file.close()
+
+    def __enter__(self) -> 'JsonLinesWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def write_json_lines(branches: list[Branch], rules: list[Rule], branches_path: str = BRANCHES_JSONL_PATH, rules_path: str = RULES_JSONL_PATH) -> None:
+    """Write already parsed branches and rules as JSON Lines."""
+    with JsonLinesWriter(branches_path, rules_path) as writer:
+        for branch in branches:
+            writer.write_branch(branch)
+        writer.write_rules(rules)
+
+def read_json_lines(path: str, record_class: type[RecordType]) -> Iterator[RecordType]:
+    """Read records back a line at a time, so a file can be read while it's still being written."""
+    with open(path, encoding='utf-8') as records_file:
+        for line in records_file:
+            if not line.strip():
+                continue
+            fields = json.loads(line)
+            # lists are only ever intermediate steps, which the parser makes tuples
+            yield record_class.from_dict({ name: tuple(value) if isinstance(value, list) else value for (name, value) in fields.items() })
+
+def read_rules(path: str = RULES_JSONL_PATH) -> Iterator[Rule]:
+    return read_json_lines(path, Rule)
+
+def read_branches(path: str = BRANCHES_JSONL_PATH) -> Iterator[Branch]:
+    return read_json_lines(path, Branch)
@@ -0,0 +1,32 @@
+import json
+import data_parsing_script as dps
+import json_lines
+
+def test_encoder_matches_json_dumps():
+  branch = dps.Branch.from_dict({ 'id': 'Proto-Omotic', 'index': '6.1', 'name': 'Proto-Omotic to "Proto-Afro-Asiatic"' })
+  rules = dps.parse_sound_change('dʒ → tʃ → ʃ / _#', 'Proto-Omotic-dʒ', branch, 'dʒ → tʃ → ʃ / _#')
+  rules += dps.parse_sound_change('a → b', 'rule', None, 'a\tb')
+  for rule in rules:
+    assert json_lines.encode_rule(rule) == json.dumps(rule.to_dict(), sort_keys=True, ensure_ascii=False)
+  assert json_lines.encode_branch(branch) == json.dumps(branch.to_dict(), sort_keys=True, ensure_ascii=False)
+  assert 'source' not in json.loads(json_lines.encode_branch(branch))
+
+def test_round_trip(tmp_path):
+  branch = dps.Branch.from_dict({ 'id': 'Proto-Omotic', 'index': '6.1', 'name': 'Proto-Omotic', 'source': 'Ehret' })
+  rules = dps.parse_sound_change('{e,i} → a → o', 'Proto-Omotic-e', branch, '{e,i} → a → o')
+  (branches_path, rules_path) = (str(tmp_path / 'branches.jsonl'), str(tmp_path / 'rules.jsonl'))
+  with json_lines.JsonLinesWriter(branches_path, rules_path) as writer:
+    writer.write_section(branch, rules)
+  assert (tmp_path / 'rules.jsonl').read_text().count('\n') == len(rules)
+  read_rules = list(json_lines.read_rules(rules_path))
+  assert [rule.to_dict() for rule in read_rules] == [rule.to_dict() for rule in rules]
+  assert read_rules[0].intermediate_steps == ('a',)
+  assert [branch.to_dict() for branch in json_lines.read_branches(branches_path)] == [branch.to_dict()]
+
+def test_reads_while_writing(tmp_path):
+  (branches_path, rules_path) = (str(tmp_path / 'branches.jsonl'), str(tmp_path / 'rules.jsonl'))
+  writer = json_lines.JsonLinesWriter(branches_path, rules_path)
+  writer.write_rules(dps.parse_sound_change('a → b', 'rule', None, 'a → b'))
+  writer.rules_file.flush()
+  assert [rule.from_sound for rule in json_lines.read_rules(rules_path)] == ['a']
+  writer.close()
@@ -0,0 +1,182 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Callable, NamedTuple
+
+PIPELINE_CACHE_DIR = './data/pipeline_cache'
+MANIFEST_PATH = f'{PIPELINE_CACHE_DIR}/manifest.json'
+
+SID_PATH = './data/sid-tidy-with-edits.html'
+VOWEL_CHANGES_PATH = './data/vowel_changes.pkl'
+CONSONANT_CHANGES_PATH = './data/consonant_changes.pkl'
+# written by the pipeline, like the rest of its cache, rather than checked in
+CHANGE_STATS_PATH = f'{PIPELINE_CACHE_DIR}/change_stats.json'
+
+CONSONANT_ATTS = ['before_place', 'after_place', 'before_manner', 'after_manner', 'before_voicing', 'after_voicing']
+NUMERIC_VOWEL_COLS = ['height_change', 'backness_change', 'roundness_change', 'length_change']
+
+class Stage(NamedTuple):
+    """A step of the pipeline, which is skipped when its inputs, code and parameters haven't changed."""
+    name: str
+    inputs: list[str]
+    code: list[str] # modules whose source the output depends on
+    outputs: list[str]
+    run: Callable[[dict[str, Any]], None]
+    upstream: str | None
+
+def run_parse(params: dict[str, Any]) -> None:
+    from data_parsing_script import parse_sid
+    parse_sid(SID_PATH, streaming=params['streaming'], workers=params['workers'])
+
+def run_extract(params: dict[str, Any]) -> None:
+    from vowel_changes import run_extraction
+    run_extraction(workers=params['workers'])
+
+def run_stats(params: dict[str, Any]) -> None:
+    import pandas as pd
+    from complement_stats import t_tests_vs_complement
+    from vowel_change_schema import add_change_metrics
+
+    vowel_changes_df = add_change_metrics(pd.read_pickle(VOWEL_CHANGES_PATH))
+    change_stats = {}
+    for consonant_att in CONSONANT_ATTS:
+        (t_stats, p_vals) = t_tests_vs_complement(vowel_changes_df, consonant_att, NUMERIC_VOWEL_COLS)
+        change_stats[consonant_att] = {
+            't_statistic': json.loads(t_stats.to_json(orient='index')),
+            'p_value': json.loads(p_vals.to_json(orient='index')),
+        }
+
+    os.makedirs(os.path.dirname(CHANGE_STATS_PATH), exist_ok=True)
+    with open(CHANGE_STATS_PATH, 'w+') as change_stats_file:
+        change_stats_file.write(json.dumps(change_stats, indent=4, ensure_ascii=False))
+
+# the parser's modules, which the extraction imports too (for the Rule records and rule_syntax)
+PARSE_CODE = ['data_parsing_script.py', 'rule_syntax.py', 'rule_store.py', 'binary_store.py', 'json_lines.py', 'diagnostics.py']
+
+STAGES = {
+    'parse': Stage(
+        'parse',
+        [SID_PATH],
+        PARSE_CODE,
+        ['./data/branches.jsonl', './data/rules.jsonl', './data/branches.pkl', './data/rules.pkl', './data/branches.parquet', './data/rules.parquet', './data/rules.bin'],
+        run_parse,
+        None,
+    ),
+    'extract': Stage(
+        'extract',
+        ['./data/rules.parquet', './data/abbreviations.json'],
+        ['vowel_changes.py', 'vowel_change_schema.py', 'bounded_cache.py', 'branch_tree.py'] + PARSE_CODE,
+        [VOWEL_CHANGES_PATH, CONSONANT_CHANGES_PATH],
+        run_extract,
+        'parse',
+    ),
+    'stats': Stage(
+        'stats',
+        [VOWEL_CHANGES_PATH],
+        ['complement_stats.py', 'vowel_change_schema.py'],
+        [CHANGE_STATS_PATH],
+        run_stats,
+        'extract',
+    ),
+}
+
+# parameters that change a stage's output, so are part of its key. The rest (e.g. workers) only change how it's made
+OUTPUT_PARAMS = { 'parse': [], 'extract': [], 'stats': [] }
+
+class Manifest:
+    """What the pipeline knows about the files it has hashed and the stages it has run, kept between runs."""
+    files: dict[str, list] # path -> [size, mtime_ns, sha256]
+    stages: dict[str, dict[str, Any]] # stage -> { key, outputs: { path: sha256 } }
+
+    def __init__(self, path: str = MANIFEST_PATH) -> None:
+        self.path = path
+        try:
+            with open(path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            manifest = {}
+        self.files = manifest.get('files', {})
+        self.stages = manifest.get('stages', {})
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w+') as manifest_file:
+            json.dump({ 'files': self.files, 'stages': self.stages }, manifest_file, indent=4)
+
+    def file_hash(self, path: str) -> str | None:
+        """The sha256 of a file's contents, None if it doesn't exist. Only re-hashed if its size or mtime changed."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        known = self.files.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as hashed_file:
+            for chunk in iter(lambda: hashed_file.read(1 << 20), b''):
+                digest.update(chunk)
+        self.files[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+def code_path(module: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), module)
+
+def stage_key(stage: Stage, params: dict[str, Any], manifest: Manifest) -> str:
+    """A hash of everything a stage's output depends on: its inputs, its code and the parameters that affect it."""
+    key = {
+        'stage': stage.name,
+        'inputs': { path: manifest.file_hash(path) for path in stage.inputs },
+        'code': { module: manifest.file_hash(code_path(module)) for module in stage.code },
+        'params': { name: params[name] for name in OUTPUT_PARAMS[stage.name] },
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def artifact_dir(key: str) -> str:
+    return os.path.join(PIPELINE_CACHE_DIR, key)
+
+def run_stage(name: str, params: dict[str, Any], manifest: Manifest, force: bool = False) -> str:
+    """Bring a stage's outputs up to date, running its upstream stages first.
+
+    Returns 'up to date' if they already were, 'restored' if they were copied from a cached run with the same key, or 'ran'.
+    """
+    stage = STAGES[name]
+    if stage.upstream:
+        print(f'{stage.upstream}: {run_stage(stage.upstream, params, manifest, force)}')
+
+    key = stage_key(stage, params, manifest)
+    recorded = manifest.stages.get(name)
+    if not force and recorded and recorded['key'] == key and all(manifest.file_hash(path) == recorded['outputs'].get(path) for path in stage.outputs):
+        return 'up to date'
+
+    cached = artifact_dir(key)
+    if not force and all(os.path.exists(os.path.join(cached, os.path.basename(path))) for path in stage.outputs):
+        for path in stage.outputs:
+            shutil.copy2(os.path.join(cached, os.path.basename(path)), path)
+        result = 'restored'
+    else:
+        stage.run(params)
+        os.makedirs(cached, exist_ok=True)
+        for path in stage.outputs:
+            shutil.copy2(path, os.path.join(cached, os.path.basename(path)))
+        result = 'ran'
+
+    manifest.stages[name] = { 'key': key, 'outputs': { path: manifest.file_hash(path) for path in stage.outputs } }
+    manifest.save()
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the parsing, extraction and statistics pipeline, skipping stages that are up to date.')
+    parser.add_argument('stage', choices=list(STAGES), help='stage to bring up to date, along with the stages before it')
+    parser.add_argument('--force', action='store_true', help='run the stages even if they are up to date')
+    parser.add_argument('--streaming', action='store_true', help='parse the document one section at a time')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (0 for one per core)')
+    args = parser.parse_args()
+
+    manifest = Manifest()
+    params = { 'streaming': args.streaming, 'workers': args.workers or None }
+    print(f'{args.stage}: {run_stage(args.stage, params, manifest, args.force)}')
+    manifest.save()
@@ -0,0 +1,46 @@
+import ast
+import os
+import pipeline
+
+def test_run_stage_skips_and_restores(tmp_path, monkeypatch):
+  monkeypatch.setattr(pipeline, 'PIPELINE_CACHE_DIR', str(tmp_path / 'cache'))
+  source = tmp_path / 'source.txt'
+  output = tmp_path / 'output.txt'
+  runs = []
+
+  def run_copy(params):
+    runs.append(params)
+    output.write_text(source.read_text().upper())
+
+  monkeypatch.setitem(pipeline.STAGES, 'copy', pipeline.Stage('copy', [str(source)], ['pipeline.py'], [str(output)], run_copy, None))
+  monkeypatch.setitem(pipeline.OUTPUT_PARAMS, 'copy', [])
+  manifest = pipeline.Manifest(str(tmp_path / 'cache' / 'manifest.json'))
+
+  source.write_text('a')
+  assert pipeline.run_stage('copy', {}, manifest) == 'ran'
+  assert pipeline.run_stage('copy', {}, manifest) == 'up to date'
+
+  source.write_text('b')
+  assert pipeline.run_stage('copy', {}, manifest) == 'ran'
+  assert output.read_text() == 'B'
+
+  # back to an input it's seen before, so the old output is reused
+  source.write_text('a')
+  assert pipeline.run_stage('copy', {}, manifest) == 'restored'
+  assert output.read_text() == 'A'
+  assert len(runs) == 2
+
+  os.remove(output)
+  assert pipeline.run_stage('copy', {}, manifest) == 'restored'
+  assert pipeline.run_stage('copy', {}, manifest, force=True) == 'ran'
+
+def test_stage_code_is_complete():
+  # a stage has to be re-run when any module its code imports changes, so those have to be listed too
+  for stage in pipeline.STAGES.values():
+    for module in stage.code:
+      with open(pipeline.code_path(module), encoding='utf-8') as source:
+        tree = ast.parse(source.read())
+      imported = { alias.name for node in ast.walk(tree) if isinstance(node, ast.Import) for alias in node.names }
+      imported |= { node.module for node in ast.walk(tree) if isinstance(node, ast.ImportFrom) and node.module }
+      local = { f'{name}.py' for name in imported if os.path.exists(pipeline.code_path(f'{name}.py')) }
+      assert local <= set(stage.code), (stage.name, module, local - set(stage.code))
@@ -0,0 +1,61 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pandas as pd
+from typing import TYPE_CHECKING
+
+# data_parsing_script imports this module, so only import its classes for type checking
+if TYPE_CHECKING:
+    from data_parsing_script import Branch, Rule
+
+RULES_PARQUET_PATH = './data/rules.parquet'
+BRANCHES_PARQUET_PATH = './data/branches.parquet'
+
+# Most of the strings repeat a lot (every expanded rule repeats its text, branch and environment),
+# so store them dictionary-encoded
+dictionary_string = pa.dictionary(pa.int32(), pa.string())
+
+RULE_SCHEMA = pa.schema([
+    ('id', dictionary_string),
+    ('branch_id', dictionary_string),
+    ('branch_index', dictionary_string),
+    ('original_text', dictionary_string),
+    ('environment', dictionary_string),
+    ('from_sound', dictionary_string),
+    ('intermediate_steps', pa.list_(pa.string())),
+    ('to_sound', dictionary_string),
+])
+
+BRANCH_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('index', pa.string()),
+    ('name', pa.string()),
+    ('source', pa.string()),
+])
+
+def objects_to_table(objects: list, schema: pa.Schema) -> pa.Table:
+    """Build an Arrow table from the attributes of a list of objects."""
+    columns = { field.name: [getattr(obj, field.name, None) for obj in objects] for field in schema }
+    return pa.Table.from_pydict(columns, schema=schema)
+
+def write_rules(rules: 'list[Rule]', path: str = RULES_PARQUET_PATH) -> None:
+    """Write rules to a Parquet file."""
+    pq.write_table(objects_to_table(rules, RULE_SCHEMA), path)
+
+def write_branches(branches: 'list[Branch]', path: str = BRANCHES_PARQUET_PATH) -> None:
+    """Write branches to a Parquet file."""
+    pq.write_table(objects_to_table(branches, BRANCH_SCHEMA), path)
+
+def arrow_list_dtype(arrow_type: pa.DataType) -> pd.ArrowDtype | None:
+    """Keep list columns Arrow-backed, rather than making a NumPy array for every row."""
+    return pd.ArrowDtype(arrow_type) if pa.types.is_list(arrow_type) else None
+
+def read_rules(path: str = RULES_PARQUET_PATH, columns: list[str] | None = None) -> pd.DataFrame:
+    """Read rules into a DataFrame, one row per rule.
+
+    Dictionary-encoded columns come back as categoricals. Pass columns to only read the ones you need.
+    """
+    return pq.read_table(path, columns=columns).to_pandas(types_mapper=arrow_list_dtype)
+
+def read_branches(path: str = BRANCHES_PARQUET_PATH, columns: list[str] | None = None) -> pd.DataFrame:
+    """Read branches into a DataFrame, one row per branch."""
+    return pq.read_table(path, columns=columns).to_pandas()
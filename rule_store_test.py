@@ -0,0 +1,22 @@
+import data_parsing_script as dps
+import rule_store
+
+def test_rules_round_trip(tmp_path):
+  rules = dps.parse_sound_change('dʒ → tʃ → ʃ / _#', 'Proto-Omotic-dʒ', None, 'dʒ → tʃ → ʃ / _#')
+  path = str(tmp_path / 'rules.parquet')
+  rule_store.write_rules(rules, path)
+  rules_df = rule_store.read_rules(path)
+  assert list(rules_df.columns) == ['id', 'branch_id', 'branch_index', 'original_text', 'environment', 'from_sound', 'intermediate_steps', 'to_sound']
+  assert rules_df['from_sound'].dtype == 'category'
+  assert rules_df.loc[0, 'from_sound'] == 'dʒ'
+  assert list(rules_df.loc[0, 'intermediate_steps']) == ['tʃ']
+  assert rules_df.loc[0, 'environment'] == '_#'
+  assert rules_df['branch_id'].isna().all()
+
+def test_read_rules_columns(tmp_path):
+  rules = dps.parse_sound_change('{e,i} → a', 'rule', None, '{e,i} → a')
+  path = str(tmp_path / 'rules.parquet')
+  rule_store.write_rules(rules, path)
+  rules_df = rule_store.read_rules(path, columns=['from_sound', 'to_sound'])
+  assert sorted(rules_df['from_sound']) == ['e', 'i']
+  assert list(rules_df.columns) == ['from_sound', 'to_sound']
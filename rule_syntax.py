@@ -0,0 +1,220 @@
+import functools
+import itertools
+import re
+from typing import Iterator, NamedTuple
+
+import diagnostics
+
+# most versions of a string to make by leaving out its optionals (every SID rule fits in this)
+MAX_OPTIONAL_EXPANSIONS = 256
+
+# how many distinct sounds/environments to remember the bracket expansions of
+BRACKET_CACHE_SIZE = 4096
+
+# how many distinct rule strings/steps to remember the parses of
+RULE_CACHE_SIZE = 16384
+
+ENVIRONMENT_SEPARATOR = ' / '
+STEP_SEPARATOR = '→'
+LEADING_DASH = '— '
+
+BACKTICKED = re.compile(r'`.*?`')
+# If no environment, but rule ends with some text in parentheses or quotes, consider that the environment
+PARENTHETICAL_ENVIRONMENT = re.compile(r'(.+[^→]) (\(.+\)|“.+”)$')
+OPTIONAL = re.compile(r'(\(.*?\))')
+# Requires more than just .split(' ') because of cases like `[+ voice]`
+SOUND = re.compile(r'(?:\[.*?\]|\S)+')
+FEATURE = re.compile(r'\[.*?\]')
+
+class Optional(NamedTuple):
+    """A parenthesized optional part of a rule, e.g. '(ː)' in 'a(ː) → e(ː)'."""
+    start: int
+    end: int
+    text: str
+
+class Sound(NamedTuple):
+    """One sound in a step of a rule, e.g. 'V[- high]' or '{e,i}w'."""
+    text: str
+    features: tuple[str, ...] # square-bracketed feature specs, e.g. ('[- high]',)
+    alternatives: tuple[str, ...] # what the curly-bracketed alternations expand to, in the order they're written
+
+class RuleSteps(NamedTuple):
+    """The steps of a rule with no optionals or environment, e.g. 'dʒ → tʃ → ʃ'."""
+    text: str
+    steps: tuple[tuple[Sound, ...], ...] # each step's sounds, from the first step to the last
+
+class SoundChange(NamedTuple):
+    """A sound change string, split into its parts, e.g. 'a(ː) → e(ː) / _{ʕ,q}$'."""
+    body: str # a(ː) → e(ː)
+    environment: str # _{ʕ,q}$
+    optionals: tuple[Optional, ...] # optionals in the body
+
+    def variants(self, max_expansions: int | None = MAX_OPTIONAL_EXPANSIONS) -> Iterator[RuleSteps]:
+        """Lazily yield the parsed steps of each distinct version of the body with and without its optionals."""
+        for text in expand_optionals(self.body, max_expansions, self.optionals):
+            yield parse_steps(text)
+
+class Environment(NamedTuple):
+    """An environment string, e.g. '#(C)_{i,j}'."""
+    text: str
+    optionals: tuple[Optional, ...]
+
+    def expansions(self, max_expansions: int | None = MAX_OPTIONAL_EXPANSIONS) -> Iterator[str]:
+        """Lazily yield each distinct expansion of the environment's optionals and bracketed alternatives."""
+        seen: set[str] = set()
+        for text in expand_optionals(self.text, max_expansions, self.optionals):
+            for expanded in handle_brackets(text):
+                if expanded not in seen:
+                    seen.add(expanded)
+                    yield expanded
+
+def remove_combos(string: str, combos: tuple[tuple[int, int, str], ...]) -> str:
+    """Removes combos of optionals from a string."""
+    removed = string
+    for (start, end, optional) in combos:
+        removed = removed[:start] + ('�' * (end - start)) + removed[end:]
+
+    return removed.replace('�', '')
+
+def find_optionals(string: str) -> tuple[Optional, ...]:
+    """Find the parenthesized optionals in a string."""
+    return tuple(Optional(match.start(), match.end(), match.group(0)) for match in OPTIONAL.finditer(string))
+
+def expand_optionals(string: str, max_expansions: int | None = MAX_OPTIONAL_EXPANSIONS, optionals: tuple[Optional, ...] | None = None) -> Iterator[str]:
+    """Lazily yield each distinct version of a string with and without its parenthesized optionals.
+
+    A string with n optionals has 2^n combinations of them, so stop after trying max_expansions (None for no limit).
+    """
+    if optionals is None:
+        optionals = find_optionals(string)
+    if not optionals:
+        yield string
+        return
+
+    seen: set[str] = set()
+    combinations = itertools.chain.from_iterable(itertools.combinations(optionals, l) for l in range(len(optionals) + 1))
+    for (index, combo) in enumerate(combinations):
+        if max_expansions is not None and index >= max_expansions:
+            diagnostics.warn('capped_expansion', f'Warning: capped expansion of {len(optionals)} optionals at {max_expansions} for: {string}')
+            return
+
+        combo_string = remove_combos(string, combo)
+        combo_string = combo_string.replace('(','').replace(')','')
+        if combo_string not in seen:
+            seen.add(combo_string)
+            yield combo_string
+
+def split_sounds(sounds: str) -> list[str]:
+    """Split the sounds in a rule.
+
+    Requires more than just .split(' ') because of cases like `[+ voice]`.
+    """
+    return SOUND.findall(sounds)
+
+def balance_brackets(sound: str) -> str:
+    """Balance a sound's curly brackets.
+
+    split_sounds can cut a bracketed group in two, leaving fragments like '{a,o' or 'oː,uː}'.
+    Treat a stray closing bracket as closing a group opened at the start, and close any unclosed groups at the end.
+    """
+    depth = 0
+    unopened = 0
+    for character in sound:
+        if character == '{':
+            depth += 1
+        elif character == '}':
+            if depth:
+                depth -= 1
+            else:
+                unopened += 1
+
+    return ('{' * unopened) + sound + ('}' * depth)
+
+@functools.lru_cache(maxsize=BRACKET_CACHE_SIZE)
+def handle_brackets(sound: str) -> tuple[str, ...]:
+    """Handles bracketed sounds, e.g. '{e,i}w{e,i}' or '{e,w{æ,i}}'.
+
+    Goes over the sound once, multiplying the expansions so far by each group's alternatives as it closes.
+    The expansions come out deduplicated in the order they're written, so everything built from them is the same
+    from one run to the next.
+    Results are memoized; handle_brackets.cache_info() has the hit/miss stats.
+    """
+    if '{' not in sound and '}' not in sound:
+        return (sound,)
+
+    balanced = balance_brackets(sound)
+    # a fragment like '{,a,i' is what's left of a group split_sounds cut up, not one with an empty alternative
+    keep_empty = balanced == sound
+    sound = balanced
+
+    # each open group keeps the expansions from before it, and the alternatives it's finished so far
+    groups: list[tuple[list[str], list[str]]] = []
+    expansions: list[str] = ['']
+    literal_start = 0
+
+    for (index, character) in enumerate(sound):
+        if character not in '{,}' or (character == ',' and not groups):
+            continue
+
+        literal = sound[literal_start:index]
+        if literal:
+            expansions = [expansion + literal for expansion in expansions]
+        literal_start = index + 1
+
+        if character == '{':
+            groups.append((expansions, []))
+            expansions = ['']
+        elif character == ',':
+            groups[-1][1].extend(expansion for expansion in expansions if expansion or keep_empty)
+            expansions = ['']
+        else:
+            (before, alternatives) = groups.pop()
+            alternatives.extend(expansion for expansion in expansions if expansion or keep_empty)
+            if not alternatives:
+                alternatives.append('')
+            expansions = [prefix + alternative for prefix in before for alternative in alternatives]
+
+    literal = sound[literal_start:]
+    if literal:
+        expansions = [expansion + literal for expansion in expansions]
+
+    return tuple(dict.fromkeys(expansions))
+
+def parse_sound(sound: str) -> Sound:
+    """Parse one sound of a step."""
+    features = tuple(FEATURE.findall(sound)) if '[' in sound else ()
+    return Sound(sound, features, handle_brackets(sound))
+
+@functools.lru_cache(maxsize=RULE_CACHE_SIZE)
+def parse_steps(text: str) -> RuleSteps:
+    """Parse the steps of a rule, once its optionals and environment have been dealt with."""
+    if text.startswith(LEADING_DASH):
+        text = text[len(LEADING_DASH):]
+
+    steps = tuple(tuple(parse_sound(sound) for sound in SOUND.findall(step)) for step in text.split(STEP_SEPARATOR))
+    return RuleSteps(text, steps)
+
+@functools.lru_cache(maxsize=RULE_CACHE_SIZE)
+def parse_rule(rule_string: str) -> SoundChange:
+    """Parse a sound change string into its body, environment and optionals."""
+    # Ignore anything in backticks
+    rule_string = BACKTICKED.sub('', rule_string)
+
+    # Ignore "(?)"
+    rule_string = rule_string.replace('(?)', '')
+
+    # Split the rule up. This will inevitably include stuff I don't want but we can work out how to remove that stuff later
+    (body, separator, environment) = rule_string.partition(ENVIRONMENT_SEPARATOR)
+
+    if not separator:
+        parens_match = PARENTHETICAL_ENVIRONMENT.search(rule_string)
+        if parens_match:
+            body = parens_match.group(1)
+            environment = parens_match.group(2)
+
+    return SoundChange(body, environment, find_optionals(body))
+
+@functools.lru_cache(maxsize=RULE_CACHE_SIZE)
+def parse_environment(environment: str) -> Environment:
+    """Parse an environment string."""
+    return Environment(environment, find_optionals(environment))
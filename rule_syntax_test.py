@@ -0,0 +1,32 @@
+import rule_syntax as rs
+
+def test_parse_rule_environment():
+  sound_change = rs.parse_rule('a(ː) → e(ː) / _{ʕ,q}$')
+  assert sound_change.body == 'a(ː) → e(ː)'
+  assert sound_change.environment == '_{ʕ,q}$'
+  assert [optional.text for optional in sound_change.optionals] == ['(ː)', '(ː)']
+
+def test_parse_rule_parenthetical_environment():
+  sound_change = rs.parse_rule('d j → r ɭ (sporadic)')
+  assert sound_change.body == 'd j → r ɭ'
+  assert sound_change.environment == '(sporadic)'
+  assert sound_change.optionals == ()
+
+def test_parse_rule_ignored():
+  sound_change = rs.parse_rule('r → *L `(some sort of lateral?)` (?) / occasionally')
+  assert sound_change.body.strip() == 'r → *L'
+  assert sound_change.environment == 'occasionally'
+
+def test_parse_steps():
+  rule_steps = rs.parse_steps('— V[- high - long] {e,i} → ∅ → a')
+  assert rule_steps.text == 'V[- high - long] {e,i} → ∅ → a'
+  assert [[sound.text for sound in step] for step in rule_steps.steps] == [['V[- high - long]', '{e,i}'], ['∅'], ['a']]
+  assert rule_steps.steps[0][0].features == ('[- high - long]',)
+  assert rule_steps.steps[0][1].alternatives == ('e', 'i')
+
+def test_sound_change_variants():
+  variants = list(rs.parse_rule('ew (→ øj) → yj').variants())
+  assert [rule_steps.text for rule_steps in variants] == ['ew → øj → yj', 'ew  → yj']
+
+def test_environment_expansions():
+  assert sorted(rs.parse_environment('(b)_{l,d}').expansions()) == ['_d', '_l', 'b_d', 'b_l']
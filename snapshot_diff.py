@@ -0,0 +1,162 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, NamedTuple, Tuple
+
+from data_parsing_script import PARALLEL_CHUNK_SIZE, Branch, Rule, chunk_markup, hash_markup, iter_section_markup, parse_section
+
+SECTION_ID = re.compile(r'<section\b[^>]*?\bid="([^"]*)"')
+
+BRANCH_FIELDS = ['index', 'name', 'source']
+
+class BranchDiff(NamedTuple):
+    """How a branch changed between two snapshots. Rules are identified by their ids."""
+    branch_id: str
+    branch_index: str | None
+    status: str # 'added', 'removed', 'modified' or 'unparsable'
+    added: list[str]
+    removed: list[str]
+    modified: list[str]
+    changed_fields: list[str] # which of the branch's index, name and source changed
+    error: str = '' # why an unparsable section couldn't be parsed
+
+class SectionError(NamedTuple):
+    """A section the parser raised on. Older snapshots have rules the parser can't handle, which shouldn't stop the diff."""
+    message: str
+
+Parsed = Tuple[Branch, list[Rule]] | SectionError | None
+
+def fingerprint_sections(path: str) -> dict[str, Tuple[str, str]]:
+    """Hash the raw markup of each section of a snapshot, keyed by the section's id (or position, if it has none)."""
+    sections: dict[str, Tuple[str, str]] = {}
+    with open(path) as fp:
+        for (position, markup) in enumerate(iter_section_markup(fp)):
+            match = SECTION_ID.match(markup)
+            section_id = match[1] if match else f'#{position}'
+            # keep sections that share an id apart
+            section_id = next(candidate for candidate in itertools.chain([section_id], (f'{section_id}~{copy}' for copy in itertools.count(1))) if candidate not in sections)
+            sections[section_id] = (hash_markup(markup), markup)
+    return sections
+
+def rule_fingerprints(rules: Iterable[Rule]) -> dict[str, tuple]:
+    """Normalize each rule id's rules (one per expansion) into a tuple of what they say, in the order they're expanded.
+
+    That's the order the rule's text is written in, so it's the same in every process, whatever its hash seed.
+    """
+    fingerprints: dict[str, list[tuple]] = {}
+    for rule in rules:
+        fingerprints.setdefault(rule.id, []).append((rule.original_text, rule.from_sound, tuple(rule.intermediate_steps), rule.to_sound, rule.environment))
+    return { rule_id: tuple(fingerprint) for (rule_id, fingerprint) in fingerprints.items() }
+
+def diff_sections(section_id: str, old: Parsed, new: Parsed) -> BranchDiff | None:
+    """Compare the old and new parses of a section, None if they're the same (or neither has any rules)."""
+    for parsed in (old, new):
+        if isinstance(parsed, SectionError):
+            return BranchDiff(section_id, None, 'unparsable', [], [], [], [], parsed.message)
+    if not old and not new:
+        return None
+    (old_branch, old_rules) = old or (None, [])
+    (new_branch, new_rules) = new or (None, [])
+    branch = new_branch or old_branch
+
+    old_fingerprints = rule_fingerprints(old_rules)
+    new_fingerprints = rule_fingerprints(new_rules)
+    added = [rule_id for rule_id in new_fingerprints if rule_id not in old_fingerprints]
+    removed = [rule_id for rule_id in old_fingerprints if rule_id not in new_fingerprints]
+    modified = [rule_id for (rule_id, fingerprint) in new_fingerprints.items() if rule_id in old_fingerprints and old_fingerprints[rule_id] != fingerprint]
+
+    if not old_branch:
+        status = 'added'
+        changed_fields = []
+    elif not new_branch:
+        status = 'removed'
+        changed_fields = []
+    else:
+        status = 'modified'
+        changed_fields = [field for field in BRANCH_FIELDS if getattr(old_branch, field, None) != getattr(new_branch, field, None)]
+        if not (added or removed or modified or changed_fields):
+            # the markup changed, but not in a way that changes what was parsed from it
+            return None
+
+    return BranchDiff(branch.id, getattr(branch, 'index', None), status, added, removed, modified, changed_fields)
+
+def parse_markup_chunk(markups: list[str]) -> list[Parsed]:
+    """Parse a chunk of section markup, keeping going past sections the parser fails on. This is what each worker runs."""
+    from bs4 import BeautifulSoup
+
+    results: list[Parsed] = []
+    # the parser's warnings would drown out the diff
+    with contextlib.redirect_stdout(io.StringIO()):
+        for markup in markups:
+            try:
+                results.append(parse_section(BeautifulSoup(markup, 'html.parser').section))
+            except Exception as error:
+                results.append(SectionError(f'{type(error).__name__}: {error}'))
+    return results
+
+def parse_markups(markups: list[str], executor: Executor | None) -> Iterable[Parsed]:
+    if executor is None:
+        return parse_markup_chunk(markups)
+    return itertools.chain.from_iterable(executor.map(parse_markup_chunk, chunk_markup(iter(markups), PARALLEL_CHUNK_SIZE)))
+
+def diff_fingerprints(old_sections: dict[str, Tuple[str, str]], new_sections: dict[str, Tuple[str, str]], executor: Executor | None = None) -> list[BranchDiff]:
+    """Parse only the sections whose markup differs between the snapshots, and compare them."""
+    # in the new snapshot's order, followed by the sections that were removed
+    section_ids = list(new_sections) + [section_id for section_id in old_sections if section_id not in new_sections]
+    changed = [section_id for section_id in section_ids if old_sections.get(section_id, (None,))[0] != new_sections.get(section_id, (None,))[0]]
+
+    old_changed = [section_id for section_id in changed if section_id in old_sections]
+    new_changed = [section_id for section_id in changed if section_id in new_sections]
+    # both snapshots' sections are queued up before either's results are waited on, so they're parsed side by side
+    old_parsed = parse_markups([old_sections[section_id][1] for section_id in old_changed], executor)
+    new_parsed = parse_markups([new_sections[section_id][1] for section_id in new_changed], executor)
+    old_by_id = dict(zip(old_changed, old_parsed))
+    new_by_id = dict(zip(new_changed, new_parsed))
+
+    diffs = (diff_sections(section_id, old_by_id.get(section_id), new_by_id.get(section_id)) for section_id in changed)
+    return [diff for diff in diffs if diff]
+
+def diff_snapshots(old_path: str, new_path: str, workers: int | None = 2) -> list[BranchDiff]:
+    """Find the branches and rules that changed between two snapshots of the SID.
+
+    Both snapshots are fingerprinted, and then their changed sections parsed, in a process pool of workers (None for
+    one per core). With workers=1 everything runs in this process.
+    """
+    if workers == 1:
+        return diff_fingerprints(fingerprint_sections(old_path), fingerprint_sections(new_path))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        (old_sections, new_sections) = executor.map(fingerprint_sections, [old_path, new_path])
+        return diff_fingerprints(old_sections, new_sections, executor)
+
+def print_diff(diffs: list[BranchDiff]) -> None:
+    for diff in diffs:
+        if diff.error:
+            print(f'{diff.status:10} {diff.branch_id}: {diff.error}')
+            continue
+        counts = f'+{len(diff.added)} -{len(diff.removed)} ~{len(diff.modified)}'
+        fields = f' (changed {", ".join(diff.changed_fields)})' if diff.changed_fields else ''
+        print(f'{diff.status:10} {diff.branch_index or "":12} {diff.branch_id}: {counts}{fields}')
+        for (sign, rule_ids) in (('+', diff.added), ('-', diff.removed), ('~', diff.modified)):
+            for rule_id in rule_ids:
+                print(f'    {sign} {rule_id}')
+    print(f'{len(diffs)} branch(es) changed.')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='List the branches and rules that changed between two snapshots of the Searchable Index Diachronica.')
+    parser.add_argument('old_path', help='the earlier snapshot')
+    parser.add_argument('new_path', help='the later snapshot')
+    parser.add_argument('--workers', type=int, default=2, help='number of worker processes (0 for one per core)')
+    parser.add_argument('--output', help='also write the changes as JSON here')
+    args = parser.parse_args()
+
+    diffs = diff_snapshots(args.old_path, args.new_path, args.workers or None)
+    print_diff(diffs)
+
+    if args.output:
+        with open(args.output, 'w+') as output_file:
+            json.dump([diff._asdict() for diff in diffs], output_file, indent=4, ensure_ascii=False)
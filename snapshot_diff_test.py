@@ -0,0 +1,71 @@
+import pickle
+import snapshot_diff as sd
+from data_parsing_script_test import SAMPLE_SID
+
+EDITED_SID = (SAMPLE_SID
+  # a rule changed and one added
+  .replace('dʒ → tʃ → ʃ</p>', 'dʒ → tʃ → s</p>\n    <p class="schg" id="Proto-Omotic-k">k → q</p>')
+  # a branch renamed, and its rule removed
+  .replace('6.1.1 Proto-Omotic to North Omotic', '6.1.1 Proto-Omotic to North-Omotic')
+  .replace('<p class="schg" id="North-Omotic-a">a(ː) → e(ː) / _{ʕ,q}$</p>', '<p class="schg" id="North-Omotic-o">o → u</p>')
+  .replace('</body>', '''  <section class="showtarget" id="Greenlandic">
+    <h2>15.2 Greenlandic</h2>
+    <p class="schg" id="Greenlandic-m">m → p / _#</p>
+  </section>
+</body>'''))
+
+def write_snapshots(tmp_path, old: str, new: str) -> tuple[str, str]:
+  (old_path, new_path) = (tmp_path / 'old.html', tmp_path / 'new.html')
+  old_path.write_text(old)
+  new_path.write_text(new)
+  return (str(old_path), str(new_path))
+
+def test_unchanged(tmp_path):
+  (old_path, new_path) = write_snapshots(tmp_path, SAMPLE_SID, SAMPLE_SID.replace('\n  <section', '\n\n  <section'))
+  assert sd.diff_snapshots(old_path, new_path, workers=1) == []
+
+def test_changes(tmp_path, capsys):
+  (old_path, new_path) = write_snapshots(tmp_path, SAMPLE_SID, EDITED_SID)
+  diffs = sd.diff_snapshots(old_path, new_path, workers=1)
+  assert [(diff.branch_id, diff.status) for diff in diffs] == [('Proto-Omotic', 'modified'), ('North-Omotic', 'modified'), ('Greenlandic', 'added')]
+  (omotic, north_omotic, greenlandic) = diffs
+  assert (omotic.added, omotic.removed, omotic.modified, omotic.changed_fields) == (['Proto-Omotic-k'], [], ['Proto-Omotic-dʒ'], [])
+  assert (north_omotic.added, north_omotic.removed, north_omotic.changed_fields) == (['North-Omotic-o'], ['North-Omotic-a'], ['name'])
+  assert (greenlandic.branch_index, greenlandic.added) == ('15.2', ['Greenlandic-m'])
+
+  # and the other way round, in a process pool
+  reverse = sd.diff_snapshots(new_path, old_path, workers=2)
+  assert [(diff.branch_id, diff.status) for diff in reverse] == [('Proto-Omotic', 'modified'), ('North-Omotic', 'modified'), ('Greenlandic', 'removed')]
+  assert reverse[0].removed == ['Proto-Omotic-k']
+
+  sd.print_diff(diffs)
+  assert '3 branch(es) changed.' in capsys.readouterr().out
+
+def test_unparsable_section(tmp_path):
+  (old_path, new_path) = write_snapshots(tmp_path, SAMPLE_SID.replace('dʒ → tʃ → ʃ', 'p t → b'), SAMPLE_SID)
+  [diff] = sd.diff_snapshots(old_path, new_path, workers=1)
+  assert (diff.branch_id, diff.status) == ('Proto-Omotic', 'unparsable')
+  assert diff.error.startswith('IndexError')
+
+PARSE_SCRIPT = '''
+import pickle, sys
+import snapshot_diff as sd
+sections = sd.fingerprint_sections(sys.argv[1])
+sys.stdout.buffer.write(pickle.dumps(dict(zip(sections, sd.parse_markup_chunk([markup for (_, markup) in sections.values()])))))
+'''
+
+def parse_in_subprocess(path: str, hash_seed: str) -> dict:
+  import os
+  import subprocess
+  import sys
+  env = dict(os.environ, PYTHONHASHSEED=hash_seed)
+  output = subprocess.run([sys.executable, '-c', PARSE_SCRIPT, path], capture_output=True, check=True, env=env, cwd=os.path.dirname(os.path.abspath(sd.__file__))).stdout
+  return pickle.loads(output)
+
+def test_unchanged_across_hash_seeds(tmp_path):
+  # rules used to be expanded from their alternatives in hash order, so workers with different seeds disagreed
+  bracketed = SAMPLE_SID.replace('dʒ → tʃ → ʃ', '{p,t,k,s,x,q} → {f,θ,x,h,χ,ħ}')
+  (old_path, new_path) = write_snapshots(tmp_path, bracketed, bracketed.replace('\n    <p', '\n      <p'))
+  (old, new) = (parse_in_subprocess(old_path, '1'), parse_in_subprocess(new_path, '2'))
+  assert list(old) == list(new) == ['Proto-Omotic', 'North-Omotic']
+  assert [sd.diff_sections(section_id, old[section_id], new[section_id]) for section_id in old] == [None, None]
@@ -0,0 +1,249 @@
+import functools
+import itertools
+import re
+import pandas as pd
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+import rule_syntax
+from bounded_cache import BoundedCache
+from branch_tree import BranchTree
+
+# how many words to push through each compiled rule at once
+DEFAULT_BATCH_SIZE = 4096
+
+# how many branches to keep the compiled rules of
+BRANCH_CACHE_SIZE = 256
+
+NOTHING = '∅'
+BOUNDARY = '#'
+FOCUS = '_'
+# Rules with these need more than matching segments (features, syllables, notes...), so they can't be compiled
+UNSUPPORTED = set('[]*?…/$%!=,“”‘’〈〉<>→←:;&@.—+~{}()"') | { ' ' }
+# Environments like 'else' or 'initially' are prose, not segments
+PROSE = re.compile(r'[a-z]{3,}')
+
+class CompiledStep(NamedTuple):
+    """One rule, with all of its expansions applied simultaneously by a single regex."""
+    rule_id: str
+    pattern: re.Pattern
+    replacement: str | Callable[[re.Match], str]
+
+class CompiledBranch(NamedTuple):
+    """A branch's rules in order, and the ids of any that couldn't be compiled."""
+    branch_index: str
+    steps: tuple[CompiledStep, ...]
+    skipped: tuple[str, ...]
+
+class Alternative(NamedTuple):
+    """The regex for one from sound in its environments, and what to replace it with."""
+    pattern: str
+    template: str
+    length: int # how long the from sound is, so longer ones are tried first
+
+@functools.cache
+def default_categories() -> dict[str, str]:
+    """The segments each abbreviation (C, V, K...) stands for, worked out from the features in vowel_changes.u_to_ipa_ext.
+
+    Only single character segments are included, so every category is a character class.
+    """
+    from ipapy import UNICODE_TO_IPA
+    from vowel_changes import u_to_ipa_ext
+
+    def matches(abbreviation, char) -> bool:
+        if abbreviation.is_vowel:
+            features = [abbreviation.height, abbreviation.backness, abbreviation.roundness]
+        else:
+            features = [abbreviation.voicing, abbreviation.place, abbreviation.manner]
+        features += abbreviation.modifiers or []
+        return all(feature.startswith('any') or char.has_descriptor(feature) for feature in features)
+
+    categories = {}
+    for (unicode, abbreviation) in u_to_ipa_ext.items():
+        if len(unicode) != 1 or not unicode.isupper() or unicode in UNICODE_TO_IPA:
+            continue
+        categories[unicode] = ''.join(sorted(
+            candidate for (candidate, char) in UNICODE_TO_IPA.items()
+            if len(candidate) == 1 and char.is_vowel == abbreviation.is_vowel and char.is_consonant == abbreviation.is_consonant and matches(abbreviation, char)
+        ))
+    return categories
+
+def is_supported(text: str) -> bool:
+    return not (UNSUPPORTED.intersection(text) or PROSE.search(text))
+
+def segments_pattern(text: str, categories: dict[str, str], capture_prefix: str | None = None) -> tuple[str, list[str]] | None:
+    """The regex matching some segments, with abbreviations as character classes.
+
+    If capture_prefix is given, each abbreviation is captured, and the names of the groups are returned in order.
+    None if it has an abbreviation with no known members.
+    """
+    parts = []
+    captured = []
+    for character in text:
+        if character.isupper():
+            members = categories.get(character)
+            if not members:
+                return None
+            character_class = f'[{re.escape(members)}]'
+            if capture_prefix is not None:
+                name = f'{capture_prefix}c{len(captured)}'
+                captured.append(name)
+                character_class = f'(?P<{name}>{character_class})'
+            parts.append(character_class)
+        else:
+            parts.append(re.escape(character))
+    return (''.join(parts), captured)
+
+def environment_pattern(environment: str, from_pattern: str, categories: dict[str, str]) -> str | None:
+    """A zero-width regex for where the from sound can change, or None if the environment can't be compiled."""
+    if not environment.strip():
+        return ''
+
+    conditions = []
+    for expansion in rule_syntax.parse_environment(environment.strip()).expansions():
+        (before, focus, after) = expansion.partition(FOCUS)
+        if not focus or FOCUS in after:
+            return None
+
+        start = before.startswith(BOUNDARY)
+        end = after.endswith(BOUNDARY)
+        before = before[1:] if start else before
+        after = after[:-1] if end else after
+        if BOUNDARY in before or BOUNDARY in after:
+            return None
+
+        before_parts = segments_pattern(before, categories)
+        after_parts = segments_pattern(after, categories)
+        if before_parts is None or after_parts is None:
+            return None
+
+        condition = ''
+        if before_parts[0]:
+            condition += f'(?<={"^" if start else ""}{before_parts[0]})'
+        elif start:
+            condition += '^'
+        if after_parts[0] or end:
+            condition += f'(?={from_pattern}{after_parts[0]}{"$" if end else ""})'
+        if not condition:
+            # one of the expansions has no conditions, so neither does the rule
+            return ''
+        conditions.append(condition)
+
+    return f'(?:{"|".join(conditions)})'
+
+def compile_alternative(from_sound: str, to_sound: str, environment: str, categories: dict[str, str], prefix: str) -> Alternative | None:
+    """Compile one expansion of a rule, or None if it needs more than segment matching."""
+    if not (is_supported(from_sound) and is_supported(to_sound) and is_supported(environment.replace('(', '').replace(')', '').replace('{', '').replace('}', '').replace(',', ''))):
+        return None
+
+    from_sound = '' if from_sound == NOTHING else from_sound
+    to_sound = '' if to_sound == NOTHING else to_sound
+
+    plain = segments_pattern(from_sound, categories)
+    captured = segments_pattern(from_sound, categories, prefix)
+    environment_regex = environment_pattern(environment, plain[0], categories) if plain else None
+    if captured is None or environment_regex is None:
+        return None
+    if not from_sound and not environment_regex:
+        # an insertion needs somewhere to go
+        return None
+    (from_regex, group_names) = captured
+
+    # an abbreviation in the to sound is whatever the same abbreviation in the from sound matched
+    template = ''
+    used: dict[str, int] = {}
+    for character in to_sound:
+        if character.isupper():
+            occurrences = [index for (index, from_character) in enumerate(c for c in from_sound if c.isupper()) if from_character == character]
+            if used.get(character, 0) >= len(occurrences):
+                return None
+            template += f'\\g<{group_names[occurrences[used.get(character, 0)]]}>'
+            used[character] = used.get(character, 0) + 1
+        else:
+            template += character.replace('\\', '\\\\')
+
+    return Alternative(f'{environment_regex}{from_regex}', template, len(from_sound))
+
+def compile_step(rule_id: str, changes: Iterable[tuple[str, str, str]], categories: dict[str, str]) -> CompiledStep | None:
+    """Compile every expansion of a rule into one regex that applies them simultaneously, longest from sound first."""
+    alternatives = []
+    for (from_sound, to_sound, environment) in dict.fromkeys(changes):
+        alternative = compile_alternative(from_sound, to_sound, environment, categories, f'a{len(alternatives)}')
+        if alternative:
+            alternatives.append(alternative)
+    if not alternatives:
+        return None
+
+    alternatives.sort(key=lambda alternative: -alternative.length)
+    if len(alternatives) == 1:
+        return CompiledStep(rule_id, re.compile(alternatives[0].pattern, re.MULTILINE), alternatives[0].template)
+
+    pattern = '|'.join(f'(?P<r{index}>{alternative.pattern})' for (index, alternative) in enumerate(alternatives))
+    templates = { f'r{index}': alternative.template for (index, alternative) in enumerate(alternatives) }
+
+    def replace(match: re.Match) -> str:
+        return match.expand(templates[match.lastgroup])
+
+    return CompiledStep(rule_id, re.compile(pattern, re.MULTILINE), replace)
+
+class SoundChangeEngine:
+    """Applies the rules of a lineage of branches to batches of words.
+
+    Each branch's rules are compiled to regexes the first time they're needed and kept in a bounded cache. Words are
+    pushed through a batch at a time, as one newline separated string, so each rule is a single regex substitution.
+    """
+    rules: dict[str, list[tuple[str, str, str, str]]] # branch index -> (rule id, from, to, environment) in order
+    tree: BranchTree
+    cache: BoundedCache[str, CompiledBranch]
+
+    def __init__(self, rules_df: pd.DataFrame, categories: dict[str, str] | None = None, cache_size: int | None = BRANCH_CACHE_SIZE) -> None:
+        columns = rules_df[['branch_index', 'id', 'from_sound', 'to_sound', 'environment']].astype(object).fillna('')
+        self.rules = {}
+        for (branch_index, rule_id, from_sound, to_sound, environment) in columns.itertuples(index=False):
+            self.rules.setdefault(branch_index, []).append((rule_id, from_sound, to_sound, environment))
+        self.tree = BranchTree(self.rules)
+        self._categories = categories
+        self.cache = BoundedCache(cache_size)
+
+    @property
+    def categories(self) -> dict[str, str]:
+        if self._categories is None:
+            self._categories = default_categories()
+        return self._categories
+
+    def compile_branch(self, branch_index: str) -> CompiledBranch:
+        """Compile a branch's rules, in order. A rule's expansions share an id and are applied together."""
+        steps = []
+        skipped = []
+        for (rule_id, rows) in itertools.groupby(self.rules.get(branch_index, []), key=lambda row: row[0]):
+            step = compile_step(rule_id, [row[1:] for row in rows], self.categories)
+            if step:
+                steps.append(step)
+            else:
+                skipped.append(rule_id)
+        return CompiledBranch(branch_index, tuple(steps), tuple(skipped))
+
+    def compiled(self, branch_index: str) -> CompiledBranch:
+        return self.cache.lookup(branch_index, lambda: self.compile_branch(branch_index))
+
+    def lineage(self, branch_index: str) -> list[str]:
+        """The branches from the top of the tree down to this one, e.g. 6.1.1 -> 6, 6.1, 6.1.1."""
+        return list(reversed(self.tree.ancestors(branch_index))) + [branch_index]
+
+    def apply_batch(self, words: list[str], path: list[str]) -> list[str]:
+        """Apply every rule of each branch in path, in order, to some words. Deleted words come back empty."""
+        text = '\n'.join(words)
+        for branch_index in path:
+            for step in self.compiled(branch_index).steps:
+                text = step.pattern.sub(step.replacement, text)
+        return text.split('\n')
+
+    def evolve(self, words: Iterable[str], path: str | list[str], batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[str]:
+        """Stream words through a lineage path (or every branch down to a branch index), a batch at a time."""
+        if isinstance(path, str):
+            path = self.lineage(path)
+        words = iter(words)
+        while batch := [word.strip() for word in itertools.islice(words, batch_size)]:
+            yield from self.apply_batch(batch, path)
+
+    def cache_stats(self) -> dict[str, int | None]:
+        return self.cache.stats()
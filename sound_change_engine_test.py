@@ -0,0 +1,48 @@
+import pandas as pd
+from sound_change_engine import SoundChangeEngine
+
+CATEGORIES = { 'V': 'aeiou', 'C': 'ptkbdgmnsʃ' }
+
+def engine(rules: list[tuple[str, str, str, str, str]]) -> SoundChangeEngine:
+  rules_df = pd.DataFrame(rules, columns=['branch_index', 'id', 'from_sound', 'to_sound', 'environment'])
+  return SoundChangeEngine(rules_df, CATEGORIES)
+
+def test_environments():
+  sound_changes = engine([
+    ('6.1', 'voicing', 't', 'd', 'V_V'),
+    ('6.1', 'final', 'k', '∅', '_#'),
+    ('6.1', 'initial', 'p', 'f', '#_'),
+    ('6.1', 'prothesis', '∅', 'e', '#_s'),
+  ])
+  assert list(sound_changes.evolve(['atata', 'pak', 'tapa', 'sta', 'k'], '6.1')) == ['adada', 'fa', 'tapa', 'esta', '']
+
+def test_optionals_and_brackets():
+  sound_changes = engine([('6.1', 'raising', 'e', 'i', '_(C){a,o}')])
+  assert list(sound_changes.evolve(['ea', 'eto', 'eu', 'etu'], '6.1')) == ['ia', 'ito', 'eu', 'etu']
+
+def test_simultaneous_expansions():
+  # dz ʃ → ʒ s, as one rule: ʃ → s mustn't feed anything else in the same rule
+  sound_changes = engine([
+    ('6.1', 'dz-ʃ', 'dz', 'ʒ', ''),
+    ('6.1', 'dz-ʃ', 'ʃ', 's', ''),
+    ('6.1', 'dz-ʃ', 'd', 't', ''),
+  ])
+  assert list(sound_changes.evolve(['dzaʃd'], '6.1')) == ['ʒast']
+
+def test_category_in_to_sound():
+  sound_changes = engine([('6.1', 'palatalization', 'Ci', 'Cʲi', '')])
+  assert list(sound_changes.evolve(['kita', 'ai'], '6.1')) == ['kʲita', 'ai']
+
+def test_lineage():
+  sound_changes = engine([
+    ('6.1', 'a', 'a', 'e', ''),
+    ('6.1.1', 'e', 'e', 'i', ''),
+    ('6.2', 'a', 'a', 'o', ''),
+    ('6.1.1', 'notes', 'a', 'o', 'sporadically'),
+  ])
+  assert sound_changes.lineage('6.1.1') == ['6', '6.1', '6.1.1']
+  assert list(sound_changes.evolve(['ta', 'te'], '6.1.1', batch_size=1)) == ['ti', 'ti']
+  assert list(sound_changes.evolve(['ta'], ['6.2'])) == ['to']
+  assert sound_changes.compiled('6.1.1').skipped == ('notes',)
+  list(sound_changes.evolve(['ta'], '6.1.1'))
+  assert sound_changes.cache_stats()['misses'] == 4
@@ -0,0 +1,82 @@
+import argparse
+import random
+import re
+from typing import Iterator
+
+from data_parsing_script import SID_PATH, iter_section_markup
+
+HEADER_INDEX = re.compile(r'<h2>(\d+(?:\.\d+)*) ')
+ID_ATTRIBUTE = re.compile(r'id="([^"]*)"')
+
+# the first copy of the SID keeps its indices, later ones are moved under top-level branches from here
+COPY_INDEX_START = 100
+
+VOWELS = ['a', 'e', 'i', 'o', 'u', 'ə', 'ɛ', 'ɔ']
+CONSONANTS = ['p', 't', 'k', 'b', 'd', 'ɡ', 's', 'ʃ', 'm', 'n', 'l', 'r', 'q', 'ʔ']
+MODIFIERS = ['ː', 'ʰ', 'ʷ', 'ʲ', '̃']
+
+def copy_section(markup: str, copy: int) -> str:
+    """Make the markup of a section unique to one copy of the SID, by renaming its ids and moving its index."""
+    if copy == 0:
+        return markup
+    markup = ID_ATTRIBUTE.sub(lambda match: f'id="{match[1]}~{copy}"', markup)
+    return HEADER_INDEX.sub(lambda match: f'<h2>{COPY_INDEX_START + copy}.{match[1]} ', markup, count=1)
+
+def alternation(rng: random.Random, options: list[str], depth: int = 0) -> str:
+    """A curly-bracketed group of options, sometimes with another group nested in it."""
+    chosen = rng.sample(options, rng.randint(2, 3))
+    if depth < 1 and rng.random() < 0.3:
+        chosen[-1] = alternation(rng, options, depth + 1)
+    return '{' + ','.join(chosen) + '}'
+
+def worst_case_rule(rng: random.Random) -> str:
+    """A rule full of optionals and brackets, the most expensive thing to expand."""
+    from_sound = rng.choice(VOWELS) + ''.join(f'({modifier})' for modifier in rng.sample(MODIFIERS, 2))
+    to_sound = alternation(rng, VOWELS) + f'({rng.choice(MODIFIERS)})'
+    before = '#' + ''.join(f'({rng.choice(["C", "V", "N"])})' for _ in range(2)) + alternation(rng, CONSONANTS)
+    after = f'({rng.choice(CONSONANTS)})' + alternation(rng, CONSONANTS) + rng.choice(['', '#', '{#,V}'])
+    return f'{from_sound} → {to_sound} / {before}_{after}'
+
+def worst_case_section(rng: random.Random, number: int, rule_count: int = 20) -> str:
+    rules = '\n'.join(
+        f'    <p class="schg" id="Worst-Case-{number}-{rule}">{worst_case_rule(rng)}</p>'
+        for rule in range(rule_count)
+    )
+    return f'''<section class="showtarget" id="Worst-Case-{number}">
+    <h2>99.{number + 1} Worst case {number + 1}</h2>
+    <p>Generated</p>
+{rules}
+  </section>'''
+
+def iter_synthetic_sections(scale: int = 1, worst_cases: int = 0, path: str = SID_PATH, seed: int = 0) -> Iterator[str]:
+    """Yield the sections of the SID scale times over, followed by some generated worst case sections."""
+    with open(path) as fp:
+        sections = list(iter_section_markup(fp))
+    for copy in range(scale):
+        for markup in sections:
+            yield copy_section(markup, copy)
+
+    rng = random.Random(seed)
+    for number in range(worst_cases):
+        yield worst_case_section(rng, number)
+
+def generate_sid(scale: int = 1, worst_cases: int = 0, path: str = SID_PATH, seed: int = 0) -> str:
+    """An SID-shaped document scale times the size of the real one."""
+    return '<!DOCTYPE html>\n<html>\n<body>\n  ' + '\n  '.join(iter_synthetic_sections(scale, worst_cases, path, seed)) + '\n</body>\n</html>\n'
+
+def write_synthetic_sid(out_path: str, scale: int = 1, worst_cases: int = 0, path: str = SID_PATH, seed: int = 0) -> None:
+    with open(out_path, 'w+') as out_file:
+        out_file.write('<!DOCTYPE html>\n<html>\n<body>\n')
+        for markup in iter_synthetic_sections(scale, worst_cases, path, seed):
+            out_file.write(f'  {markup}\n')
+        out_file.write('</body>\n</html>\n')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate an SID-shaped document for benchmarking.')
+    parser.add_argument('out_path', help='where to write the document')
+    parser.add_argument('--scale', type=int, default=1, help='how many copies of the real SID to include')
+    parser.add_argument('--worst-cases', type=int, default=0, help='how many sections of rules full of optionals and brackets to add')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_synthetic_sid(args.out_path, args.scale, args.worst_cases, seed=args.seed)
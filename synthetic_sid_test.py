@@ -0,0 +1,23 @@
+import data_parsing_script as dps
+import synthetic_sid as ss
+from data_parsing_script_test import SAMPLE_SID
+
+def test_synthetic_sid_scales(tmp_path, capsys):
+  source_path = tmp_path / 'sid.html'
+  source_path.write_text(SAMPLE_SID)
+  out_path = tmp_path / 'synthetic.html'
+  ss.write_synthetic_sid(str(out_path), scale=3, worst_cases=2, path=str(source_path))
+
+  original = list(dps.iter_sid(str(source_path)))
+  synthetic = list(dps.iter_sid(str(out_path)))
+  assert len(synthetic) == 3 * len(original) + 2
+  assert [branch.index for (branch, _) in synthetic[:3]] == ['6.1', '6.1.1', '101.6.1']
+  assert synthetic[2][0].id == 'Proto-Omotic~1'
+  assert len({ rule.id for (_, rules) in synthetic[:-2] for rule in rules }) == 3 * len({ rule.id for (_, rules) in original for rule in rules })
+  # every worst case rule expands into several
+  assert all(len(rules) > 20 for (_, rules) in synthetic[-2:])
+
+def test_generate_sid_deterministic(tmp_path):
+  source_path = tmp_path / 'sid.html'
+  source_path.write_text(SAMPLE_SID)
+  assert ss.generate_sid(1, 3, str(source_path), seed=1) == ss.generate_sid(1, 3, str(source_path), seed=1)
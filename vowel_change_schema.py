@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+from typing import Any, Iterable
+
+# Feature values in order, so a change can be measured as a difference in position. Wildcards like 'anyh' aren't on the scale
+HEIGHTS = ['open', 'near-open', 'open-mid', 'mid', 'close-mid', 'near-close', 'close']
+BACKNESSES = ['front', 'near-front', 'central', 'near-back', 'back']
+ROUNDNESSES = ['unrounded', 'rounded']
+# short is just an empty string
+LENGTHS = ['extra-short', '', 'long']
+# front of the mouth to the back
+PLACES = ['bilabial', 'labio-dental', 'dental', 'alveolar', 'retroflex', 'palato-alveolar', 'alveolo-palatal', 'palatal', 'labio-velar', 'velar', 'uvular', 'pharyngeal', 'laryngeal', 'glottal']
+
+VOWEL_SCALES = {
+    'height': HEIGHTS,
+    'backness': BACKNESSES,
+    'roundness': ROUNDNESSES,
+    'length': LENGTHS,
+}
+
+CONSONANT_SCALES = {
+    'place': PLACES,
+}
+SCALES = { **VOWEL_SCALES, **CONSONANT_SCALES }
+
+# The same columns are used for the vowel and consonant change tables. In vowel changes, before and after are
+# consonants, and in consonant changes they can be either (with a before/after_class of 'vowel' or 'consonant')
+SEGMENT_COLUMNS = ['before', 'from_vowel', 'to_vowel', 'from_consonant', 'to_consonant', 'after']
+TEXT_COLUMNS = ['original_text', 'parent_index']
+MODIFIER_COLUMNS = ['before_modifiers', 'from_modifiers', 'to_modifiers', 'after_modifiers']
+ORDERED_COLUMNS = {
+    **{ f'{side}_{feature}': scale for side in ('before', 'from', 'to', 'after') for (feature, scale) in SCALES.items() if feature != 'length' },
+    'from_length': LENGTHS,
+    'to_length': LENGTHS,
+}
+UNORDERED_COLUMNS = [f'{side}_{feature}' for side in ('before', 'from', 'to', 'after') for feature in ('voicing', 'manner')] + ['before_class', 'after_class']
+
+def segment_text(segment: Any) -> str | None:
+    """The unicode of a segment (an IPAString or already a string), or None if it's missing."""
+    if segment is None or (isinstance(segment, float) and np.isnan(segment)) or len(segment) == 0:
+        return None
+    return str(segment)
+
+def segment_categorical(segments: pd.Series) -> pd.Categorical:
+    """Store segments as categories of their unicode, converting each distinct segment object once."""
+    (codes, uniques) = pd.factorize(segments)
+    texts = np.empty(len(uniques) + 1, dtype=object)
+    texts[:-1] = [segment_text(segment) for segment in uniques]
+    texts[-1] = None
+    return pd.Categorical(texts[codes])
+
+def ordered_categorical(values: pd.Series, scale: list[str]) -> pd.Categorical:
+    """Store feature values as ordered categories, with the scale's values first and anything off it (e.g. wildcards) after."""
+    observed = set(values.dropna().unique())
+    categories = [value for value in scale if value in observed] + sorted(observed - set(scale))
+    return pd.Categorical(values, categories=categories, ordered=True)
+
+def modifiers_categorical(modifiers: pd.Series) -> pd.Categorical:
+    """Store lists of modifiers as categories of sorted tuples."""
+    if isinstance(modifiers.dtype, pd.CategoricalDtype):
+        return modifiers.array
+    return pd.Categorical(modifiers.map(lambda mods: tuple(sorted(mods)) if isinstance(mods, Iterable) else None, na_action='ignore'))
+
+def to_categorical(vowel_changes_df: pd.DataFrame) -> pd.DataFrame:
+    """Convert a vowel changes table from IPAStrings and strings to categoricals.
+
+    Height, backness, roundness, length and place are ordered along their scales.
+    """
+    categorical_df = pd.DataFrame(index=vowel_changes_df.index)
+    for col in vowel_changes_df.columns:
+        values = vowel_changes_df[col]
+        if col in SEGMENT_COLUMNS:
+            categorical_df[col] = segment_categorical(values)
+        elif col in MODIFIER_COLUMNS:
+            categorical_df[col] = modifiers_categorical(values)
+        elif col in ORDERED_COLUMNS:
+            categorical_df[col] = ordered_categorical(values, ORDERED_COLUMNS[col])
+        elif col in UNORDERED_COLUMNS or col in TEXT_COLUMNS:
+            categorical_df[col] = values.astype('category')
+        else:
+            categorical_df[col] = values
+
+    return categorical_df
+
+def scale_ranks(values: pd.Series, scale: list[str]) -> np.ndarray:
+    """The position of each value on a scale, NaN if it's missing or off the scale."""
+    categorical = values.array if isinstance(values.dtype, pd.CategoricalDtype) else pd.Categorical(values)
+    positions = { value: position for (position, value) in enumerate(scale) }
+    # the extra NaN at the end is for missing values, which have the code -1
+    category_ranks = np.array([positions.get(category, np.nan) for category in categorical.categories] + [np.nan], dtype=float)
+    return category_ranks[categorical.codes]
+
+def feature_change(vowel_changes_df: pd.DataFrame, feature: str) -> pd.Series:
+    """How far a feature moves along its scale, e.g. +1 for mid to close-mid. NaN for deletions and wildcards."""
+    scale = SCALES[feature]
+    change = scale_ranks(vowel_changes_df[f'to_{feature}'], scale) - scale_ranks(vowel_changes_df[f'from_{feature}'], scale)
+    return pd.Series(change, index=vowel_changes_df.index, name=f'{feature}_change')
+
+def height_change(vowel_changes_df: pd.DataFrame) -> pd.Series:
+    return feature_change(vowel_changes_df, 'height')
+
+def backness_change(vowel_changes_df: pd.DataFrame) -> pd.Series:
+    return feature_change(vowel_changes_df, 'backness')
+
+def roundness_change(vowel_changes_df: pd.DataFrame) -> pd.Series:
+    return feature_change(vowel_changes_df, 'roundness')
+
+def length_change(vowel_changes_df: pd.DataFrame) -> pd.Series:
+    return feature_change(vowel_changes_df, 'length')
+
+def modifier_changes(vowel_changes_df: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
+    """The modifiers added and removed by each change, None for deletions.
+
+    Only works out the difference once for each distinct pair of from and to modifiers.
+    """
+    from_modifiers = modifiers_categorical(vowel_changes_df['from_modifiers'])
+    to_modifiers = modifiers_categorical(vowel_changes_df['to_modifiers'])
+    (pairs, inverse) = np.unique(np.stack([from_modifiers.codes, to_modifiers.codes], axis=1), axis=0, return_inverse=True)
+
+    added = np.empty(len(pairs), dtype=object)
+    removed = np.empty(len(pairs), dtype=object)
+    for (index, (from_code, to_code)) in enumerate(pairs):
+        if to_code < 0:
+            continue
+        from_set = set(from_modifiers.categories[from_code]) if from_code >= 0 else set()
+        to_set = set(to_modifiers.categories[to_code])
+        added[index] = tuple(sorted(to_set - from_set))
+        removed[index] = tuple(sorted(from_set - to_set))
+
+    inverse = inverse.reshape(-1)
+    return (
+        pd.Series(added[inverse], index=vowel_changes_df.index, name='added_modifiers'),
+        pd.Series(removed[inverse], index=vowel_changes_df.index, name='removed_modifiers'),
+    )
+
+def deletion(vowel_changes_df: pd.DataFrame, segment: str = 'vowel') -> pd.Series:
+    """Whether each change deletes the vowel (or consonant)."""
+    return vowel_changes_df[f'to_{segment}'].isna().rename('deletion')
+
+def feature_changed(consonant_changes_df: pd.DataFrame, feature: str) -> pd.Series:
+    """Whether a feature without a scale (e.g. voicing or manner) is different after the change. False for deletions."""
+    from_values = consonant_changes_df[f'from_{feature}'].astype(object)
+    to_values = consonant_changes_df[f'to_{feature}'].astype(object)
+    return (to_values.notna() & (from_values != to_values)).rename(f'{feature}_changed')
+
+def add_change_metrics(vowel_changes_df: pd.DataFrame) -> pd.DataFrame:
+    """Add the height, backness, roundness and length changes, the added and removed modifiers and whether it's a deletion."""
+    metrics_df = vowel_changes_df.copy()
+    for feature in VOWEL_SCALES:
+        metrics_df[f'{feature}_change'] = feature_change(vowel_changes_df, feature)
+    (metrics_df['added_modifiers'], metrics_df['removed_modifiers']) = modifier_changes(vowel_changes_df)
+    metrics_df['deletion'] = deletion(vowel_changes_df)
+    return metrics_df
+
+def add_consonant_change_metrics(consonant_changes_df: pd.DataFrame) -> pd.DataFrame:
+    """Add the place change, whether the voicing and manner changed, the added and removed modifiers and whether it's a deletion."""
+    metrics_df = consonant_changes_df.copy()
+    for feature in CONSONANT_SCALES:
+        metrics_df[f'{feature}_change'] = feature_change(consonant_changes_df, feature)
+    for feature in ('voicing', 'manner'):
+        metrics_df[f'{feature}_changed'] = feature_changed(consonant_changes_df, feature)
+    (metrics_df['added_modifiers'], metrics_df['removed_modifiers']) = modifier_changes(consonant_changes_df)
+    metrics_df['deletion'] = deletion(consonant_changes_df, 'consonant')
+    return metrics_df
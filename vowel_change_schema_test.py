@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import vowel_change_schema as vcs
+
+def sample_df() -> pd.DataFrame:
+  return pd.DataFrame({
+    'before': ['t', None, 'k', 't'],
+    'from_vowel': ['a', 'e', 'iː', 'a'],
+    'to_vowel': ['e', None, 'i', 'B'],
+    'after': [None, 'n', None, None],
+    'before_place': ['alveolar', None, 'velar', 'alveolar'],
+    'before_modifiers': [[], None, [], []],
+    'from_height': ['open', 'close-mid', 'close', 'open'],
+    'from_backness': ['front', 'front', 'front', 'front'],
+    'from_roundness': ['unrounded', 'unrounded', 'unrounded', 'unrounded'],
+    'from_modifiers': [[], [], [], []],
+    'from_length': ['', '', 'long', ''],
+    'to_height': ['close-mid', None, 'close', 'anyh'],
+    'to_backness': ['front', None, 'front', 'back'],
+    'to_roundness': ['unrounded', None, 'unrounded', 'anyr'],
+    'to_modifiers': [['nasalized'], None, [], []],
+    'to_length': ['', None, '', ''],
+  })
+
+def test_to_categorical():
+  categorical_df = vcs.to_categorical(sample_df())
+  assert isinstance(categorical_df['before'].dtype, pd.CategoricalDtype)
+  assert list(categorical_df['from_height'].cat.categories) == ['open', 'close-mid', 'close']
+  assert categorical_df['from_height'].cat.ordered
+  assert list(categorical_df['to_height'].cat.categories) == ['close-mid', 'close', 'anyh']
+  assert categorical_df['to_modifiers'][0] == ('nasalized',)
+  assert categorical_df['to_vowel'].isna().tolist() == [False, True, False, False]
+
+def test_change_metrics():
+  for df in (sample_df(), vcs.to_categorical(sample_df())):
+    metrics_df = vcs.add_change_metrics(df)
+    np.testing.assert_array_equal(metrics_df['height_change'], [4, np.nan, 0, np.nan])
+    np.testing.assert_array_equal(metrics_df['backness_change'], [0, np.nan, 0, 4])
+    np.testing.assert_array_equal(metrics_df['roundness_change'], [0, np.nan, 0, np.nan])
+    np.testing.assert_array_equal(metrics_df['length_change'], [0, np.nan, -1, 0])
+    assert metrics_df['added_modifiers'].tolist() == [('nasalized',), None, (), ()]
+    assert metrics_df['removed_modifiers'].tolist() == [(), None, (), ()]
+    assert metrics_df['deletion'].tolist() == [False, True, False, False]
+
+def test_consonant_change_metrics():
+  df = pd.DataFrame({
+    'before': ['a', None, 'n'],
+    'from_consonant': ['t', 'k', 's'],
+    'to_consonant': ['d', None, 'ʃ'],
+    'after': ['a', None, None],
+    'before_class': ['vowel', None, 'consonant'],
+    'before_height': ['open', None, None],
+    'from_voicing': ['voiceless', 'voiceless', 'voiceless'],
+    'from_place': ['alveolar', 'velar', 'alveolar'],
+    'from_manner': ['plosive', 'plosive', 'sibilant-fricative'],
+    'from_modifiers': [[], [], []],
+    'to_voicing': ['voiced', None, 'voiceless'],
+    'to_place': ['alveolar', None, 'palato-alveolar'],
+    'to_manner': ['plosive', None, 'sibilant-fricative'],
+    'to_modifiers': [[], None, []],
+  })
+  categorical_df = vcs.to_categorical(df)
+  assert categorical_df['from_consonant'].isna().tolist() == [False, False, False]
+  assert list(categorical_df['to_place'].cat.categories) == ['alveolar', 'palato-alveolar']
+  assert isinstance(categorical_df['before_class'].dtype, pd.CategoricalDtype)
+  for changes_df in (df, categorical_df):
+    metrics_df = vcs.add_consonant_change_metrics(changes_df)
+    np.testing.assert_array_equal(metrics_df['place_change'], [0, np.nan, 2])
+    assert metrics_df['voicing_changed'].tolist() == [True, False, False]
+    assert metrics_df['manner_changed'].tolist() == [False, False, False]
+    assert metrics_df['deletion'].tolist() == [False, True, False]
@@ -1,43 +1,66 @@
-import pandas as pd
-import numpy as np
-from gruut_ipa.phonemes import Pronunciation, Phone
-# Using my own fork, which adds some additional descriptors
-from ipapy import UNICODE_TO_IPA
-from ipapy.ipachar import IPAConsonant, IPAVowel, IPAChar, IPASuprasegmental, IPADiacritic
-from ipapy.ipastring import IPAString
+from __future__ import annotations
+import functools
+import json
+import os
 import unicodedata as ud
 import re
-import itertools
-from data_parsing_script import Branch, Rule, remove_combos, handle_brackets
+from data_parsing_script import Branch, Rule
+import rule_syntax
+import diagnostics
+from bounded_cache import BoundedCache
+from rule_syntax import MAX_OPTIONAL_EXPANSIONS
 import pickle
-from typing import cast
-
-# add abbreviations from https://chridd.nfshost.com/diachronica/all#Abbreviations to UNICODE_TO_IPA
-u_to_ipa_ext: dict[str, IPAChar] = UNICODE_TO_IPA.copy()
-u_to_ipa_ext[u'A'] = IPAConsonant(name='affricate', voicing=u'anyv', place=u'anyp', manner=u'sibilant-affricate', unicode_repr=u'A')
-u_to_ipa_ext[u'B'] = IPAVowel(name='back vowel', height=u'anyh', backness=u'back', roundness=u'anyr', unicode_repr=u'B')
-u_to_ipa_ext[u'C'] = IPAConsonant(name='consonant', voicing=u'anyv', place=u'anyp', manner=u'anym', unicode_repr=u'C')
-u_to_ipa_ext[u'D'] = IPAConsonant(name='voiced plosive', voicing=u'voiced', place=u'anyp', manner=u'plosive', unicode_repr=u'D')
-u_to_ipa_ext[u'E'] = IPAVowel(name='front vowel', height=u'anyh', backness=u'front', roundness=u'anyr', unicode_repr=u'E')
-u_to_ipa_ext[u'F'] = IPAConsonant(name='fricative', voicing=u'anyv', place=u'anyp', manner=u'sibilant-fricative', unicode_repr=u'F')
-u_to_ipa_ext[u'H'] = IPAConsonant(name='laryngeal', voicing=u'anyv', place=u'laryngeal', manner=u'anym', unicode_repr=u'H')
-u_to_ipa_ext[u'J'] = IPAConsonant(name='approximant', voicing=u'anyv', place=u'anyp', manner=u'approximant', unicode_repr=u'J')
-u_to_ipa_ext[u'K'] = IPAConsonant(name='velar', voicing=u'anyv', place=u'velar', manner=u'anym', unicode_repr=u'K')
-u_to_ipa_ext[u'Ḱ'] = IPAConsonant(name='palatal', voicing=u'anyv', place=u'palatal', manner=u'anym', unicode_repr=u'Ḱ')
-u_to_ipa_ext[u'L'] = IPAConsonant(name='liquid', voicing=u'anyv', place=u'anyp', manner=u'liquid', unicode_repr=u'L')
-u_to_ipa_ext[u'M'] = IPAVowel(name='diphthong', height=u'anyh', backness=u'anyb', roundness=u'anyr', modifiers=[u'diphthong'], unicode_repr=u'M')
-u_to_ipa_ext[u'N'] = IPAConsonant(name='nasal', voicing=u'anyv', place=u'anyp', manner=u'nasal', unicode_repr=u'N')
-u_to_ipa_ext[u'O'] = IPAConsonant(name='obstruent', voicing=u'anyv', place=u'anyp', manner=u'obstruent', unicode_repr=u'O')
-u_to_ipa_ext[u'P'] = IPAConsonant(name='labial/bilabial', voicing=u'anyv', place=u'bilabial', manner=u'anym', unicode_repr=u'O')
-u_to_ipa_ext[u'Q'] = IPAConsonant(name='uvular (click in Khoisan)', voicing=u'anyv', place=u'uvular', manner=u'anym', unicode_repr=u'Q')
-u_to_ipa_ext[u'R'] = IPAConsonant(name='resonant/sonorant', voicing=u'anyv', place=u'anyp', manner=u'sonorant', unicode_repr=u'R')
-u_to_ipa_ext[u'S'] = IPAConsonant(name='plosive', voicing=u'anyv', place=u'anyp', manner=u'plosive', unicode_repr=u'S')
-u_to_ipa_ext[u'V'] = IPAVowel(name='vowel', height=u'anyh', backness=u'anyb', roundness=u'anyr', unicode_repr=u'V')
-u_to_ipa_ext[u'W'] = IPAConsonant(name='semivowel/glide', voicing=u'anyv', place=u'anyp', manner=u'glide', unicode_repr=u'W')
-u_to_ipa_ext[u'Z'] = IPAConsonant(name='continuant', voicing=u'anyv', place=u'anyp', manner=u'continuant', unicode_repr=u'Z')
+import itertools
+import argparse
+from typing import TYPE_CHECKING, Any, Callable, Iterator, cast
+
+# pandas, numpy, gruut and ipapy take most of a second to import, so they're only imported where they're used
+if TYPE_CHECKING:
+  import numpy as np
+  import pandas as pd
+  from gruut_ipa.phonemes import Pronunciation, Phone
+  from ipapy.ipachar import IPAConsonant, IPAVowel, IPAChar, IPASuprasegmental, IPADiacritic
+  from ipapy.ipastring import IPAString
+
+# abbreviations from https://chridd.nfshost.com/diachronica/all#Abbreviations, with the features of each
+ABBREVIATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'abbreviations.json')
+
+@functools.cache
+def load_abbreviations(path: str = ABBREVIATIONS_PATH) -> dict[str, dict]:
+  """Load the abbreviation table, e.g. 'N' -> { kind: consonant, name: nasal, manner: nasal, ... }"""
+  with open(path, encoding='utf-8') as abbreviations_file:
+    return json.load(abbreviations_file)
+
+@functools.cache
+def get_u_to_ipa_ext() -> dict[str, IPAChar]:
+  """UNICODE_TO_IPA with the abbreviations added, built the first time it's needed"""
+  # Using my own fork, which adds some additional descriptors
+  from ipapy import UNICODE_TO_IPA
+  from ipapy.ipachar import IPAConsonant, IPAVowel
+
+  u_to_ipa_ext: dict[str, IPAChar] = UNICODE_TO_IPA.copy()
+  for (unicode, abbreviation) in load_abbreviations().items():
+    fields = dict(abbreviation)
+    kind = fields.pop('kind')
+    u_to_ipa_ext[unicode] = IPAVowel(**fields) if kind == 'vowel' else IPAConsonant(**fields)
+  return u_to_ipa_ext
+
+def __getattr__(name: str):
+  # so vowel_changes.u_to_ipa_ext still works, without building it on import
+  if name == 'u_to_ipa_ext':
+    return get_u_to_ipa_ext()
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+# The same sounds and environments come up thousands of times across the rules, so cache the gruut/ipapy work on them
+IPA_CACHE_SIZE = 8192
+segmentation_cache: BoundedCache[str, Pronunciation] = BoundedCache(IPA_CACHE_SIZE)
+ipastring_cache: BoundedCache[tuple[str, tuple[str, ...]], IPAString | None] = BoundedCache(IPA_CACHE_SIZE)
+# (environment, allow_vowels) to the distinct (before, after) contexts of its expansions
+environment_cache: BoundedCache[tuple[str, bool], list[tuple[IPAString | None, IPAString | None]]] = BoundedCache(IPA_CACHE_SIZE)
 
 def replace_abbreviations(sound: str, vowels_only: bool = False) -> tuple[str, list[str]]:
   """Replaces abbreviations in a sound with indices to be replaced back and handled later"""
+  u_to_ipa_ext = get_u_to_ipa_ext()
   replaced = []
   # maybe handle brackets later
   for char in sound:
@@ -48,9 +71,11 @@ def replace_abbreviations(sound: str, vowels_only: bool = False) -> tuple[str, l
         
   return (sound, replaced)
 
-def phone_to_ipastring(phone: Phone, replacements: list[str] = []) -> IPAString | None:
+def text_to_ipastring(text: str, replacements: tuple[str, ...] = ()) -> IPAString | None:
+  from ipapy.ipastring import IPAString
+  u_to_ipa_ext = get_u_to_ipa_ext()
   ipachars: list[IPAChar] = []
-  norm_text = ud.normalize('NFD',phone.text)
+  norm_text = ud.normalize('NFD', text)
   for char in norm_text:
     if char.isdecimal():
       ipachars.append(u_to_ipa_ext[replacements[int(char)]])
@@ -60,62 +85,122 @@ def phone_to_ipastring(phone: Phone, replacements: list[str] = []) -> IPAString
     return None
   return IPAString(ipachars)
 
-def extract_from_sound(sound: str) -> tuple[IPAString | None, IPAString | None, IPAString | None] | None:
+def phone_to_ipastring(phone: Phone, replacements: list[str] = []) -> IPAString | None:
+  """Get a phone as an IPAString, only building it once per distinct phone and set of abbreviation replacements"""
+  key = (phone.text, tuple(replacements))
+  return ipastring_cache.lookup(key, lambda: text_to_ipastring(*key))
+
+def segment(text: str) -> Pronunciation:
+  """Split a string into phones, only asking gruut once per distinct string
+
+  Abbreviations have already been replaced by indices, so e.g. the environments 'C_#' and 'K_#' share a segmentation.
+  """
+  def segment_uncached() -> Pronunciation:
+    from gruut_ipa.phonemes import Pronunciation
+    with diagnostics.stage('ipa_segmentation'):
+      return Pronunciation.from_string(text)
+  return segmentation_cache.lookup(text, segment_uncached)
+
+def ipa_cache_stats() -> dict[str, dict[str, int | None]]:
+  """Get the hit/miss/eviction counters of the segmentation, IPAString and environment caches"""
+  return { 'segmentation': segmentation_cache.stats(), 'ipastring': ipastring_cache.stats(), 'environment': environment_cache.stats() }
+
+def clear_ipa_caches() -> None:
+  segmentation_cache.clear()
+  ipastring_cache.clear()
+  environment_cache.clear()
+
+def join_segments(segment: IPAString | None, diacritic: IPAString | None) -> IPAString | None:
+  """Join a segment and the diacritic after it, or None if either couldn't be converted (e.g. the ? in _?ʲ)"""
+  if segment == None or diacritic == None:
+    return None
+  return segment + diacritic
+
+def sound_phones(sound: str) -> tuple[list[Phone], list[str]]:
+  """Segment a sound into phones, with vowel abbreviations replaced by indices into the returned replacements"""
   sound = re.sub(pattern=r'\[.+?\]', repl='', string=sound)
   (abbev_parsed_sound, replacements) = replace_abbreviations(sound, True)
-  pron = Pronunciation.from_string(abbev_parsed_sound)
+  return (segment(abbev_parsed_sound).phones, replacements)
+
+def is_deletion(sound: str) -> bool:
+  """Whether a rule's to sound deletes what it changes from, i.e. is ∅ or nothing at all"""
+  return sound.strip() in ('', '∅')
+
+def is_vowel_phone(phone: Phone) -> bool:
+  # vowel abbreviations have been replaced by their index (maybe followed by a superscript, like V³), but a subscript
+  # digit on its own, like the ₂ in h₂e, isn't a vowel
+  return phone.is_vowel or phone.text[:1].isdecimal()
+
+def vowel_in(phones: list[Phone], replacements: list[str]) -> tuple[IPAString | None, IPAString | None, IPAString | None] | None:
+  """Find the vowel of a segmented sound and the segments either side of it, or None if there's more than one vowel"""
   before = None
   vowel = None
   after = None
-  for index, phone in enumerate(pron.phones):
+  for index, phone in enumerate(phones):
+    # unlike is_vowel_phone, subscript digits count here too, as they always have: the ₂ in h₂e comes before the vowel
+    # and isn't a segment, so it's passed over, while the one in eh₂ makes a second "vowel" and the sound is skipped
     if phone.is_vowel or phone.text.isnumeric():
       if vowel != None:
         # multiple vowels, bail!!
         return None
       
       if index > 0:
-        ipastring: IPAString | None = phone_to_ipastring(pron.phones[index - 1], replacements)
+        ipastring: IPAString | None = phone_to_ipastring(phones[index - 1], replacements)
         chars: list[IPAChar] | None = ipastring.ipa_chars if ipastring != None else None
         if index > 1 and chars != None and chars[0].is_diacritic:
-          before = phone_to_ipastring(pron.phones[index - 2], replacements) + phone_to_ipastring(pron.phones[index - 1], replacements)
+          before = join_segments(phone_to_ipastring(phones[index - 2], replacements), ipastring)
+          if before == None:
+            return None
         else:
-          before = phone_to_ipastring(pron.phones[index - 1], replacements)
+          before = phone_to_ipastring(phones[index - 1], replacements)
 
-      if index < (len(pron.phones) - 1):
-        ipastring: IPAString | None = phone_to_ipastring(pron.phones[index + 2], replacements) if (index < (len(pron.phones) - 2)) else None
+      if index < (len(phones) - 1):
+        ipastring: IPAString | None = phone_to_ipastring(phones[index + 2], replacements) if (index < (len(phones) - 2)) else None
         chars: list[IPAChar] | None = ipastring.ipa_chars if ipastring != None else None
         if chars != None and chars[0].is_diacritic:
-          after = phone_to_ipastring(pron.phones[index + 1], replacements) + phone_to_ipastring(pron.phones[index + 2], replacements)
+          after = join_segments(phone_to_ipastring(phones[index + 1], replacements), ipastring)
+          if after == None:
+            return None
         else:
-          after = phone_to_ipastring(pron.phones[index + 1], replacements)
+          after = phone_to_ipastring(phones[index + 1], replacements)
       
       vowel = phone_to_ipastring(phone, replacements)
 
   return (before, vowel, after)
 
-def parse_environment(environment: str) -> list[str]:
-  environments: list[str] = []
-  
-  optionals = [(match.start(), match.end(), match.group(0)) for match in re.finditer(r'(\(.*?\))', environment)]
-  if optionals:
-    combinations = list(itertools.chain.from_iterable(itertools.combinations(optionals, l) for l in range(len(optionals) + 1)))
-    for combo in combinations:
-      combo_string = environment
-      # print(combo)
-      combo_string = remove_combos(combo_string, combo)
-      combo_string = combo_string.replace('(','').replace(')','')
-      # print(combo_string)
-      environments += handle_brackets(combo_string)
-  else:
-    # print(environment)
-    environments += handle_brackets(environment)
-  
-  return environments
+def consonant_in(phones: list[Phone], replacements: list[str]) -> tuple[None, IPAString | None, None] | None:
+  """Get a segmented sound as a single consonant (along with any diacritics), or None if it has a vowel or several consonants
+
+  Returned in the same (before, segment, after) shape as vowel_in, with nothing either side.
+  """
+  if any(is_vowel_phone(phone) for phone in phones):
+    return None
+  ipastrings = [ipastring for ipastring in (phone_to_ipastring(phone, replacements) for phone in phones) if ipastring]
+  if sum(1 for ipastring in ipastrings if not ipastring.ipa_chars[0].is_diacritic) > 1:
+    # a cluster, bail!!
+    return None
+  if not ipastrings:
+    return (None, None, None)
+  consonant = ipastrings[0]
+  for ipastring in ipastrings[1:]:
+    consonant = consonant + ipastring
+  return (None, consonant, None)
+
+def extract_from_sound(sound: str) -> tuple[IPAString | None, IPAString | None, IPAString | None] | None:
+  return vowel_in(*sound_phones(sound))
 
-def extract_from_environment(environment: str) -> tuple[IPAString | None, IPAString | None] | None:
+def iter_environments(environment: str, max_expansions: int | None = MAX_OPTIONAL_EXPANSIONS) -> Iterator[str]:
+  """Lazily yield each distinct expansion of an environment's optionals and bracketed alternatives"""
+  return rule_syntax.parse_environment(environment).expansions(max_expansions)
+
+def parse_environment(environment: str, max_expansions: int | None = MAX_OPTIONAL_EXPANSIONS) -> list[str]:
+  return list(iter_environments(environment, max_expansions))
+
+def extract_from_environment(environment: str, allow_vowels: bool = False) -> tuple[IPAString | None, IPAString | None] | None:
+  """Get the segments either side of the _ in an environment. Unless allow_vowels, environments next to a vowel are ignored"""
   environment = re.sub(r'/\[.+?\]', '', environment)
   (abbev_parsed_environment, replacements) = replace_abbreviations(environment)
-  pron = Pronunciation.from_string(abbev_parsed_environment)
+  pron = segment(abbev_parsed_environment)
   before = None
   after = None
   found = False
@@ -126,24 +211,28 @@ def extract_from_environment(environment: str) -> tuple[IPAString | None, IPAStr
         return None
       
       if index > 0:
-        if pron.phones[index - 1].is_vowel:
+        if pron.phones[index - 1].is_vowel and not allow_vowels:
           return None # ignore environments where before/after a vowel
         
         ipastring: IPAString | None = phone_to_ipastring(pron.phones[index - 1], replacements)
         chars: list[IPAChar] | None = ipastring.ipa_chars if ipastring != None else None
         if index > 1 and chars != None and chars[0].is_diacritic:
-          before = phone_to_ipastring(pron.phones[index - 2], replacements) + phone_to_ipastring(pron.phones[index - 1], replacements)
+          before = join_segments(phone_to_ipastring(pron.phones[index - 2], replacements), ipastring)
+          if before == None:
+            return None # drop contexts that can't be converted
         else:
           before = phone_to_ipastring(pron.phones[index - 1], replacements)
 
       if index < (len(pron.phones) - 1):
-        if pron.phones[index + 1].is_vowel:
+        if pron.phones[index + 1].is_vowel and not allow_vowels:
           return None # ignore environments where before/after a vowel
         
         ipastring: IPAString | None = phone_to_ipastring(pron.phones[index + 2], replacements) if (index < (len(pron.phones) - 2)) else None
         chars: list[IPAChar] | None = ipastring.ipa_chars if ipastring != None else None
         if chars != None and chars[0].is_diacritic:
-          after = phone_to_ipastring(pron.phones[index + 1], replacements) + phone_to_ipastring(pron.phones[index + 2], replacements)
+          after = join_segments(phone_to_ipastring(pron.phones[index + 1], replacements), ipastring)
+          if after == None:
+            return None # drop contexts that can't be converted
         else:
           after = phone_to_ipastring(pron.phones[index + 1], replacements)
       
@@ -151,115 +240,283 @@ def extract_from_environment(environment: str) -> tuple[IPAString | None, IPAStr
   
   return (before, after)
 
+def context_key(segments: tuple[IPAString | None, ...]) -> tuple:
+  """A hashable key for a tuple of segments, so contexts and changes can be compared by value"""
+  return tuple(segment_key(segment) for segment in segments)
+
+def resolve_environment(environment: str, allow_vowels: bool = False) -> list[tuple[IPAString | None, IPAString | None]]:
+  """Get the distinct (before, after) contexts across every expansion of an environment
+
+  Environments like _#, #_, V_V and _(C)# recur across thousands of rules, so each is only expanded and segmented once.
+  """
+  def resolve_uncached() -> list[tuple[IPAString | None, IPAString | None]]:
+    contexts: dict[tuple, tuple[IPAString | None, IPAString | None]] = {}
+    for parsed_env in iter_environments(environment):
+      env_extract = extract_from_environment(parsed_env, allow_vowels)
+      if env_extract:
+        contexts.setdefault(context_key(env_extract), env_extract)
+    return list(contexts.values())
+
+  return environment_cache.lookup((environment, allow_vowels), resolve_uncached)
+
+CONSONANT_FEATURES = ['voicing', 'place', 'manner', 'modifiers']
+VOWEL_FEATURES = ['height', 'backness', 'roundness', 'modifiers', 'length']
+CONTEXT_FEATURES = ['class', 'voicing', 'place', 'manner', 'height', 'backness', 'roundness', 'modifiers']
+
+VOWEL_CHANGES_PATH = './data/vowel_changes.pkl'
+CONSONANT_CHANGES_PATH = './data/consonant_changes.pkl'
+
+# how many distinct sound changes each worker extracts at a time
+EXTRACTION_CHUNK_SIZE = 256
+
 def get_parent_branch_index(branch_index: str):
-  return '.'.join(branch_index.split('.')[:-1])
+  from branch_tree import parent_index
+  return parent_index(branch_index)
+
+def context_changes(before: IPAString | None, from_segment: IPAString, to_segment: IPAString | None, after: IPAString | None, environment: str, allow_vowels: bool = False) -> list[tuple[IPAString | None, IPAString, IPAString | None, IPAString | None]] | None:
+  """Fill in whichever of the segments before and after the changing one the sound itself didn't have, from each expansion of the environment"""
+  if (before != None) and (after != None):
+    return [(before, from_segment, to_segment, after)]
+
+  # contexts that only differ on the side the sound already fills in end up the same, so dedupe again
+  changes: dict[tuple, tuple[IPAString | None, IPAString, IPAString | None, IPAString | None]] = {}
+  for (env_before, env_after) in resolve_environment(environment, allow_vowels):
+    if before:
+      env_before = before
+    if after:
+      env_after = after
+    changes.setdefault(context_key((env_before, env_after)), (env_before, from_segment, to_segment, env_after))
+  if len(changes) == 0:
+    return None
+  return list(changes.values())
+
+def classify_changes(from_sound: str, to_sound: str, environment: str) -> tuple[str, list[tuple[IPAString | None, IPAString, IPAString | None, IPAString | None]]] | None:
+  """Work out whether a rule changes a single vowel or a single consonant, and extract its (before, from, to, after) changes
+
+  Returns ('vowel' or 'consonant', changes), or None for any other kind of rule. The from sound is only segmented once for both.
+  Anything vowel_in finds a vowel in is a vowel change, exactly as extract_sound_changes has always worked, and anything
+  without a vowel is a consonant change.
+  Vowel changes only keep consonant environments, while consonant changes keep vowel environments too (e.g. intervocalic voicing).
+  A consonant change only has no to segment when its to sound is ∅ (or empty).
+  """
+  (phones, replacements) = sound_phones(from_sound)
+
+  from_tuple = vowel_in(phones, replacements)
+  if from_tuple != None and from_tuple[1] != None:
+    (kind, find_segment, allow_vowels) = ('vowel', vowel_in, False)
+  elif not any(is_vowel_phone(phone) for phone in phones):
+    (kind, find_segment, allow_vowels) = ('consonant', consonant_in, True)
+    from_tuple = consonant_in(phones, replacements)
+  else:
+    return None
 
-def extract_vowel_changes(from_sound: str, to_sound: str, environment: str, original_text: str, branch_index: str) -> list[tuple[IPAString | None, IPAString, IPAString | None, IPAString | None, str, str]] | None:
-  from_tuple = extract_from_sound(from_sound)
   if from_tuple == None:
     return None
-  before, from_vowel, after = from_tuple
-  if from_vowel == None:
+  before, from_segment, after = from_tuple
+  if from_segment == None:
     return None
 
-  to_tuple = extract_from_sound(to_sound)
+  to_tuple = find_segment(*sound_phones(to_sound))
   if to_tuple == None:
     return None
-  _, to_vowel, _ = to_tuple
+  _, to_segment, _ = to_tuple
+  if to_segment == None and kind == 'consonant' and not is_deletion(to_sound):
+    # nothing that could be segmented, like [+ voice], an abbreviation like T or a ?, isn't the consonant being deleted
+    return None
 
-  if (before == None) or (after == None):
-    changes = []
-    for parsed_env in parse_environment(environment):
-      env_extract = extract_from_environment(parsed_env)
-      if env_extract:
-        env_before, env_after = env_extract
-        if before:
-          env_before = before
-        if after:
-          env_after = after
-        change_tup = (env_before, from_vowel, to_vowel, env_after, original_text)
-        if not any(str(change) == str(change_tup) for change in changes):
-          changes.append((env_before, from_vowel, to_vowel, env_after, original_text, get_parent_branch_index(branch_index)))
-    if len(changes) == 0:
-      return None
-    return changes
-  else:
-    return [(before, from_vowel, to_vowel, after, original_text, get_parent_branch_index(branch_index))]
+  changes = context_changes(before, from_segment, to_segment, after, environment, allow_vowels)
+  if changes == None:
+    return None
+  return (kind, changes)
+
+def extract_sound_changes(from_sound: str, to_sound: str, environment: str) -> list[tuple[IPAString | None, IPAString, IPAString | None, IPAString | None]] | None:
+  """Extract the (before, from vowel, to vowel, after) changes of a rule, which only depend on its sounds and environment"""
+  classified = classify_changes(from_sound, to_sound, environment)
+  if classified == None or classified[0] != 'vowel':
+    return None
+  return classified[1]
+
+def extract_vowel_changes(from_sound: str, to_sound: str, environment: str, original_text: str, branch_index: str) -> list[tuple[IPAString | None, IPAString, IPAString | None, IPAString | None, str, str]] | None:
+  changes = extract_sound_changes(from_sound, to_sound, environment)
+  if changes == None:
+    return None
+  parent_index = get_parent_branch_index(branch_index)
+  return [change + (original_text, parent_index) for change in changes]
+
+def extract_sound_changes_chunk(keys: list[tuple[str, str, str]], extract: Callable[[str, str, str], Any] = extract_sound_changes) -> list:
+  """Extract the changes for a chunk of (from sound, to sound, environment) keys. This is what each worker runs"""
+  return [extract(*key) for key in keys]
+
+def extract_unique_changes(keys: list[tuple[str, str, str]], workers: int | None = 1, chunk_size: int = EXTRACTION_CHUNK_SIZE, extract: Callable[[str, str, str], Any] = extract_sound_changes) -> dict[tuple[str, str, str], Any]:
+  """Extract the changes for each distinct key, across a process pool if workers isn't 1 (None for one per core)
+
+  extract is extract_sound_changes for just the vowel changes, or classify_changes for every kind.
+  """
+  if workers == 1:
+    return { key: extract(*key) for key in keys }
+
+  from concurrent.futures import ProcessPoolExecutor
+  chunks = [keys[start:start + chunk_size] for start in range(0, len(keys), chunk_size)]
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    results = itertools.chain.from_iterable(executor.map(functools.partial(extract_sound_changes_chunk, extract=extract), chunks))
+    return dict(zip(keys, results))
 
 def get_cons_feats(row, col: str) -> tuple[str | None, str | None, str | None, list[str] | None]:
+  return consonant_features(row[col])
+
+def consonant_features(consonant: IPAString | None) -> tuple[str | None, str | None, str | None, list[str] | None]:
   voicing: str = ''
   place: str = ''
   manner: str = ''
   modifiers: list[str] = []
 
-  consonant: IPAString = row[col]
-
   if not consonant:
     return (None, None, None, None)
 
   chars: list[IPAChar] = consonant.ipa_chars
   for char in chars:
     if char.is_consonant:
-      voicing = cast(IPAConsonant, char).voicing
-      place = cast(IPAConsonant, char).place
-      manner = cast(IPAConsonant, char).manner
-      modifiers += cast(IPAConsonant, char).modifiers
+      voicing = cast('IPAConsonant', char).voicing
+      place = cast('IPAConsonant', char).place
+      manner = cast('IPAConsonant', char).manner
+      modifiers += cast('IPAConsonant', char).modifiers
     elif char.is_diacritic:
-      modifiers += [desc for desc in cast(IPADiacritic, char).descriptors if desc != 'diacritic']
+      modifiers += [desc for desc in cast('IPADiacritic', char).descriptors if desc != 'diacritic']
   
   return (voicing, place, manner, modifiers)
 
 
 def get_vowel_feats(row, col: str) -> tuple[str | None, str | None, str | None, list[str] | None, str | None]:
+  return vowel_features(row[col])
+
+def vowel_features(vowel: IPAString | None) -> tuple[str | None, str | None, str | None, list[str] | None, str | None]:
   height: str = ''
   backness: str = ''
   roundness: str = ''
   modifiers: list[str] = []
   length: str = ''
 
-  vowel: IPAString = row[col]
-
   if not vowel:
     return (None, None, None, None, None)
 
   chars: list[IPAChar] = vowel.ipa_chars
   for char in chars:
     if char.is_vowel:
-      height = cast(IPAVowel, char).height
-      backness = cast(IPAVowel, char).backness
-      roundness = cast(IPAVowel, char).roundness
-      modifiers += cast(IPAVowel, char).modifiers
+      height = cast('IPAVowel', char).height
+      backness = cast('IPAVowel', char).backness
+      roundness = cast('IPAVowel', char).roundness
+      modifiers += cast('IPAVowel', char).modifiers
     elif char.is_diacritic:
-      modifiers += [desc for desc in cast(IPADiacritic, char).descriptors if desc != 'diacritic']
+      modifiers += [desc for desc in cast('IPADiacritic', char).descriptors if desc != 'diacritic']
     elif char.is_suprasegmental:
-      length = cast(IPASuprasegmental, char).length or ''
+      length = cast('IPASuprasegmental', char).length or ''
   
   return (height, backness, roundness, modifiers, length)
 
-def run_extraction():
-  rules: list[Rule] = pd.read_pickle('./data/rules.pkl')
-  rules_df = pd.DataFrame.from_records([vars(rule) for rule in rules])
+def context_features(segment: IPAString | None) -> tuple[str | None, ...]:
+  """The features of a segment next to a consonant change, which can be a vowel or a consonant. Features of the other kind are None"""
+  if not segment:
+    return (None,) * len(CONTEXT_FEATURES)
+  if any(char.is_vowel for char in segment.ipa_chars):
+    (height, backness, roundness, modifiers, _) = vowel_features(segment)
+    return ('vowel', None, None, None, height, backness, roundness, modifiers)
+  (voicing, place, manner, modifiers) = consonant_features(segment)
+  return ('consonant', voicing, place, manner, None, None, None, modifiers)
+
+def segment_key(segment: IPAString | None) -> tuple[tuple[str, str], ...] | None:
+  """A hashable key for a segment, the same for any segments made of the same characters"""
+  if not segment:
+    return None
+  # The name as well as the unicode, since some abbreviations share their unicode_repr
+  return tuple((char.unicode_repr, char.name) for char in segment.ipa_chars)
+
+def build_feature_table(segments: pd.Series, get_features: Callable[[IPAString | None], tuple], features: list[str]) -> tuple[np.ndarray, pd.DataFrame]:
+  """Work out the features of each distinct segment once.
+
+  Returns each segment's row in the table, along with the table, whose last row is the features of a missing segment.
+  """
+  import numpy as np
+  import pandas as pd
+  codes, uniques = pd.factorize(segments.map(segment_key))
+  present = codes >= 0
+  _, first_indices = np.unique(codes[present], return_index=True)
+  distinct_segments = segments.to_numpy()[present][first_indices]
+
+  table = pd.DataFrame([get_features(segment) for segment in distinct_segments] + [get_features(None)], columns=features, dtype=object)
+  return (np.where(present, codes, len(uniques)), table)
 
-  extract_vowel_changes_vec = np.vectorize(extract_vowel_changes)
+def add_feature_columns(df: pd.DataFrame, col: str, prefix: str, get_features: Callable[[IPAString | None], tuple], features: list[str]) -> None:
+  """Add a {prefix}_{feature} column for each feature of the segments in col, looking each distinct segment up in a feature table"""
+  import pandas as pd
+  (codes, table) = build_feature_table(df[col], get_features, features)
+  for feature in features:
+    # as an object Series, so newer pandas keeps missing features as None rather than inferring a string column of NaN
+    df[f'{prefix}_{feature}'] = pd.Series(table[feature].to_numpy()[codes], index=df.index, dtype=object)
+
+def changes_table(changes: list[tuple], segment: str, get_context_features: Callable[[IPAString | None], tuple], context_feature_names: list[str], get_segment_features: Callable[[IPAString | None], tuple], segment_feature_names: list[str]) -> pd.DataFrame:
+  """Make a table of (before, from, to, after, original text, parent index) changes, with a column for each feature of each segment"""
+  import pandas as pd
+  from vowel_change_schema import to_categorical
+
+  changes_df = pd.DataFrame(changes, columns=['before', f'from_{segment}', f'to_{segment}', 'after', 'original_text', 'parent_index'])
+
+  # There are only a few hundred distinct segments, so look their features up
+  with diagnostics.stage('feature_expansion'):
+    add_feature_columns(changes_df, 'before', 'before', get_context_features, context_feature_names)
+    add_feature_columns(changes_df, f'from_{segment}', 'from', get_segment_features, segment_feature_names)
+    add_feature_columns(changes_df, f'to_{segment}', 'to', get_segment_features, segment_feature_names)
+    add_feature_columns(changes_df, 'after', 'after', get_context_features, context_feature_names)
+
+  # Store the segments and features as categoricals, which are far smaller and quicker to group by
+  return to_categorical(changes_df)
+
+def run_extraction(workers: int | None = 1):
+  from rule_store import read_rules
+
+  rules_df = read_rules(columns=['branch_index', 'original_text', 'environment', 'from_sound', 'to_sound'])
 
   unduped = rules_df.drop_duplicates(['from_sound', 'to_sound', 'environment', 'branch_index'], ignore_index=True)
 
-  extracted = extract_vowel_changes_vec(unduped['from_sound'], unduped['to_sound'], unduped['environment'], unduped['original_text'], unduped['branch_index'])
-  extracted = extracted[extracted != None]
-  extracted_flat = [item for sublist in extracted for item in sublist]
-  extracted_df = pd.DataFrame(extracted_flat, columns=['before', 'from_vowel', 'to_vowel', 'after', 'original_text', 'parent_index'])
+  # Lots of branches share the same sound change, so only classify and extract each (from, to, environment) once
+  keys = list(zip(unduped['from_sound'], unduped['to_sound'], unduped['environment']))
+  unique_changes = extract_unique_changes(list(dict.fromkeys(keys)), workers, extract=classify_changes)
 
-  # Add columns for individual features of vowels
-  extracted_df[['before_voicing', 'before_place', 'before_manner', 'before_modifiers']] = extracted_df.apply(get_cons_feats, axis=1, result_type='expand', col='before')
-  extracted_df[['from_height', 'from_backness', 'from_roundness', 'from_modifiers', 'from_length']] = extracted_df.apply(get_vowel_feats, axis=1, result_type='expand', col='from_vowel')
-  extracted_df[['to_height', 'to_backness', 'to_roundness', 'to_modifiers', 'to_length']] = extracted_df.apply(get_vowel_feats, axis=1, result_type='expand', col='to_vowel')
-  extracted_df[['after_voicing', 'after_place', 'after_manner', 'after_modifiers']] = extracted_df.apply(get_cons_feats, axis=1, result_type='expand', col='after')
-  
-  print(extracted_df.describe())
+  extracted_flat: dict[str, list[tuple]] = { 'vowel': [], 'consonant': [] }
+  for (key, original_text, branch_index) in zip(keys, unduped['original_text'], unduped['branch_index']):
+    classified = unique_changes[key]
+    if classified:
+      (kind, changes) = classified
+      parent_index = get_parent_branch_index(branch_index)
+      extracted_flat[kind] += [change + (original_text, parent_index) for change in changes]
+
+  # Vowel changes only have consonants either side, but consonant changes can have either
+  vowel_changes_df = changes_table(extracted_flat['vowel'], 'vowel', consonant_features, CONSONANT_FEATURES, vowel_features, VOWEL_FEATURES)
+  consonant_changes_df = changes_table(extracted_flat['consonant'], 'consonant', context_features, CONTEXT_FEATURES, consonant_features, CONSONANT_FEATURES)
+
+  diagnostics.count('unique_changes', len(unique_changes))
+  diagnostics.count('vowel_changes', len(vowel_changes_df))
+  diagnostics.count('consonant_changes', len(consonant_changes_df))
+  print(f'Extracted {len(vowel_changes_df)} vowel changes and {len(consonant_changes_df)} consonant changes from {len(rules_df)} rules ({len(unique_changes)} distinct changes).')
+  if workers == 1:
+    # each worker has its own caches, so these are only this process's
+    diagnostics.count('environment_cache_hits', environment_cache.hits)
+    diagnostics.count('environment_cache_misses', environment_cache.misses)
+    print(f'Resolved {environment_cache.misses} distinct environments for {environment_cache.hits + environment_cache.misses} lookups.')
 
-  with open('./data/vowel_changes.pkl', 'wb+') as vowel_changes_file:
-    pickle.dump(extracted_df, vowel_changes_file)
+  with open(VOWEL_CHANGES_PATH, 'wb+') as vowel_changes_file:
+    pickle.dump(vowel_changes_df, vowel_changes_file)
+
+  with open(CONSONANT_CHANGES_PATH, 'wb+') as consonant_changes_file:
+    pickle.dump(consonant_changes_df, consonant_changes_file)
 
 # So I can both run this individually AND import functions into my notebook
 if __name__ == '__main__':
-  run_extraction()
\ No newline at end of file
+  parser = argparse.ArgumentParser(description='Extract vowel and consonant changes from the parsed rules.')
+  parser.add_argument('--workers', type=int, default=1, help='number of worker processes (0 for one per core)')
+  diagnostics.add_arguments(parser)
+  args = parser.parse_args()
+
+  diagnostics.enable_from_arguments(parser, args)
+  run_extraction(workers=args.workers or None)
+  if args.report:
+    diagnostics.write_report(args.report)
\ No newline at end of file
@@ -53,6 +53,9 @@ def parse_environment_one_optional():
 def test_parse_environment_mult_optionals():
   assert vc.parse_environment('(b)_(l)d#') == unordered(['_d#', '_ld#', 'b_d#', 'b_ld#'])
 
+def test_parse_environment_duplicate_optionals():
+  assert vc.parse_environment('(C)(C)_') == unordered(['CC_', 'C_', '_'])
+
 def test_parse_environment_bracketed():
   assert vc.parse_environment('_{l,d}#') == unordered(['_l#', '_d#'])
 
@@ -63,55 +66,145 @@ def test_parse_environment_nested_bracketed():
   assert vc.parse_environment('_{{l,f},d}#') == unordered(['_l#', '_f#', '_d#'])
 
 def test_extract_change_no_vowels():
-  assert vc.extract_vowel_changes('ts', 's', '', '') == None
+  assert vc.extract_sound_changes('ts', 's', '') == None
 
 def test_extract_change_multi_vowels():
-  assert vc.extract_vowel_changes('baːde', 'bode', '', '') == None
+  assert vc.extract_sound_changes('baːde', 'bode', '') == None
 
 def test_extract_change_vowel_environment():
-  assert vc.extract_vowel_changes('a', 'o', '_u', '') == None
+  assert vc.extract_sound_changes('a', 'o', '_u') == None
 
 def test_extract_change_no_env():
-  phone_tuples = vc.extract_vowel_changes('baːd', 'bod', '', '')
+  phone_tuples = vc.extract_sound_changes('baːd', 'bod', '')
   assert phone_tuples != None
   assert [phones_to_strs(phone_tup) for phone_tup in phone_tuples] == unordered([['b', 'aː', 'o', 'd']])
 
 def test_extract_change_no_to_vowel():
-  phone_tuples = vc.extract_vowel_changes('baːd', 'bd', '', '')
+  phone_tuples = vc.extract_sound_changes('baːd', 'bd', '')
   assert phone_tuples != None
   assert [phones_to_strs(phone_tup) for phone_tup in phone_tuples] == unordered([['b', 'aː', None, 'd']])
 
 def test_extract_change_env_before():
-  phone_tuples = vc.extract_vowel_changes('aːd', 'od', 'f_', '')
+  phone_tuples = vc.extract_sound_changes('aːd', 'od', 'f_')
   assert phone_tuples != None
   assert [phones_to_strs(phone_tup) for phone_tup in phone_tuples] == unordered([['f', 'aː', 'o', 'd']])
 
 def test_extract_change_env_after():
-  phone_tuples = vc.extract_vowel_changes('daː', 'do', '_f', '')
+  phone_tuples = vc.extract_sound_changes('daː', 'do', '_f')
   assert phone_tuples != None
   assert [phones_to_strs(phone_tup) for phone_tup in phone_tuples] == unordered([['d', 'aː', 'o', 'f']])
 
 def test_extract_change_mult_env():
-  phone_tuples = vc.extract_vowel_changes('aː', 'o', '_{w,v}', '')
+  phone_tuples = vc.extract_sound_changes('aː', 'o', '_{w,v}')
   assert phone_tuples != None
   assert [phones_to_strs(phone_tup) for phone_tup in phone_tuples] == unordered([[None, 'aː', 'o', 'w'], [None, 'aː', 'o', 'v']])
 
 def test_extract_change_sq_bracket_sound():
-  phone_tuples = vc.extract_vowel_changes('B', 'E', '', '')
+  phone_tuples = vc.extract_sound_changes('B', 'E', '')
   assert phone_tuples != None
   assert [phones_to_strs(phone_tup) for phone_tup in phone_tuples] == unordered([[None, 'B', 'E', None]])
 
 def test_extract_change_sq_bracket_env():
-  phone_tuples = vc.extract_vowel_changes('a', 'i', '#C_', '')
+  phone_tuples = vc.extract_sound_changes('a', 'i', '#C_')
   assert phone_tuples != None
   assert [phones_to_strs(phone_tup) for phone_tup in phone_tuples] == unordered([['C', 'a', 'i', None]])
 
 def test_extract_change_lots_of_optionals():
-  phone_tuples = vc.extract_vowel_changes('aː', 'oː', '#(C)(C)(C)_(C)(C)(C)', '')
+  phone_tuples = vc.extract_sound_changes('aː', 'oː', '#(C)(C)(C)_(C)(C)(C)')
   assert phone_tuples != None
   assert [phones_to_strs(phone_tup) for phone_tup in phone_tuples] == unordered([['C', 'aː', 'oː', 'C'], [None, 'aː', 'oː', 'C'], ['C', 'aː', 'oː', None], [None, 'aː', 'oː', None]])
 
 def test_extract_change_ejective():
-  phone_tuples = vc.extract_vowel_changes('ə', 'a', 'kʼ_', '')
+  phone_tuples = vc.extract_sound_changes('ə', 'a', 'kʼ_')
   assert phone_tuples != None
   assert [phones_to_strs(phone_tup) for phone_tup in phone_tuples] == unordered([['kʼ', 'ə', 'a', None]])
+
+def test_segmentation_cached():
+  vc.clear_ipa_caches()
+  # vowel abbreviations are replaced with indices before segmenting
+  vc.extract_from_sound('dB')
+  vc.extract_from_sound('dE')
+  stats = vc.ipa_cache_stats()
+  assert stats['segmentation']['misses'] == 1
+  assert stats['segmentation']['hits'] == 1
+
+def test_environment_resolved_once():
+  vc.clear_ipa_caches()
+  first = vc.extract_sound_changes('a', 'e', '_(C)#')
+  second = vc.extract_sound_changes('o', 'u', '_(C)#')
+  assert [phones_to_strs(phone_tup)[3] for phone_tup in first] == [phones_to_strs(phone_tup)[3] for phone_tup in second]
+  stats = vc.ipa_cache_stats()['environment']
+  assert (stats['misses'], stats['hits']) == (1, 1)
+
+def test_environment_contexts_deduped():
+  # every expansion with a C before the _ has the same context
+  contexts = vc.resolve_environment('#(C)(C)_')
+  assert [phones_to_strs(context) for context in contexts] == unordered([['C', None], [None, None]])
+  # the sound's own before replaces each expansion's
+  phone_tuples = vc.extract_sound_changes('da', 'de', '#(C)(C)_')
+  assert [phones_to_strs(phone_tup) for phone_tup in phone_tuples] == [['d', 'a', 'e', None]]
+
+def test_extract_unique_changes_parallel():
+  keys = [('aː', 'o', '_{w,v}'), ('ə', 'a', 'kʼ_'), ('d', 't', '_#')]
+  serial = vc.extract_unique_changes(keys)
+  parallel = vc.extract_unique_changes(keys, workers=2, chunk_size=1)
+  assert list(parallel) == keys
+  assert parallel[('d', 't', '_#')] == None
+  for key in keys[:2]:
+    assert [phones_to_strs(phone_tup) for phone_tup in parallel[key]] == [phones_to_strs(phone_tup) for phone_tup in serial[key]]
+
+def test_add_feature_columns():
+  import pandas as pd
+  df = pd.DataFrame({ 'before': [IPAString(unicode_string='t'), None, IPAString(unicode_string='t'), IPAString(unicode_string='kʼ')] })
+  vc.add_feature_columns(df, 'before', 'before', vc.consonant_features, vc.CONSONANT_FEATURES)
+  for (index, consonant) in enumerate(df['before']):
+    assert tuple(df.loc[index, ['before_voicing', 'before_place', 'before_manner', 'before_modifiers']]) == vc.consonant_features(consonant)
+
+def test_abbreviation_table():
+  abbreviations = vc.load_abbreviations()
+  assert abbreviations['N'] == { 'kind': 'consonant', 'name': 'nasal', 'voicing': 'anyv', 'place': 'anyp', 'manner': 'nasal', 'unicode_repr': 'N' }
+  assert isinstance(vc.u_to_ipa_ext['V'], IPAVowel)
+  assert vc.u_to_ipa_ext['M'].modifiers == ['diphthong']
+  assert isinstance(vc.u_to_ipa_ext['K'], IPAConsonant) and vc.u_to_ipa_ext['K'].place == 'velar'
+  assert vc.u_to_ipa_ext['a'].is_vowel
+
+def test_classify_vowel_change():
+  (kind, changes) = vc.classify_changes('aː', 'o', '_{w,v}')
+  assert kind == 'vowel'
+  assert [phones_to_strs(change) for change in changes] == [phones_to_strs(change) for change in vc.extract_sound_changes('aː', 'o', '_{w,v}')]
+
+def test_classify_consonant_change():
+  (kind, changes) = vc.classify_changes('t', 'd', 'V_V')
+  assert kind == 'consonant'
+  assert [phones_to_strs(change) for change in changes] == [['V', 't', 'd', 'V']]
+  assert vc.extract_sound_changes('t', 'd', 'V_V') == None
+
+def test_classify_consonant_deletion():
+  (kind, changes) = vc.classify_changes('t', '∅', '_#')
+  assert kind == 'consonant'
+  assert [phones_to_strs(change) for change in changes] == [[None, 't', None, None]]
+
+def test_classify_feature_change():
+  # the to sound only has features, which isn't a deletion
+  assert vc.classify_changes('S', '[+ voice]', '{V,R}_V') == None
+  assert vc.classify_changes('D', 'T', '#_') == None
+
+def test_classify_cluster():
+  assert vc.classify_changes('st', 's', '_#') == None
+
+def test_classify_unconvertible_environment():
+  # the ? in _?ʲ can't be converted, so there's nothing to join the ʲ to
+  assert vc.classify_changes('Aʲ[+alveolar]', 'A', '_?ʲ') == None
+  assert vc.extract_vowel_changes('a', 'e', '_?ʲ', '', '6.1') == None
+
+def test_classify_laryngeal():
+  # subscript digits aren't vowels
+  (kind, changes) = vc.classify_changes('h₂e', 'ə', '_#')
+  assert kind == 'vowel'
+  assert [phones_to_strs(change) for change in changes] == [phones_to_strs(change) for change in vc.extract_sound_changes('h₂e', 'ə', '_#')]
+  assert [phones_to_strs(change)[1:3] for change in changes] == [['e', 'ə']]
+
+def test_context_features():
+  assert vc.context_features(IPAString(unicode_string='a'))[0] == 'vowel'
+  assert vc.context_features(IPAString(unicode_string='t'))[:4] == ('consonant', 'voiceless', 'alveolar', 'plosive')
+  assert vc.context_features(None) == (None,) * len(vc.CONTEXT_FEATURES)